@@ -1,5 +1,6 @@
 import os
 import sys
+import json
 import argparse
 import subprocess
 from getpass import getpass
@@ -10,6 +11,7 @@ from seeq.spy._errors import *
 # noinspection PyProtectedMember
 from seeq.spy import _url
 from ._copy import copy_notebook
+from .backend import Backfill, MetadataFingerprintCache, investigation_kwargs_from_job_parameters
 
 NB_EXTENSIONS = ['widgetsnbextension', 'ipyvuetify', 'ipyvue', 'ipydatetime']
 DEPLOYMENT_FOLDER = 'deployment'
@@ -150,8 +152,89 @@ def cli_interface():
     return parser.parse_args()
 
 
+def backfill_cli_interface(argv: list):
+    """
+    Parses the arguments of the backfill command
+
+    Parameters
+    ----------
+    argv: list
+        Command line arguments after 'backfill'
+
+    Returns
+    -------
+    args: argparse.Namespace
+        The parsed arguments
+    """
+    parser = argparse.ArgumentParser(prog='python -m seeq.addons.azureml backfill',
+                                     description='Scores a historical range with an Azure ML model and pushes the '
+                                                 'predictions to Seeq. Completed partitions are recorded in a ledger, '
+                                                 'so an interrupted backfill resumes where it stopped.')
+    parser.add_argument('job', type=str,
+                        help='JSON file with the parameters of the deploy job, e.g. {"Input Signals": {...}, '
+                             '"Result Name": "...", "AZ model name": "...", "AZ model version": "...", '
+                             '"Grid": "...", "Workbook": "...", "Endpoint": "...", "aml_primary_key": "..."}')
+    parser.add_argument('--start', type=str, required=True, help='Start of the backfill range, e.g. 2021-01-01')
+    parser.add_argument('--end', type=str, required=True, help='End of the backfill range, e.g. 2021-07-01')
+    parser.add_argument('--partition', type=str, default='1 day',
+                        help='Length of the partitions scored and pushed at a time, default: %(default)s')
+    parser.add_argument('--workers', type=int, default=4,
+                        help='Number of partitions processed at the same time, default: %(default)s')
+    parser.add_argument('--window_rows', type=int,
+                        help='Maximum number of rows scored in a single request within a partition')
+    parser.add_argument('--ledger', type=str,
+                        help='JSON file with the completed partitions, default: a file per result signal in '
+                             '~/.seeq/azureml/backfill')
+    parser.add_argument('--username', type=str,
+                        help='Username or Access Key of the Seeq user pushing the predictions')
+    return parser.parse_args(argv)
+
+
+def run_backfill(args):
+    """
+    Runs the backfill command
+
+    Parameters
+    ----------
+    args: argparse.Namespace
+        The arguments parsed by backfill_cli_interface
+
+    Returns
+    -------
+    exit_code: int
+        0 if all the partitions are completed, 1 otherwise
+    """
+    with open(args.job) as f:
+        kwargs = investigation_kwargs_from_job_parameters(json.load(f))
+    if args.window_rows is not None:
+        kwargs['window_rows'] = args.window_rows
+    kwargs['quiet'] = True
+    # shared with the scheduled job of the result signal, so both push into the same signals
+    kwargs['metadata_cache'] = MetadataFingerprintCache()
+
+    logging_attempts(args.username)
+    backfill = Backfill(kwargs, start=args.start, end=args.end, partition=args.partition, max_workers=args.workers,
+                        ledger=args.ledger)
+    print(f"\nBackfilling {len(backfill.partitions())} partitions of {backfill.partition} into "
+          f'"{kwargs.get("result_name")}". Ledger: {backfill.ledger}\n')
+    try:
+        status = backfill.run()
+    except KeyboardInterrupt:
+        print("\nBackfill interrupted. Run the same command again to resume it")
+        return 1
+    print(status.to_string())
+    failed = ~status['Result'].isin(['Success', 'Completed', 'No data'])
+    if failed.any():
+        print(f"\n{failed.sum()} partitions failed. Run the same command again to retry them")
+        return 1
+    return 0
+
+
 if __name__ == '__main__':
 
+    if len(sys.argv) > 1 and sys.argv[1] == 'backfill':
+        sys.exit(run_backfill(backfill_cli_interface(sys.argv[2:])))
+
     args = cli_interface()
     if args.nbextensions_only:
         print("\n\nInstalling and enabling nbextensions")
@@ -1,15 +1,20 @@
+import threading
 import pandas as pd
 import tzlocal
+import ipywidgets as widgets
 import ipyvuetify as v
 from seeq import spy
 from seeq.spy._errors import *
 from seeq.sdk.rest import ApiException
 from IPython.display import display, Javascript, clear_output, HTML
-from seeq.addons.azureml.utils import get_workbook_worksheet_workstep_ids, AzureMLException
-from seeq.addons.azureml.backend import RunInvestigation, ModelInputsProvider
+from seeq.addons.azureml.utils import get_workbook_worksheet_workstep_ids, AzureMLException, InvestigationCanceled
+from seeq.addons.azureml.backend import RunInvestigation, ModelInputsProvider, InputDataCache, PredictionCache, \
+    MetadataFingerprintCache, CancellationToken, ProgressEvent
 from seeq.addons.azureml import ui_components
 
 DEFAULT_WORKSHEET_NAME = 'From Azure ML Integration'
+# long investigation ranges are scored in windows, so their progress is reported and they can be canceled
+INVESTIGATION_WINDOW_ROWS = 10000
 
 
 class MlOperate:
@@ -31,6 +36,19 @@ class MlOperate:
     inputs_provider: seeq.addons.azureml.backend.ModelInputsProvider
         An instance of the ModelInputsProvider object that gets the input signal
         IDs from Seeq that are required by the Azure ML model.
+    input_cache: seeq.addons.azureml.backend.InputDataCache
+        The local cache of the input data pulled by the investigations
+    prediction_cache: seeq.addons.azureml.backend.PredictionCache
+        The local cache of the predictions returned by the Azure ML models
+    metadata_cache: seeq.addons.azureml.backend.MetadataFingerprintCache
+        The data IDs and metadata fingerprints of the pushed result signals,
+        so repeated investigations update the same Seeq signals
+    investigation_thread: threading.Thread
+        The background thread running the current investigation, or None
+    output: ipywidgets.Output
+        Output widget displayed with the Add-on. The background investigation
+        opens the results worksheet through it, since the output of a thread
+        does not reach the cell of the Add-on
     app: seeq.addons.azureml.ui_components.AppLayout
         An instance of the Add-on UI
     """
@@ -47,6 +65,14 @@ class MlOperate:
         self.default_time_delta = '1 hour'
         self.deploy_frequency = None
         self.inputs_provider = None
+        self.input_cache = None
+        self.prediction_cache = None
+        self.metadata_cache = None
+        self._listed_endpoints = list()
+        self.investigation_thread = None
+        self._cancellation = CancellationToken()
+        self._progress = dict()
+        self.output = widgets.Output()
 
         self.app = ui_components.AppLayout(endpoint_on_change=self.on_endpoint_dropdown_change,
                                            asset_on_change=self.on_asset_dropdown_change,
@@ -56,7 +82,9 @@ class MlOperate:
                                            end_on_change=self.on_date_range_change,
                                            jobname_on_change=self.on_jobname_change,
                                            frequency_on_change=self.on_frequency_change,
-                                           button_on_click=self.on_submit_click
+                                           button_on_click=self.on_submit_click,
+                                           cancel_on_click=self.on_cancel_click,
+                                           refresh_on_click=self.on_refresh_click
                                            )
         self.set_disable_value_for_all_components(disabled=True)
 
@@ -95,6 +123,7 @@ class MlOperate:
         display(self.app)
         self.populate_available_aml_endpoints()
         clear_output()
+        display(self.output)
         return self.app
 
     def set_error_message(self, title=None, message=None, status='ERROR', disabled_submit=True):
@@ -113,16 +142,34 @@ class MlOperate:
         self.set_cards_visible_spinner_invisible(visible=False)
         self.set_spinner_message(message="Connecting to Azure ML service")
 
+        self._listed_endpoints = list()
         try:
-            self.inputs_provider = ModelInputsProvider(config_file=self.config_file)
+            self.inputs_provider = ModelInputsProvider(config_file=self.config_file,
+                                                       on_endpoints_page=self.on_endpoints_page)
+            self.input_cache = InputDataCache()
+            self.prediction_cache = PredictionCache()
+            self.metadata_cache = MetadataFingerprintCache()
         except AzureMLException as e:
+            self.set_cards_visible_spinner_invisible(visible=False)
             self.set_spinner_message(title="Azure Exception", message=str(e), status="ERROR")
             self.app.spinner_visible = False
             return
-        # populate dropdown with available model endpoints
+        # populate dropdown with the endpoints of the catalog and refresh the stale catalog in the background
+        self.populate_endpoints_dropdown()
+        self.set_cards_visible_spinner_invisible()
+        if self.inputs_provider.catalog.is_stale():
+            self.inputs_provider.catalog.refresh_in_background(self.on_catalog_refresh)
+
+    def on_endpoints_page(self, endpoints):
+        # shows the endpoints of the first pages of a discovery while the next pages are listed. The dropdown is
+        # enabled once the discovery is complete
+        self._listed_endpoints.extend(x.name for x in endpoints)
+        self.app.model_inputs.endpoint_items = list(self._listed_endpoints)
+        self.set_cards_visible_spinner_invisible()
+
+    def populate_endpoints_dropdown(self):
         self.app.model_inputs.endpoint_items = list(self.inputs_provider.endpoints.keys())
         self.app.model_inputs.endpoint_disabled = False
-        self.set_cards_visible_spinner_invisible()
 
     def populate_assets_dropdown(self, items: list = None):
         self.app.model_inputs.asset_items = items
@@ -200,6 +247,23 @@ class MlOperate:
         self.app.model_inputs.endpoint_loading = False
         self.validate_forms()
 
+    def on_refresh_click(self, *_):
+        if self.inputs_provider is None:
+            return
+        self.app.model_inputs.endpoint_loading = True
+        # a manual refresh also reloads the keys, e.g. after they were regenerated in Azure ML, and the Seeq metadata
+        self.inputs_provider.metadata.clear()
+        self.inputs_provider.catalog.refresh_in_background(self.on_catalog_refresh, incremental=False)
+
+    def on_catalog_refresh(self, endpoints, error):
+        self.app.model_inputs.endpoint_loading = False
+        if error is not None:
+            self.set_error_message(title="Endpoints could not be refreshed: ", message=str(error),
+                                   disabled_submit=False)
+            return
+        self.inputs_provider.update_endpoints(endpoints)
+        self.populate_endpoints_dropdown()
+
     def on_asset_dropdown_change(self, data):
         self.set_error_message(disabled_submit=False)
         if data is None:
@@ -288,54 +352,44 @@ class MlOperate:
             return
 
         if self.app.model_action.selection == 'Investigate':
-            self.app.model_summary.button_loading = True
-
-            investigation = RunInvestigation(input_signals=self.inputs_provider.model_signal_inputs,
-                                             result_name=self.app.model_action.result_name,
-                                             az_model_name=self.inputs_provider.model_name,
-                                             az_model_version=str(self.inputs_provider.model_version),
-                                             start=self.app.model_action.investigate_range.start_range.value,
-                                             end=self.app.model_action.investigate_range.end_range.value,
-                                             grid=self.inputs_provider.model_sample_rate,
-                                             workbook=self.workbook_id,
-                                             worksheet=DEFAULT_WORKSHEET_NAME,
-                                             endpoint_uri=self.inputs_provider.model_endpoint_uri,
-                                             aml_primary_key=self.inputs_provider._model_primary_key,
-                                             quiet=True)
-
-            try:
-                investigation.run()
-                investigation.push_to_seeq()
-            except AzureMLException as e:
-                self.set_error_message(title="AzureMLException: ", message=str(e))
-                self.app.model_summary.button_loading = False
-                return
-            except ValueError as e:
-                self.set_error_message(title="Value Error: ", message=str(e))
-                self.app.model_summary.button_loading = False
+            if self.investigation_thread is not None and self.investigation_thread.is_alive():
                 return
+            self.app.model_summary.button_loading = True
+            self._cancellation = CancellationToken()
 
             try:
-                wb = spy.workbooks.pull(pd.DataFrame([
-                    {
-                        'ID': self.workbook_id,
-                        'Workbook Type': 'Analysis',
-                        'Type': 'Workbook'
-                    }
-                ]), status=spy.Status(quiet=True))[0]
-            except ApiException as e:
-                self.set_error_message(title="ApiException: ", message=str(e))
+                investigation = RunInvestigation(input_signals=self.inputs_provider.model_signal_inputs,
+                                                 result_name=self.app.model_action.result_name,
+                                                 az_model_name=self.inputs_provider.model_name,
+                                                 az_model_version=str(self.inputs_provider.model_version),
+                                                 start=self.app.model_action.investigate_range.start_range.value,
+                                                 end=self.app.model_action.investigate_range.end_range.value,
+                                                 grid=self.inputs_provider.model_sample_rate,
+                                                 workbook=self.workbook_id,
+                                                 worksheet=DEFAULT_WORKSHEET_NAME,
+                                                 endpoint_uri=self.inputs_provider.model_endpoint_uri,
+                                                 aml_primary_key=self.inputs_provider._model_primary_key,
+                                                 payload_format=self.inputs_provider.model_payload_format,
+                                                 lookback=self.inputs_provider.model_lookback,
+                                                 input_cache=self.input_cache,
+                                                 prediction_cache=self.prediction_cache,
+                                                 metadata_cache=self.metadata_cache,
+                                                 skip_unchanged_metadata=False,
+                                                 window_rows=INVESTIGATION_WINDOW_ROWS,
+                                                 on_progress=self.on_investigation_progress,
+                                                 cancellation=self._cancellation,
+                                                 quiet=True)
+            except Exception as e:
+                # e.g. an invalid PayloadFormat or Lookback tag of the model
+                self.set_error_message(title=f"{type(e).__name__}: ", message=str(e))
                 self.app.model_summary.button_loading = False
                 return
 
-            try:
-                ws = [x for x in wb.worksheets if x.name == DEFAULT_WORKSHEET_NAME][0]
-            except IndexError as e:
-                self.set_error_message(title="IndexError: ", message=str(e))
-                return
-
-            self.app.model_summary.button_loading = False
-            display(Javascript(f'window.open("{ws.url}");'))
+            # the investigation runs in the background, so the kernel and the UI stay responsive
+            self.show_investigation_progress(visible=True)
+            self.investigation_thread = threading.Thread(target=self.run_investigation, args=(investigation,),
+                                                         name='azureml-investigation', daemon=True)
+            self.investigation_thread.start()
 
         elif self.app.model_action.selection == 'Deploy':
             self.app.model_summary.button_loading = True
@@ -351,6 +405,8 @@ class MlOperate:
                 'Worksheet': DEFAULT_WORKSHEET_NAME,
                 'Endpoint': self.inputs_provider.model_endpoint_uri,
                 'aml_primary_key': self.inputs_provider._model_primary_key,
+                'Payload Format': self.inputs_provider.model_payload_format,
+                'Lookback': self.inputs_provider.model_lookback,
                 'User': f'{spy.user.first_name} {spy.user.last_name}',
                 'Job Name': "job name"
             }
@@ -367,6 +423,85 @@ class MlOperate:
                 self.app.model_summary.button_loading = False
                 return
 
+    def run_investigation(self, investigation: RunInvestigation):
+        try:
+            self._run_investigation(investigation)
+        finally:
+            self.show_investigation_progress(visible=False)
+            self.app.model_summary.button_loading = False
+
+    def _run_investigation(self, investigation):
+        try:
+            investigation.run()
+            investigation.push_to_seeq()
+        except InvestigationCanceled:
+            self.set_error_message(title="Canceled: ", message="Nothing was pushed to Seeq", status='SUCCESS',
+                                   disabled_submit=False)
+            return
+        except AzureMLException as e:
+            self.set_error_message(title="AzureMLException: ", message=str(e))
+            return
+        except ValueError as e:
+            self.set_error_message(title="Value Error: ", message=str(e))
+            return
+        except Exception as e:
+            self.set_error_message(title=f"{type(e).__name__}: ", message=str(e))
+            return
+
+        try:
+            wb = spy.workbooks.pull(pd.DataFrame([
+                {
+                    'ID': self.workbook_id,
+                    'Workbook Type': 'Analysis',
+                    'Type': 'Workbook'
+                }
+            ]), status=spy.Status(quiet=True))[0]
+        except ApiException as e:
+            self.set_error_message(title="ApiException: ", message=str(e))
+            return
+
+        try:
+            ws = [x for x in wb.worksheets if x.name == DEFAULT_WORKSHEET_NAME][0]
+        except IndexError as e:
+            self.set_error_message(title="IndexError: ", message=str(e))
+            return
+
+        # called from the investigation thread, so the Javascript is appended to the output widget of the Add-on
+        self.output.outputs = ()
+        self.output.append_display_data(Javascript(f'window.open("{ws.url}");'))
+
+    def show_investigation_progress(self, visible=True):
+        self._progress = {'Windows done': 0, 'Rows': 0}
+        self.app.model_summary.progress_value = 0
+        self.app.model_summary.progress_message = "Pulling the input signals from Seeq" if visible else ''
+        self.app.model_summary.cancel_disabled = False
+        self.app.model_summary.progress_visible = visible
+
+    def on_investigation_progress(self, event: ProgressEvent):
+        # called from the investigation thread at the start and at the end of each stage
+        if event.stage == 'push':
+            self.app.model_summary.progress_message = "Pushing the result signal to Seeq" if event.kind == 'start' \
+                else f"Pushed {event.rows:,} samples to Seeq"
+            return
+        if event.stage == 'run' or event.window is None:
+            return
+        if event.kind == 'end' and (event.stage == 'score' or event.rows == 0):
+            self._progress['Windows done'] += 1
+        if event.kind == 'end' and event.stage == 'score':
+            self._progress['Rows'] += event.rows
+        windows = max(event.windows, 1)
+        stage = {'pull': 'Pulling', 'score': 'Scoring'}[event.stage] if event.kind == 'start' else \
+            {'pull': 'Pulled', 'score': 'Scored'}[event.stage]
+        self.app.model_summary.progress_value = 100 * self._progress['Windows done'] / windows
+        self.app.model_summary.progress_message = \
+            f"{stage} window {event.window + 1} of {windows}. " \
+            f"{self._progress['Rows']:,} rows scored, {self._progress['Rows'] / max(event.elapsed, 1e-3):,.0f} rows/s"
+
+    def on_cancel_click(self, *_):
+        self._cancellation.cancel()
+        self.app.model_summary.cancel_disabled = True
+        self.app.model_summary.progress_message = "Canceling after the windows in progress"
+
 
 def validate_model_summary_properties(props):
     allowed_kwargs = ['endpoint_info', 'asset_info', 'signals_info', 'start_info', 'end_info', 'jobname_info',
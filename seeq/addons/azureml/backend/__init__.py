@@ -1,7 +1,24 @@
 from ._aml_response_models import OnlineDeployment, AmlModel, OnlineEndpoint
+from ._model_metadata import ModelMetadataCache
+from ._token_cache import TokenCache
 from ._aml_online_endpoint_service import AmlOnlineEndpointService
+from ._endpoint_catalog import EndpointCatalog
+from ._seeq_metadata import SeeqMetadataResolver
 from ._seeq_inputs_provider import ModelInputsProvider
+from ._scoring_windows import ScoringWindow
+from ._concurrency import InFlightLimiter
+from ._payload_encoders import PayloadEncoder, get_payload_encoder
+from ._response_decoders import decode_response
+from ._watermarks import WatermarkStore
+from ._input_cache import InputDataCache
+from ._prediction_cache import PredictionCache
+from ._metadata_fingerprints import MetadataFingerprintCache
+from ._progress import ProgressEvent, CancellationToken
 from ._run_investigation import RunInvestigation
+from ._backfill import Backfill, investigation_kwargs_from_job_parameters
 
-__all__ = ['AmlOnlineEndpointService', 'OnlineDeployment', 'AmlModel', 'OnlineEndpoint', 'ModelInputsProvider',
-           'RunInvestigation']
+__all__ = ['AmlOnlineEndpointService', 'OnlineDeployment', 'AmlModel', 'OnlineEndpoint', 'ModelMetadataCache',
+           'TokenCache', 'EndpointCatalog', 'SeeqMetadataResolver', 'ModelInputsProvider',
+           'RunInvestigation', 'ProgressEvent', 'CancellationToken', 'ScoringWindow', 'InFlightLimiter',
+           'PayloadEncoder', 'get_payload_encoder', 'decode_response', 'WatermarkStore', 'InputDataCache',
+           'PredictionCache', 'MetadataFingerprintCache', 'Backfill', 'investigation_kwargs_from_job_parameters']
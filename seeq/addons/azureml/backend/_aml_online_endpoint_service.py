@@ -1,11 +1,33 @@
+import time
+import hashlib
+import threading
 import requests
 from requests.adapters import HTTPAdapter
 from urllib3.util.retry import Retry
-from datetime import datetime, timedelta
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
 from ._aml_response_models import OnlineDeployment, OnlineEndpoint, AmlModel
-from seeq.addons.azureml.utils import AzureMLException
+from ._model_metadata import ModelMetadataCache
+from ._token_cache import TokenCache
+from ._concurrency import in_flight_limiter
+from ._scoring_transport import retry_after_seconds, backoff_delay
+from seeq.addons.azureml.utils import AzureMLException, FileLock, cache_path, read_json, write_json
 
 API_VERSION = "2021-03-01-preview"
+MAX_WORKERS = 8
+MAX_THROTTLE_RETRIES = 5
+MANAGEMENT_RESOURCE = "https://management.core.windows.net/"
+# a token is not used in its last minute, and it is refreshed in the background in its last 5 minutes
+TOKEN_EXPIRY_MARGIN = 60
+TOKEN_REFRESH_AHEAD = 300
+# validity assumed when the token response has neither expires_in nor expires_on
+DEFAULT_TOKEN_LIFETIME = 59 * 60
+# the regional model management host of a workspace is persisted for a day
+WORKSPACES_FILE = 'workspaces.json'
+WORKSPACE_DISCOVERY_TTL = 24 * 60 * 60
+
+_token_lock = threading.Lock()
+_token_refreshes = set()
+_discovery_lock = threading.Lock()
 
 
 class AmlOnlineEndpointService:
@@ -14,14 +36,36 @@ class AmlOnlineEndpointService:
     Provides a service to connect to Azure ML Studio and get endpoints that are
     tagged with `{Seeq: true}` and their associated deployments and models.
 
+    Attributes
+    ----------
+    workspace_id: str
+        Identifies the Azure ML workspace of the service, e.g. to key the
+        data cached per workspace
+
+    max_workers: int
+        Maximum number of requests sent at the same time to discover the
+        endpoints
+    model_cache: seeq.addons.azureml.backend.ModelMetadataCache
+        The cache of the metadata of the model versions, so that each model
+        version is only requested once
+    token_cache: seeq.addons.azureml.backend.TokenCache
+        The cache of the access tokens shared by the processes of the host
+
     Methods
     -------
-    list_online_endpoints()
+    list_online_endpoints(details, on_page)
         Returns a list containing online endpoints tagged with `{Seeq: true}` in Azure ML Studio
+    iter_online_endpoints()
+        Iterates over the online endpoints tagged with `{Seeq: true}`, page by page
+    add_endpoint_details(endpoint)
+        Attaches the keys, deployments and models to an online endpoint
+    list_deployments(endpoint)
+        Returns the deployments of a managed online endpoint
 
     """
 
-    def __init__(self, tenant_id, app_id, app_secret, subscription_id, resource_group, workspace_name) -> None:
+    def __init__(self, tenant_id, app_id, app_secret, subscription_id, resource_group, workspace_name,
+                 max_workers=MAX_WORKERS, model_cache=None, token_cache=None) -> None:
         self._tenant_id = tenant_id
         self._app_id = app_id
         self._app_secret = app_secret
@@ -30,20 +74,33 @@ class AmlOnlineEndpointService:
         self._workspace_name = workspace_name
         self._token = None
         self._token_expires_on = None
+        self._model_mgmt_host = None
+        self.max_workers = max_workers
+        self.model_cache = ModelMetadataCache() if model_cache is None else model_cache
+        self.token_cache = TokenCache() if token_cache is None else token_cache
+        # throttled (429) responses are retried by _request, which also reduces the number of requests in flight
         retry_strategy = Retry(
             total=3,
-            status_forcelist=[429, 500, 502, 503, 504],
+            status_forcelist=[500, 502, 503, 504],
             allowed_methods=["POST", "GET"]
             )
-        adapter = HTTPAdapter(max_retries=retry_strategy)
+        adapter = HTTPAdapter(pool_maxsize=max(10, max_workers), max_retries=retry_strategy)
         self._http = requests.Session()
         self._http.mount("https://", adapter)
         self._http.mount("http://", adapter)
 
+    @property
+    def workspace_id(self):
+        return f"{self._subscription_id}/{self._resource_group}/{self._workspace_name}"
+
     def _authorize(self):
 
         """
-        Private method to authenticate to https://login.microsoftonline.com
+        Private method to authenticate to https://login.microsoftonline.com.
+        The token is shared with the other instances and processes of the
+        host through token_cache, so a login only happens when no valid
+        token is cached. A token close to its expiry is refreshed in the
+        background, so that the requests do not wait for the login.
 
         Returns
         -------
@@ -51,26 +108,108 @@ class AmlOnlineEndpointService:
             Authentication token
 
         """
-
-        if self._token is not None:
-            if self._token_expires_on is not None:
-                if datetime.now() < self._token_expires_on:
-                    return self._token
-
+        # the discovery requests run in several threads, which must not all log in at the same time
+        with _token_lock:
+            if self._token is None or self._token_expires_on - time.time() <= TOKEN_EXPIRY_MARGIN:
+                self._token, self._token_expires_on = self._cached_token_or_login()
+            if self._token_expires_on - time.time() <= TOKEN_REFRESH_AHEAD:
+                self._refresh_token_in_background()
+            return self._token
+
+    @property
+    def _token_key(self):
+        return TokenCache.key(self._tenant_id, self._app_id, MANAGEMENT_RESOURCE)
+
+    def _cached_token_or_login(self):
+        cached = self.token_cache.get(self._token_key, TOKEN_EXPIRY_MARGIN)
+        if cached is not None:
+            return cached
+        # another process may be logging in with the same principal
+        with FileLock(self.token_cache.path):
+            cached = self.token_cache.get(self._token_key, TOKEN_EXPIRY_MARGIN)
+            return cached if cached is not None else self._login()
+
+    def _login(self):
         url = f"https://login.microsoftonline.com/{self._tenant_id}/oauth2/token?api-version=1.0"
-        payload = f"client_secret={self._app_secret}&grant_type=client_credentials&resource=https%3A%2F%2Fmanagement" \
-                  f".core.windows.net%2F&client_id={self._app_id}"
+        payload = f"client_secret={self._app_secret}&grant_type=client_credentials&resource=https%3A%2F%2F" \
+                  f"management.core.windows.net%2F&client_id={self._app_id}"
         headers = {'Content-Type': 'application/x-www-form-urlencoded'}
 
+        requested_at = time.time()
         response = self._http.post(url, headers=headers, data=payload)
 
         if response.status_code != 200:
             raise AzureMLException(code=response.status_code, reason=response.reason, message="Azure Login Failed")
 
         token_info = response.json()
-        self._token = token_info['access_token']
-        self._token_expires_on = datetime.now() + timedelta(minutes=59)
-        return self._token
+        # expires_in is relative, so it does not depend on the clock of the host matching the one of Azure
+        if token_info.get('expires_in') is not None:
+            expires_on = requested_at + float(token_info['expires_in'])
+        elif token_info.get('expires_on') is not None:
+            expires_on = float(token_info['expires_on'])
+        else:
+            expires_on = requested_at + DEFAULT_TOKEN_LIFETIME
+        self.token_cache.put(self._token_key, token_info['access_token'], expires_on)
+        return token_info['access_token'], expires_on
+
+    def _refresh_token_in_background(self):
+        key = self._token_key
+        if key in _token_refreshes:
+            return
+        _token_refreshes.add(key)
+
+        def target():
+            try:
+                with FileLock(self.token_cache.path):
+                    # another process may have refreshed the token already
+                    token = self.token_cache.get(key, TOKEN_REFRESH_AHEAD)
+                    token = self._login() if token is None else token
+                with _token_lock:
+                    self._token, self._token_expires_on = token
+            except Exception:
+                # the token is still valid, and the next requests log in if the refresh keeps failing
+                pass
+            finally:
+                with _token_lock:
+                    _token_refreshes.discard(key)
+
+        threading.Thread(target=target, name='aml-token-refresh', daemon=True).start()
+
+    def _request(self, method, url, **kwargs):
+        """
+        Private method to send a request to the Azure ML management services.
+        The requests in flight are bounded by max_workers for all the
+        instances of the subscription, and a throttled (429) request is
+        retried after the delay requested by Azure, with fewer requests in
+        flight.
+
+        Parameters
+        ----------
+        method: str
+            'get' or 'post'
+        url: str
+            URL of the request
+        kwargs:
+            Keyword arguments of requests.Session.get or post
+
+        Returns
+        -------
+        response: requests.Response
+            The response of the request
+        """
+        limiter = in_flight_limiter(f"arm:{self._subscription_id}", self.max_workers)
+        attempt = 0
+        while True:
+            with limiter:
+                response = getattr(self._http, method)(url, **kwargs)
+            if response.status_code != 429:
+                limiter.on_success()
+                return response
+            if attempt >= MAX_THROTTLE_RETRIES:
+                return response
+            limiter.on_throttle()
+            time.sleep(backoff_delay(attempt, retry_after_seconds(response.headers)))
+            attempt += 1
 
     def _get_base_mgmt_url(self):
         """
@@ -89,7 +228,10 @@ class AmlOnlineEndpointService:
 
     def _get_regional_model_mgmt_url(self):
         """
-        Private method to get the region management URL
+        Private method to get the region management URL. The workspace
+        discovery is only requested once per instance, and its result is
+        persisted for WORKSPACE_DISCOVERY_TTL seconds for the other
+        instances and processes.
 
         Returns
         -------
@@ -97,35 +239,53 @@ class AmlOnlineEndpointService:
             URL and headers of the management service
 
         """
+        mgmt_url = f"{self._get_model_mgmt_host()}/modelmanagement/v1.0/subscriptions/" \
+                   f"{self._subscription_id}/resourceGroups/" \
+                   f"{self._resource_group}/providers/Microsoft.MachineLearningServices/" \
+                   f"workspaces/{self._workspace_name}/services/"
+        mgmt_headers = {'Authorization': f'Bearer {self._authorize()}'}
 
+        return mgmt_url, mgmt_headers
+
+    def _get_model_mgmt_host(self):
+        with _discovery_lock:
+            if self._model_mgmt_host is not None:
+                return self._model_mgmt_host
+            path = cache_path(WORKSPACES_FILE)
+            key = hashlib.sha1(self.workspace_id.lower().encode()).hexdigest()
+            entry = read_json(path, default=dict()).get(key)
+            if entry is None or entry['expires_on'] <= time.time():
+                entry = {'modelmanagement': self._discover_model_mgmt_host(), 'expires_on':
+                         time.time() + WORKSPACE_DISCOVERY_TTL}
+                with FileLock(path):
+                    workspaces = read_json(path, default=dict())
+                    workspaces[key] = entry
+                    write_json(path, workspaces)
+            self._model_mgmt_host = entry['modelmanagement']
+            return self._model_mgmt_host
+
+    def _discover_model_mgmt_host(self):
         url_base, headers = self._get_base_mgmt_url()
         url = f"{url_base}?api-version={API_VERSION}"
-        headers = {'Authorization': f'Bearer {self._authorize()}'}
 
-        response = self._http.get(url, headers=headers)
+        response = self._request('get', url, headers=headers)
         if response.status_code != 200:
             raise AzureMLException(code=response.status_code, reason=response.reason,
                                    message="Error getting workspace details")
 
         workspace_discovery_url = response.json()['properties']['discoveryUrl']
 
-        response = self._http.get(workspace_discovery_url)
+        response = self._request('get', workspace_discovery_url)
         if response.status_code != 200:
             raise AzureMLException(code=response.status_code, reason=response.reason,
                                    message="Error accessing workspace discovery")
-
-        mgmt_url = f"{response.json()['modelmanagement']}/modelmanagement/v1.0/subscriptions/" \
-                   f"{self._subscription_id}/resourceGroups/" \
-                   f"{self._resource_group}/providers/Microsoft.MachineLearningServices/" \
-                   f"workspaces/{self._workspace_name}/services/"
-        mgmt_headers = {'Authorization': f'Bearer {self._authorize()}'}
-
-        return mgmt_url, mgmt_headers
+        return response.json()['modelmanagement']
 
     def _get_models(self, deployment: OnlineDeployment):
         """
         Private method to get models associated with a given deployment
-        in Azure ML Studio and attach them to the OnlineDeployment object
+        in Azure ML Studio and attach them to the OnlineDeployment object.
+        The model versions found in model_cache are not requested.
 
         Parameters
         ----------
@@ -136,21 +296,29 @@ class AmlOnlineEndpointService:
         -: None
 
         """
+        model = self.model_cache.get(deployment.modelId) if self.model_cache.is_cacheable(deployment.modelId) \
+            else None
+        if model is not None:
+            deployment.model = model
+            return
+
         path = deployment.modelId.replace('/versions/', ':')
         url = f"https://ml.azure.com/api/{deployment.location}/modelmanagement/v1.0{path}"
         headers = {'Authorization': f'Bearer {self._authorize()}'}
 
-        response = self._http.get(url, headers=headers)
+        response = self._request('get', url, headers=headers)
         if response.status_code != 200:
             raise AzureMLException(code=response.status_code, reason=response.reason, message="Error getting models")
 
+        # deserialized before it is cached, so that a malformed response is not cached
         model = AmlModel.deserialize_aml_model_response(response.json())
+        self.model_cache.put(deployment.modelId, response.json())
         deployment.model = model
 
-    def _add_deployments_to_endpoint(self, endpoint: OnlineEndpoint):
+    def list_deployments(self, endpoint: OnlineEndpoint):
         """
-        Private method to get the associated deployments for an online endpoint
-        in Azure ML Studio and attach them to the OnlineEndpoint object
+        Public method to list the deployments of a managed online endpoint,
+        without their models
 
         Parameters
         ----------
@@ -158,22 +326,37 @@ class AmlOnlineEndpointService:
 
         Returns
         -------
-        -: None
-
+        ods: list
+            List of OnlineDeployment objects, including the deployments that
+            do not get all the traffic of the endpoint
         """
-
         url_base, headers = self._get_base_mgmt_url()
 
         url = f"{url_base}onlineEndpoints/{endpoint.name}/deployments?api-version={API_VERSION}"
-        response = self._http.get(url, headers=headers)
-        if response.status_code != 200:
-            raise AzureMLException(code=response.status_code, reason=response.reason,
-                                   message="Error getting deployments")
+        ods = list()
+        for page in self._get_pages(url, headers, "Error getting deployments"):
+            ods += OnlineDeployment.deserialize_aml_deployment_response(page, "Managed")
+        return ods
 
-        deployments = OnlineDeployment.deserialize_aml_deployment_response(response.json(), "Managed")
+    def _add_deployments_to_endpoint(self, endpoint: OnlineEndpoint, models=True):
+        """
+        Private method to get the associated deployments for an online endpoint
+        in Azure ML Studio and attach them to the OnlineEndpoint object
+
+        Parameters
+        ----------
+        endpoint: seeq.addons.azureml.backend.OnlineEndpoint
+        models: bool, default True
+            If True, the models of the deployments are attached too
 
-        for d in deployments:
-            self._get_models(d)
+        Returns
+        -------
+        -: None
+
+        """
+        for d in self.list_deployments(endpoint):
+            if models:
+                self._get_models(d)
             endpoint.add_deployment(d)
         return endpoint
 
@@ -199,7 +382,7 @@ class AmlOnlineEndpointService:
             base_url, headers = self._get_regional_model_mgmt_url()
             url = f"{base_url}{endpoint.name}/listKeys"
 
-        response = self._http.post(url, headers=headers)
+        response = self._request('post', url, headers=headers)
 
         if response.status_code != 200:
             raise AzureMLException(code=response.status_code, reason=response.reason,
@@ -208,79 +391,223 @@ class AmlOnlineEndpointService:
         endpoint.primaryKey = keys['primaryKey']
         endpoint.secondaryKey = keys['secondaryKey']
 
-    def _get_unmanaged_online_endpoints(self):
+    def _get_pages(self, url, headers, message):
         """
-        Private method to get a list of endpoints that are deployed as an ACI
-        compute type. This is a workaround due to the endpoints API not returing
-        endpoints that have a compute type of ACI.
+        Private method to get the pages of an Azure ML listing, following the
+        nextLink of each page until the last one
+
+        Parameters
+        ----------
+        url: str
+            URL of the first page
+        headers: dict
+            Headers of the requests
+        message: str
+            Message of the exception raised if a page cannot be read
 
         Returns
         -------
-        oes: list
-            List of OnlineEndpoint objects with deployments and models attached 
-            to each object
+        pages: generator
+            The JSON content of each page, as soon as the page is received
+        """
+        while url:
+            response = self._request('get', url, headers=headers)
+            if response.status_code != 200:
+                raise AzureMLException(code=response.status_code, reason=response.reason, message=message)
+            page = response.json()
+            yield page
+            url = page.get('nextLink')
+
+    def _iter_unmanaged_online_endpoints(self):
+        """
+        Private method to iterate over the pages of endpoints that are
+        deployed as an ACI compute type. This is a workaround due to the
+        endpoints API not returing endpoints that have a compute type of ACI.
+
+        Returns
+        -------
+        pages: generator
+            A list of OnlineEndpoint objects with their deployment for each
+            page of the listing
         """
         url, headers = self._get_regional_model_mgmt_url()
         headers['computeType'] = "ACI"
-        response = self._http.get(url, headers=headers)
+        for page in self._get_pages(url, headers, "Error getting ACI endpoints"):
+            oes = OnlineEndpoint.deserialize_unmanaged_endpoint_response(page)
+            for oe in oes:
+                # unmanaged endpoints only have one deployment
+                oe.deployment[0].modelId = f"/subscriptions/{self._subscription_id}/resourceGroups/" \
+                                           f"{self._resource_group}/providers/Microsoft.MachineLearningService" \
+                                           f"s/workspaces/{self._workspace_name}/models/" \
+                                           f"{oe.deployment[0].model}/versions/" \
+                                           f"{oe.deployment[0].model_version}"
+            yield oes
+
+    def _iter_managed_online_endpoints(self):
+        """
+        Private method to iterate over the pages of endpoints tagged with
+        `{Seeq: true}` in Azure ML Studio
 
-        if response.status_code != 200:
-            raise AzureMLException(code=response.status_code, reason=response.reason,
-                                   message="Error getting ACI endpoints")
-
-        oes = OnlineEndpoint.deserialize_unmanaged_endpoint_response(response.json())
-        for oe in oes:
-            self._add_keys_to_endpoint(oe)
-            # unmanaged endpoints only have one deployment
-            oe.deployment[0].modelId = f"/subscriptions/{self._subscription_id}/resourceGroups/" \
-                                       f"{self._resource_group}/providers/Microsoft.MachineLearningService" \
-                                       f"s/workspaces/{self._workspace_name}/models/" \
-                                       f"{oe.deployment[0].model}/versions/" \
-                                       f"{oe.deployment[0].model_version}"
-            self._get_models(oe.deployment[0])
-        return oes
-
-    def _get_managed_online_endpoints(self):
+        Returns
+        -------
+        pages: generator
+            A list of OnlineEndpoint objects for each page of the listing
+        """
+        url_base, headers = self._get_base_mgmt_url()
+        url = f"{url_base}onlineEndpoints?api-version=2021-03-01-preview"
+        for page in self._get_pages(url, headers, "Error getting endpoints"):
+            yield OnlineEndpoint.deserialize_managed_endpoint_response(page)
+
+    def _get_unmanaged_online_endpoints(self, on_page=None):
+        """
+        Private method to get a list of endpoints that are deployed as an ACI
+        compute type. The keys and models are attached by
+        list_online_endpoints.
+
+        Parameters
+        ----------
+        on_page: callable, optional
+            Called with the endpoints of each page as soon as it is received
+
+        Returns
+        -------
+        oes: list
+            List of OnlineEndpoint objects with their deployment
+        """
+        return _collect_pages(self._iter_unmanaged_online_endpoints(), on_page)
+
+    def _get_managed_online_endpoints(self, on_page=None):
         """
         Private method to get a list of endpoints tagged with `{Seeq: true}` in
-        Azure ML Studio and attach the associated deployments and models in
-        the endpoint to each OnlineEndpoint object
+        Azure ML Studio. The keys, deployments and models are attached by
+        list_online_endpoints.
+
+        Parameters
+        ----------
+        on_page: callable, optional
+            Called with the endpoints of each page as soon as it is received
 
         Returns
         -------
         oes: list
-            List of OnlineEndpoint objects with deployments and models attached
-            to each object
+            List of OnlineEndpoint objects
         """
-        url_base, headers = self._get_base_mgmt_url()
-        url = f"{url_base}onlineEndpoints?api-version=2021-03-01-preview"
-        response = self._http.get(url, headers=headers)
+        return _collect_pages(self._iter_managed_online_endpoints(), on_page)
 
-        if response.status_code != 200:
-            raise AzureMLException(code=response.status_code, reason=response.reason, message="Error getting endpoints")
+    def iter_online_endpoints(self):
+        """
+        Public method to iterate over the endpoints tagged with `{Seeq: true}`
+        in Azure ML Studio, the unmanaged ones first. Each endpoint is
+        yielded as soon as its page is received, and the next page is only
+        requested when the iteration gets to it. The keys, deployments and
+        models are not attached, see add_endpoint_details.
 
-        oes = OnlineEndpoint.deserialize_managed_endpoint_response(response.json())
-        for oe in oes:
-            self._add_keys_to_endpoint(oe)
-            self._add_deployments_to_endpoint(oe)
-        return oes
+        Returns
+        -------
+        oes: generator
+            The OnlineEndpoint objects
+        """
+        for pages in [self._iter_unmanaged_online_endpoints(), self._iter_managed_online_endpoints()]:
+            for page in pages:
+                yield from page
 
-    def list_online_endpoints(self):
+    def list_online_endpoints(self, details=True, on_page=None):
         """
         Public method to get a list of endpoints tagged with `{Seeq: true}` in
         Azure ML Studio and attach the associated deployments and models in
         the endpoint to each OnlineEndpoint object.
 
+        The managed and unmanaged endpoints are listed at the same time, and
+        the keys, deployments and models of each endpoint are requested as
+        soon as the endpoint is known, with at most max_workers requests in
+        flight.
+
+        Parameters
+        ----------
+        details: bool, default True
+            If False, only the endpoints are listed, with their names, tags
+            and scoring URIs. The keys, deployments and models of an endpoint
+            can then be attached with add_endpoint_details when the endpoint
+            is needed.
+        on_page: callable, optional
+            Called with the endpoints of each page of the listings as soon as
+            the page is received, before their details are attached, e.g.
+            to show the first endpoints while the next pages are listed. It
+            is called from the threads of the listings.
+
         Returns
         -------
         oes: list
             List of OnlineEndpoint objects with deployments and models attached
             to each object
         """
-        oes = self._get_unmanaged_online_endpoints()
-        oes += self._get_managed_online_endpoints()
-        return oes
+        # a single login before the fan-out
+        self._authorize()
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            unmanaged = executor.submit(self._get_unmanaged_online_endpoints, on_page)
+            managed = executor.submit(self._get_managed_online_endpoints, on_page)
+            pending = {unmanaged, managed}
+            if details:
+                self._fan_out(executor, pending)
+            return unmanaged.result() + managed.result()
+
+    def add_endpoint_details(self, endpoint: OnlineEndpoint):
+        """
+        Public method to attach the primary and secondary keys, the
+        deployments and their models to an endpoint listed with
+        list_online_endpoints(details=False)
+
+        Parameters
+        ----------
+        endpoint: seeq.addons.azureml.backend.OnlineEndpoint
+
+        Returns
+        -------
+        endpoint: seeq.addons.azureml.backend.OnlineEndpoint
+            The same endpoint, with keys, deployments and models attached
+        """
+        self._authorize()
+        if endpoint.kind == "Managed":
+            endpoint.deployment = list()
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            self._fan_out(executor, self._submit_endpoint_details(executor, [endpoint]))
+        return endpoint
+
+    def _fan_out(self, executor, pending):
+        # waits for the requests and submits their follow-up requests until there are none left
+        try:
+            while pending:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    pending |= self._submit_endpoint_details(executor, future.result())
+        except BaseException:
+            for future in pending:
+                future.cancel()
+            raise
+
+    def _submit_endpoint_details(self, executor, result):
+        # the follow-up requests of a completed request. The order of the deployments is kept
+        futures = set()
+        if isinstance(result, list):
+            for oe in result:
+                futures.add(executor.submit(self._add_keys_to_endpoint, oe))
+                if oe.kind == "Managed":
+                    futures.add(executor.submit(self._add_deployments_to_endpoint, oe, False))
+                else:
+                    futures |= {executor.submit(self._get_models, d) for d in oe.deployment}
+        elif isinstance(result, OnlineEndpoint):
+            futures |= {executor.submit(self._get_models, d) for d in result.deployment}
+        return futures
 
 
 def exception_message(message, code, reason):
     return f'{message}. Return code: {str(code)} with reason: {str(reason)}'
+
+
+def _collect_pages(pages, on_page):
+    oes = list()
+    for page in pages:
+        oes += page
+        if on_page is not None:
+            on_page(page)
+    return oes
@@ -35,6 +35,13 @@ class AmlModel:
         asset_path_ids
     sample_rate : str
         The sampling rate required by the Azure ML model for the input signals.
+    payload_format : str
+        The format in which the scoring script of the model expects the input
+        data, taken from the `PayloadFormat` tag. If None, the input data is
+        sent as column-oriented JSON with ISO timestamps.
+    lookback : str
+        Amount of history the model needs before the first timestamp scored,
+        e.g. '1 hour', taken from the `Lookback` tag.
 
     Methods
     -------
@@ -61,6 +68,8 @@ class AmlModel:
         self.asset_path_ids = list()
         self.asset_input_names = list()
         self.sample_rate = None
+        self.payload_format = None
+        self.lookback = None
 
     @staticmethod
     def deserialize_aml_model_response(json):
@@ -88,6 +97,8 @@ class AmlModel:
             model.asset_input_names = {re.search(r'(\d+)', k).group(): v for k, v in tags.items() if
                                        k.lower().startswith('input') and not spy.utils.is_guid(v)}
             model.sample_rate = tags.get('SampleRate', )
+            model.payload_format = tags.get('PayloadFormat')
+            model.lookback = tags.get('Lookback')
         return model
 
 
@@ -0,0 +1,249 @@
+import threading
+import pandas as pd
+from pathlib import Path
+from typing import Union
+from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+from seeq.addons.azureml.utils import FileLock, cache_path, read_json, write_json
+from ._scoring_windows import split_time_range
+from ._run_investigation import RunInvestigation, NO_DATA_MESSAGE
+from ._metadata_fingerprints import MetadataFingerprintCache
+
+DEFAULT_PARTITION = '1 day'
+# RunInvestigation arguments for each of the job parameters of the deploy notebook
+JOB_PARAMETERS = {
+    'Input Signals': 'input_signals',
+    'Result Name': 'result_name',
+    'AZ model name': 'az_model_name',
+    'AZ model version': 'az_model_version',
+    'Grid': 'grid',
+    'Workbook': 'workbook',
+    'Worksheet': 'worksheet',
+    'Endpoint': 'endpoint_uri',
+    'aml_primary_key': 'aml_primary_key',
+    'Payload Format': 'payload_format',
+    'Lookback': 'lookback'
+}
+
+
+class Backfill:
+    """
+    Scores a long historical range, e.g. when a new model version is
+    deployed. The range is split into partitions that are pulled, scored
+    and pushed to Seeq by a pool of workers. Every completed partition is
+    recorded in a ledger on disk, so an interrupted backfill resumes with
+    the partitions that are still missing.
+
+    Attributes
+    ----------
+    investigation_kwargs: dict
+        Arguments of the RunInvestigation of each partition, except start
+        and end
+    start: pd.Timestamp
+        Start of the backfill range
+    end: pd.Timestamp
+        End of the backfill range
+    partition: pd.Timedelta
+        Length of the partitions
+    max_workers: int
+        Number of partitions processed at the same time
+    ledger: Path
+        Path of the JSON file with the completed partitions
+    status: pd.DataFrame
+        A DataFrame with one row per partition with its 'Start', 'End',
+        number of 'Rows' pushed and the 'Result' of the partition:
+        'Success', 'Completed' (by a previous run), 'No data', 'Canceled' or
+        the error message.
+
+    Methods
+    -------
+    partitions()
+        Splits the backfill range into partitions
+    completed()
+        Returns the partitions recorded as completed in the ledger
+    run()
+        Processes the partitions that are not completed yet
+    """
+
+    def __init__(self,
+                 investigation_kwargs: dict,
+                 start: Union[str, datetime],
+                 end: Union[str, datetime],
+                 partition: Union[str, pd.Timedelta] = DEFAULT_PARTITION,
+                 max_workers: int = 4,
+                 ledger: Union[str, Path, None] = None):
+        """
+        Parameters
+        ----------
+        investigation_kwargs: dict
+            Arguments of seeq.addons.azureml.backend.RunInvestigation, except
+            start and end, e.g. input_signals, result_name, az_model_name,
+            az_model_version, grid, workbook, endpoint_uri and
+            aml_primary_key. See investigation_kwargs_from_job_parameters.
+            Unless a metadata_cache is given, the partitions share a
+            MetadataFingerprintCache in ~/.seeq/azureml, like the scheduled
+            jobs, so they push into the same signals and only the first
+            push of the result signal writes its metadata.
+        start: str or datetime
+            Start of the backfill range
+        end: str or datetime
+            End of the backfill range
+        partition: str or pd.Timedelta, default '1 day'
+            Length of the partitions. Each partition is scored with one
+            RunInvestigation, which may split it further with window_rows.
+        max_workers: int, default 4
+            Number of partitions processed at the same time
+        ledger: str or Path, optional
+            Path of the JSON file with the completed partitions. By default,
+            a file per result signal in ~/.seeq/azureml/backfill
+        """
+        for arg in ['start', 'end', 'watermarks']:
+            if arg in investigation_kwargs:
+                raise ValueError(f"The investigation_kwargs must not include '{arg}'")
+        self.investigation_kwargs = dict(investigation_kwargs)
+        if self.investigation_kwargs.get('metadata_cache') is None:
+            self.investigation_kwargs['metadata_cache'] = MetadataFingerprintCache()
+        self.start = pd.Timestamp(start)
+        self.end = pd.Timestamp(end)
+        self.partition = pd.Timedelta(partition)
+        self.max_workers = max_workers
+
+        if self.partition <= pd.Timedelta(0):
+            raise ValueError(f"The partition must be a positive time period. Got {self.partition}")
+        if not isinstance(max_workers, int) or isinstance(max_workers, bool) or max_workers < 1:
+            raise TypeError(f"The max_workers argument must be a positive integer. Got {max_workers}")
+
+        # validates the investigation arguments before any partition is processed
+        investigation = self._investigation(self.start, self.end)
+        self.ledger = cache_path('backfill', f'{investigation.watermark_key}.json') if ledger is None \
+            else Path(ledger)
+        self.status = pd.DataFrame()
+        self._push_lock = threading.Lock()
+        self._cancel = threading.Event()
+
+    def partitions(self):
+        """
+        Splits the backfill range into partitions
+
+        Returns
+        -------
+        partitions: list
+            List of seeq.addons.azureml.backend.ScoringWindow in time order
+        """
+        return split_time_range(self.start, self.end, self.partition, window_rows=1)
+
+    def completed(self):
+        """
+        Returns the partitions recorded as completed in the ledger
+
+        Returns
+        -------
+        completed: dict
+            The keys are the partition ranges, '<start>/<end>' in ISO 8601,
+            and the values the number of rows pushed and the time of
+            completion
+        """
+        return read_json(self.ledger, default=dict())
+
+    def run(self):
+        """
+        Pulls, scores and pushes the partitions that are not completed yet.
+        A failed partition does not stop the others and is not recorded in
+        the ledger, so that the next run retries it.
+
+        Returns
+        -------
+        status: pd.DataFrame
+            The status of each partition, also kept in the status attribute
+        """
+        partitions = self.partitions()
+        completed = self.completed()
+        outcomes = dict()
+        pending = list()
+        for p in partitions:
+            if _partition_key(p) in completed:
+                outcomes[p.index] = {'Rows': completed[_partition_key(p)]['Rows'], 'Result': 'Completed'}
+            else:
+                pending.append(p)
+
+        self._cancel.clear()
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            futures = {executor.submit(self._process, p): p for p in pending}
+            remaining = set(futures)
+            try:
+                while remaining:
+                    done, remaining = wait(remaining, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        outcomes[futures[future].index] = future.result()
+            except KeyboardInterrupt:
+                # the completed partitions are already in the ledger. Let the partitions in flight finish
+                self._cancel.set()
+                for future in remaining:
+                    future.cancel()
+                raise
+            finally:
+                self.status = pd.DataFrame([{
+                    'Start': p.start,
+                    'End': p.end,
+                    'Rows': outcomes.get(p.index, {}).get('Rows', 0),
+                    'Result': outcomes.get(p.index, {}).get('Result', 'Canceled')
+                } for p in partitions])
+        return self.status
+
+    def _investigation(self, start, end):
+        return RunInvestigation(start=start, end=end, **self.investigation_kwargs)
+
+    def _process(self, partition):
+        if self._cancel.is_set():
+            return {'Rows': 0, 'Result': 'Canceled'}
+        try:
+            investigation = self._investigation(partition.start, partition.end)
+            try:
+                investigation.run()
+            except ValueError as e:
+                if str(e) != NO_DATA_MESSAGE:
+                    raise
+            result = investigation.result_signal
+            if not result.empty:
+                # the end of a partition is the start of the next one
+                investigation.result_signal = result[partition.owned(result.index)]
+                with self._push_lock:
+                    investigation.push_to_seeq()
+            rows = len(investigation.result_signal)
+            self._record(partition, rows)
+            return {'Rows': rows, 'Result': 'Success' if rows > 0 else 'No data'}
+        except Exception as e:
+            return {'Rows': 0, 'Result': str(e)}
+
+    def _record(self, partition, rows):
+        with FileLock(self.ledger):
+            completed = self.completed()
+            completed[_partition_key(partition)] = {'Rows': rows, 'Completed': pd.Timestamp.now(tz='UTC').isoformat()}
+            write_json(self.ledger, completed)
+
+
+def investigation_kwargs_from_job_parameters(job_parameters: dict) -> dict:
+    """
+    Converts the parameters of a scheduled deploy job into the arguments of
+    RunInvestigation
+
+    Parameters
+    ----------
+    job_parameters: dict
+        The job parameters as pushed by the Add-on, e.g. {'Input Signals':
+        {...}, 'Result Name': '...', 'AZ model name': '...', ...}. Parameters
+        that are not used by RunInvestigation, like 'Schedule', are ignored.
+
+    Returns
+    -------
+    kwargs: dict
+        Arguments of seeq.addons.azureml.backend.RunInvestigation
+    """
+    kwargs = {JOB_PARAMETERS[k]: v for k, v in job_parameters.items() if k in JOB_PARAMETERS and v is not None}
+    if 'az_model_version' in kwargs:
+        kwargs['az_model_version'] = str(kwargs['az_model_version'])
+    return kwargs
+
+
+def _partition_key(partition):
+    return f'{partition.start.isoformat()}/{partition.end.isoformat()}'
@@ -0,0 +1,137 @@
+import time
+import threading
+
+# minimum time between two consecutive decreases of the concurrency, so that a burst of throttled responses to
+# requests that were sent together only halves the concurrency once
+DECREASE_INTERVAL = 1.0
+
+_limiters = dict()
+_limiters_lock = threading.Lock()
+
+
+class InFlightLimiter:
+    """
+    Bounds the number of requests that are in flight at the same time against
+    a scoring URI. A single limiter is shared by all the investigations of
+    the process that score against the same URI.
+
+    The concurrency adapts to the endpoint with an additive-increase,
+    multiplicative-decrease (AIMD) policy: every successful request
+    increases the number of allowed requests by about one per round trip,
+    up to the limit, and a throttled request halves it.
+
+    Attributes
+    ----------
+    limit: int
+        Maximum number of requests allowed in flight at the same time
+    concurrency: float
+        Number of requests currently allowed in flight, between 1 and limit
+    in_flight: int
+        Number of requests currently in flight
+
+    Methods
+    -------
+    acquire()
+        Blocks until a request slot is available and takes it
+    release()
+        Gives back a request slot
+    on_success()
+        Increases the allowed concurrency after a successful request
+    on_throttle()
+        Halves the allowed concurrency after a throttled request
+    """
+
+    def __init__(self, limit: int) -> None:
+        """
+        Parameters
+        ----------
+        limit: int
+            Maximum number of requests allowed in flight at the same time
+        """
+        self._condition = threading.Condition()
+        self._limit = max(1, int(limit))
+        self._concurrency = float(self._limit)
+        self._in_flight = 0
+        self._last_decrease = 0.0
+
+    @property
+    def limit(self):
+        return self._limit
+
+    @limit.setter
+    def limit(self, value):
+        with self._condition:
+            self._limit = max(1, int(value))
+            self._concurrency = min(max(self._concurrency, 1.0), self._limit)
+            self._condition.notify_all()
+
+    @property
+    def concurrency(self):
+        return self._concurrency
+
+    @property
+    def in_flight(self):
+        return self._in_flight
+
+    def acquire(self):
+        with self._condition:
+            while self._in_flight >= int(self._concurrency):
+                self._condition.wait()
+            self._in_flight += 1
+
+    def release(self):
+        with self._condition:
+            self._in_flight -= 1
+            self._condition.notify()
+
+    def on_success(self):
+        with self._condition:
+            if self._concurrency < self._limit:
+                self._concurrency = min(self._limit, self._concurrency + 1.0 / self._concurrency)
+                self._condition.notify_all()
+
+    def on_throttle(self):
+        with self._condition:
+            now = time.monotonic()
+            if now - self._last_decrease < DECREASE_INTERVAL:
+                return
+            self._last_decrease = now
+            self._concurrency = max(1.0, self._concurrency / 2)
+
+    def __enter__(self):
+        self.acquire()
+        return self
+
+    def __exit__(self, *_):
+        self.release()
+
+
+def in_flight_limiter(uri: str, limit: int) -> InFlightLimiter:
+    """
+    Returns the limiter shared by all the requests to a scoring URI. The
+    limit of the shared limiter is the largest limit requested for the URI,
+    so a caller with a lower limit, e.g. a sequential investigation, does
+    not throttle the callers that score concurrently. Each caller bounds its
+    own requests, e.g. with the number of its scoring threads.
+
+    Parameters
+    ----------
+    uri: str
+        The scoring URI of the Azure ML endpoint
+    limit: int
+        Maximum number of requests the caller allows in flight against the
+        URI. The limit of the shared limiter is only raised, never lowered.
+
+    Returns
+    -------
+    limiter: seeq.addons.azureml.backend.InFlightLimiter
+        The limiter of the scoring URI
+    """
+    with _limiters_lock:
+        limiter = _limiters.get(uri)
+        if limiter is None:
+            limiter = InFlightLimiter(limit)
+            _limiters[uri] = limiter
+        elif limit > limiter.limit:
+            limiter.limit = limit
+        return limiter
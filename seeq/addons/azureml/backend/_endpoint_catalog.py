@@ -0,0 +1,299 @@
+import pickle
+import hashlib
+import threading
+import pandas as pd
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Callable, List, Union
+from seeq.addons.azureml import _config
+from seeq.addons.azureml.utils import FileLock, atomic_write, cache_path
+from ._aml_online_endpoint_service import AmlOnlineEndpointService
+from ._aml_response_models import OnlineEndpoint
+
+CATALOG_FOLDER = 'catalog'
+DEFAULT_TTL = pd.Timedelta(hours=1)
+# bumped when the stored objects change, so that catalogs written by older versions are discarded
+CATALOG_FORMAT = 2
+
+
+class EndpointCatalog:
+    """
+    A persistent catalog of the Seeq-tagged online endpoints of an Azure ML
+    workspace. The catalog is stored on disk per workspace, so the Add-on
+    can render the endpoints as soon as it opens and refresh them in the
+    background once the catalog is older than its time to live.
+
+    The catalog is built in two phases. A refresh only lists the endpoints
+    with their names and tags. The keys, deployments and models of an
+    endpoint are resolved when the endpoint is selected, and kept in the
+    catalog.
+
+    A refresh is incremental: the resolved details of an endpoint are kept
+    if its lastModifiedAt and its deployments did not change, and the
+    endpoints that were removed from the workspace are dropped. Only the
+    added and changed endpoints are resolved again.
+
+    The catalog holds the primary and secondary keys of the resolved
+    endpoints. Its file is only readable by the current user.
+
+    Attributes
+    ----------
+    endpoint_svc: seeq.addons.azureml.backend.AmlOnlineEndpointService
+        The service used to discover the endpoints of the workspace
+    path: Path
+        Path of the catalog file
+    ttl: pd.Timedelta
+        Age after which the catalog is refreshed
+    updated_at: pd.Timestamp
+        Time of the last discovery stored in the catalog, or None
+
+    Methods
+    -------
+    load()
+        Returns the stored endpoints, regardless of their age
+    is_stale()
+        Checks whether the catalog is missing or older than ttl
+    refresh(incremental, on_page)
+        Lists the endpoints and stores them
+    resolve(endpoint)
+        Attaches the keys, deployments and models to an endpoint
+    endpoints(on_page)
+        Returns the stored endpoints, discovering them if there are none
+    refresh_in_background(callback, incremental)
+        Refreshes the catalog in a background thread
+    """
+
+    def __init__(self, endpoint_svc: AmlOnlineEndpointService, path: Union[str, Path, None] = None,
+                 ttl: Union[str, pd.Timedelta, None] = None) -> None:
+        """
+        Parameters
+        ----------
+        endpoint_svc: seeq.addons.azureml.backend.AmlOnlineEndpointService
+            The service used to discover the endpoints of the workspace
+        path: str or Path, optional
+            Path of the catalog file. By default, a file per workspace in
+            ~/.seeq/azureml/catalog
+        ttl: str or pd.Timedelta, optional
+            Age after which the catalog is refreshed. If None, the
+            CATALOG_TTL_MINUTES option of the [cache] section of the
+            configuration file, or 1 hour.
+        """
+        self.endpoint_svc = endpoint_svc
+        if path is None:
+            key = hashlib.sha1(endpoint_svc.workspace_id.lower().encode()).hexdigest()
+            path = cache_path(CATALOG_FOLDER, f'{key}.pkl')
+        self.path = Path(path)
+        if ttl is None:
+            minutes = _config.get('cache', 'CATALOG_TTL_MINUTES')
+            ttl = DEFAULT_TTL if minutes is None or str(minutes).strip() == '' else pd.Timedelta(minutes=float(minutes))
+        self.ttl = pd.Timedelta(ttl)
+        self.updated_at = None
+        self._endpoints = None
+        self._resolved = set()
+        self._refresh_lock = threading.Lock()
+        self._resolve_lock = threading.Lock()
+        self._refresh_thread = None
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        del state['_refresh_lock'], state['_resolve_lock'], state['_refresh_thread']
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._refresh_lock = threading.Lock()
+        self._resolve_lock = threading.Lock()
+        self._refresh_thread = None
+
+    def load(self) -> Union[List[OnlineEndpoint], None]:
+        """
+        Returns the endpoints stored in the catalog, regardless of their age
+
+        Returns
+        -------
+        oes: list or None
+            List of OnlineEndpoint objects, or None if there is no catalog
+            for the workspace
+        """
+        try:
+            with open(self.path, 'rb') as f:
+                catalog = pickle.load(f)
+        except (OSError, EOFError, pickle.UnpicklingError, AttributeError, ImportError):
+            return None
+        if not isinstance(catalog, dict) or catalog.get('format') != CATALOG_FORMAT:
+            return None
+        self.updated_at = catalog['updated_at']
+        self._endpoints = catalog['endpoints']
+        self._resolved = set(catalog['resolved'])
+        return self._endpoints
+
+    def is_stale(self) -> bool:
+        """
+        Checks whether the catalog is missing or older than ttl
+
+        Returns
+        -------
+        stale: bool
+            True if the catalog should be refreshed
+        """
+        if self.updated_at is None and self.load() is None:
+            return True
+        return pd.Timestamp.now(tz='UTC') - self.updated_at > self.ttl
+
+    def refresh(self, incremental: bool = True,
+                on_page: Callable[[List[OnlineEndpoint]], None] = None) -> List[OnlineEndpoint]:
+        """
+        Lists the endpoints of the workspace with
+        AmlOnlineEndpointService.list_online_endpoints(details=False) and
+        stores them in the catalog
+
+        Parameters
+        ----------
+        incremental: bool, default True
+            If True, the resolved details of the endpoints whose
+            lastModifiedAt and deployments did not change are kept. The
+            deployments are listed again for the resolved endpoints only.
+            If False, the details of every endpoint are resolved again when
+            the endpoint is selected, e.g. after the keys of an endpoint
+            were regenerated.
+        on_page: callable, optional
+            Called with the endpoints of each page of the listings as soon as
+            the page is received. See
+            AmlOnlineEndpointService.list_online_endpoints.
+
+        Returns
+        -------
+        oes: list
+            List of OnlineEndpoint objects. Only the unchanged endpoints
+            have keys, deployments and models. See resolve.
+        """
+        with self._refresh_lock:
+            if self._endpoints is None:
+                self.load()
+            oes = self.endpoint_svc.list_online_endpoints(details=False, on_page=on_page)
+            with self._resolve_lock:
+                previous = {x.id: x for x in self._endpoints or list() if x.id in self._resolved}
+            candidates = [(oe, previous[oe.id]) for oe in oes if oe.id in previous and incremental and
+                          _same_listing(oe, previous[oe.id])]
+            with ThreadPoolExecutor(max_workers=self.endpoint_svc.max_workers) as executor:
+                reused = list(executor.map(self._reuse_details, candidates))
+            with self._resolve_lock:
+                self._endpoints = oes
+                self._resolved = {oe.id for (oe, _), ok in zip(candidates, reused) if ok}
+                self.updated_at = pd.Timestamp.now(tz='UTC')
+                self._save()
+            return oes
+
+    def resolve(self, endpoint: OnlineEndpoint) -> OnlineEndpoint:
+        """
+        Attaches the keys, deployments and models to an endpoint of the
+        catalog with AmlOnlineEndpointService.add_endpoint_details, unless
+        they were already resolved since the last refresh
+
+        Parameters
+        ----------
+        endpoint: seeq.addons.azureml.backend.OnlineEndpoint
+            An endpoint returned by the catalog
+
+        Returns
+        -------
+        endpoint: seeq.addons.azureml.backend.OnlineEndpoint
+            The same endpoint, with keys, deployments and models attached
+        """
+        with self._resolve_lock:
+            if endpoint.id in self._resolved:
+                return endpoint
+            self.endpoint_svc.add_endpoint_details(endpoint)
+            if self._endpoints is not None and any(x is endpoint for x in self._endpoints):
+                self._resolved.add(endpoint.id)
+                self._save()
+            return endpoint
+
+    def endpoints(self, on_page: Callable[[List[OnlineEndpoint]], None] = None) -> List[OnlineEndpoint]:
+        """
+        Returns the endpoints stored in the catalog, even if they are
+        stale. The endpoints are only discovered if there is no catalog for
+        the workspace yet.
+
+        Parameters
+        ----------
+        on_page: callable, optional
+            Called with the endpoints of each page of the listings if the
+            endpoints are discovered. See refresh.
+
+        Returns
+        -------
+        oes: list
+            List of OnlineEndpoint objects
+        """
+        oes = self.load()
+        return self.refresh(on_page=on_page) if oes is None else oes
+
+    def refresh_in_background(self, callback: Callable[[Union[List[OnlineEndpoint], None], Union[Exception, None]],
+                                                       None] = None, incremental: bool = True) -> threading.Thread:
+        """
+        Refreshes the catalog in a daemon thread. If a refresh is already
+        running, no other refresh is started.
+
+        Parameters
+        ----------
+        callback: callable, optional
+            Called from the background thread with the refreshed endpoints
+            and None, or with None and the exception raised by the refresh
+        incremental: bool, default True
+            See refresh
+
+        Returns
+        -------
+        thread: threading.Thread
+            The thread running the refresh
+        """
+        if self._refresh_thread is not None and self._refresh_thread.is_alive():
+            return self._refresh_thread
+
+        def target():
+            try:
+                oes = self.refresh(incremental=incremental)
+            except Exception as e:
+                if callback is not None:
+                    callback(None, e)
+                return
+            if callback is not None:
+                callback(oes, None)
+
+        self._refresh_thread = threading.Thread(target=target, name='endpoint-catalog-refresh', daemon=True)
+        self._refresh_thread.start()
+        return self._refresh_thread
+
+    def _reuse_details(self, candidate):
+        oe, previous = candidate
+        if oe.kind == "Managed":
+            # the deployments that serve the endpoint, as attached by the service
+            listed = OnlineEndpoint(oe.name, oe.id)
+            listed.traffic = oe.traffic
+            for d in self.endpoint_svc.list_deployments(oe):
+                listed.add_deployment(d)
+            deployments = listed.deployment
+        else:
+            deployments = oe.deployment
+        if _deployment_keys(deployments) != _deployment_keys(previous.deployment):
+            return False
+        oe.deployment = previous.deployment
+        oe.primaryKey = previous.primaryKey
+        oe.secondaryKey = previous.secondaryKey
+        return True
+
+    def _save(self):
+        catalog = {'format': CATALOG_FORMAT, 'updated_at': self.updated_at, 'endpoints': self._endpoints,
+                   'resolved': sorted(self._resolved)}
+        with FileLock(self.path):
+            atomic_write(self.path, pickle.dumps(catalog, protocol=pickle.HIGHEST_PROTOCOL))
+
+
+def _same_listing(oe, previous):
+    return (oe.lastModifiedAt, oe.scoringUri, oe.kind, oe.traffic) == \
+           (previous.lastModifiedAt, previous.scoringUri, previous.kind, previous.traffic)
+
+
+def _deployment_keys(deployments):
+    return [(d.id, d.name, d.modelId) for d in deployments]
@@ -0,0 +1,267 @@
+import hashlib
+import threading
+import pandas as pd
+from pathlib import Path
+from typing import Callable, List, Union
+from seeq.addons.azureml import _config
+from seeq.addons.azureml.utils import LruStore, cache_path
+
+INPUTS_FOLDER = 'inputs'
+DEFAULT_MEMORY_BUDGET = 256 * 1024 ** 2
+DEFAULT_DISK_BUDGET = 2 * 1024 ** 3
+# the keys of the chunks are the key of their index, this separator and a hash of their interval
+CHUNK_SEPARATOR = '-'
+# estimated bytes in memory of each chunk listed in an index
+INDEX_ENTRY_SIZE = 256
+
+
+class InputDataCache:
+    """
+    A local cache of the input data pulled from Seeq. Each pulled time
+    interval is stored as its own chunk, per set of signal IDs and grid,
+    and a small index lists the chunks of each set of signals. A request
+    only reads the chunks that overlap its range and only pulls from Seeq
+    the sub-intervals that are not cached yet. The chunks that are already
+    cached are never written again.
+
+    The chunks are kept in memory and on disk, each with a budget in bytes.
+    When a budget is exceeded, the least recently used chunks are evicted,
+    and their intervals are pulled again by the next request.
+
+    The most recent data can still change in Seeq, e.g. when samples arrive
+    late or an interpolated grid sample gets a new neighbour. The interval
+    within one grid period of the time of the pull is therefore never marked
+    as cached, and it is pulled again by the next request.
+
+    Attributes
+    ----------
+    directory: Path
+        The folder of the cache files on disk
+    memory_budget: int
+        Maximum number of bytes of the chunks kept in memory
+    disk_budget: int
+        Maximum number of bytes of the cache files on disk. If 0, the cache
+        only lives in memory.
+
+    Methods
+    -------
+    pull(signal_ids, start, end, grid, puller)
+        Returns the data of the signals, pulling only what is not cached
+    intervals(signal_ids, grid)
+        Returns the time intervals cached for a set of signals and a grid
+    invalidate(signal_ids)
+        Removes the cached data of the signals
+    clear()
+        Removes all the cached data
+    """
+
+    def __init__(self, directory: Union[str, Path, None] = None, memory_budget: Union[int, None] = None,
+                 disk_budget: Union[int, None] = None) -> None:
+        """
+        Parameters
+        ----------
+        directory: str or Path, optional
+            The folder of the cache files. By default, ~/.seeq/azureml/inputs
+        memory_budget: int, optional
+            Maximum number of bytes of the chunks kept in memory. If None,
+            the INPUT_MEMORY_MB option of the [cache] section of the
+            configuration file, or 256 MB.
+        disk_budget: int, optional
+            Maximum number of bytes of the cache files on disk. If None, the
+            INPUT_DISK_MB option of the [cache] section of the
+            configuration file, or 2 GB. Use 0 to disable the disk cache.
+        """
+        self.directory = cache_path(INPUTS_FOLDER) if directory is None else Path(directory)
+        self.memory_budget = _budget(memory_budget, 'INPUT_MEMORY_MB', DEFAULT_MEMORY_BUDGET)
+        self.disk_budget = _budget(disk_budget, 'INPUT_DISK_MB', DEFAULT_DISK_BUDGET)
+        self._store = LruStore(self.directory, self.memory_budget, self.disk_budget)
+        # only guards the read-modify-write of the indexes. The chunks are read, pulled and written without it
+        self._lock = threading.Lock()
+
+    def pull(self, signal_ids: List[str], start: pd.Timestamp, end: pd.Timestamp, grid: str,
+             puller: Callable[[pd.Timestamp, pd.Timestamp], pd.DataFrame]) -> pd.DataFrame:
+        """
+        Returns the data of the signals between start and end, pulling from
+        Seeq only the sub-intervals that are not cached yet
+
+        Parameters
+        ----------
+        signal_ids: list
+            The Seeq IDs of the signals
+        start: pd.Timestamp
+            Start of the requested range. It must have a timezone.
+        end: pd.Timestamp
+            End of the requested range, inclusive. It must have a timezone.
+        grid: str
+            The grid of the pulled data, e.g. '5 min'
+        puller: callable
+            A function that takes a start and an end and pulls the signals
+            from Seeq, e.g. with spy.pull. It must return a DataFrame with
+            the signal IDs as columns.
+
+        Returns
+        -------
+        data: pd.DataFrame
+            The data of the signals between start and end with the signal
+            IDs as columns, in the timezone of start
+        """
+        key = _entry_key(signal_ids, grid)
+        start_utc, end_utc = start.tz_convert('UTC'), end.tz_convert('UTC')
+        with self._lock:
+            index = self._store.get(key)
+        chunks = list() if index is None else \
+            [x for x in index['chunks'] if x[0] <= end_utc and x[1] >= start_utc]
+
+        # chunks evicted by the budgets are pulled again
+        frames = list()
+        cached = list()
+        evicted = set()
+        for c_start, c_end, c_key in chunks:
+            frame = self._store.get(c_key)
+            if frame is None:
+                evicted.add(c_key)
+            else:
+                frames.append(frame)
+                cached.append((c_start, c_end))
+        missing = _subtract(_union(cached), start_utc, end_utc)
+
+        # the pulls run without the lock, so windows of the same investigation can be pulled concurrently
+        pulled = list()
+        for m_start, m_end in missing:
+            pulled_at = pd.Timestamp.now(tz='UTC')
+            frame = _utc_frame(puller(m_start.tz_convert(start.tz), m_end.tz_convert(start.tz)), signal_ids)
+            c_end = min(m_end, pulled_at - pd.Timedelta(grid))
+            if c_end >= m_start:
+                chunk = frame[(frame.index >= m_start) & (frame.index <= c_end)]
+                c_key = _chunk_key(key, m_start, c_end)
+                self._store.put(c_key, chunk, int(chunk.memory_usage(index=True).sum()))
+                pulled.append((m_start, c_end, c_key))
+            # the freshly pulled rows replace the cached ones at the boundaries of the intervals
+            frames.insert(0, frame)
+
+        if len(pulled) > 0 or len(evicted) > 0:
+            with self._lock:
+                index = self._store.get(key)
+                # a new index is stored, since other threads may still read the chunks of the one in memory
+                kept = list() if index is None else [x for x in index['chunks'] if x[2] not in evicted]
+                known = {x[2] for x in kept}
+                index = {'signal_ids': sorted(signal_ids),
+                         'chunks': sorted(kept + [x for x in pulled if x[2] not in known])}
+                self._store.put(key, index, INDEX_ENTRY_SIZE * (len(index['chunks']) + 1))
+
+        frames = [x for x in frames if len(x) > 0]
+        if len(frames) == 0:
+            return _utc_frame(pd.DataFrame(), signal_ids).tz_convert(start.tz)
+        data = pd.concat(frames)
+        data = data[~data.index.duplicated(keep='first')].sort_index()
+        data = data.loc[(data.index >= start_utc) & (data.index <= end_utc), list(signal_ids)]
+        return data.tz_convert(start.tz)
+
+    def intervals(self, signal_ids: List[str], grid: str) -> list:
+        """
+        Returns the time intervals cached for a set of signals and a grid
+
+        Parameters
+        ----------
+        signal_ids: list
+            The Seeq IDs of the signals
+        grid: str
+            The grid of the pulled data
+
+        Returns
+        -------
+        intervals: list
+            List of (start, end) tuples of UTC timestamps in time order
+        """
+        index = self._store.get(_entry_key(signal_ids, grid))
+        return list() if index is None else _union([(x[0], x[1]) for x in index['chunks']])
+
+    def invalidate(self, signal_ids: List[str]):
+        """
+        Removes the cached data of every set of signals that includes any of
+        the signals, e.g. after the signals were edited in Seeq
+
+        Parameters
+        ----------
+        signal_ids: list
+            The Seeq IDs of the signals
+
+        Returns
+        -------
+        -: None
+        """
+        ids = set(signal_ids)
+        with self._lock:
+            # only the indexes are read. Their chunks are removed with them
+            for key in [x for x in self._store.keys() if CHUNK_SEPARATOR not in x]:
+                index = self._store.get(key)
+                if index is not None and ids & set(index['signal_ids']):
+                    for chunk in index['chunks']:
+                        self._store.remove(chunk[2])
+                    self._store.remove(key)
+
+    def clear(self):
+        """
+        Removes all the cached data from memory and disk
+
+        Returns
+        -------
+        -: None
+        """
+        self._store.clear()
+
+
+def _budget(value, option, default):
+    if value is None:
+        value = _config.get('cache', option)
+        if value is None or str(value).strip() == '':
+            return default
+        value = float(value) * 1024 ** 2
+    value = int(value)
+    if value < 0:
+        raise ValueError(f"The cache budget must be a non-negative number of bytes. Got {value}")
+    return value
+
+
+def _entry_key(signal_ids, grid):
+    s = '|'.join(sorted(signal_ids) + [str(pd.Timedelta(grid))])
+    return hashlib.sha1(s.encode()).hexdigest()
+
+
+def _chunk_key(key, start, end):
+    return f"{key}{CHUNK_SEPARATOR}{hashlib.sha1(f'{start.value}|{end.value}'.encode()).hexdigest()}"
+
+
+def _utc_frame(frame, signal_ids):
+    if len(frame) == 0:
+        return pd.DataFrame(columns=list(signal_ids), index=pd.DatetimeIndex([], tz='UTC'), dtype=float)
+    frame = frame.copy()
+    frame.index = frame.index.tz_convert('UTC') if frame.index.tz is not None else frame.index.tz_localize('UTC')
+    return frame
+
+
+def _subtract(intervals, start, end):
+    missing = list()
+    cursor = start
+    for i_start, i_end in intervals:
+        if i_end < cursor:
+            continue
+        if i_start > end:
+            break
+        if i_start > cursor:
+            missing.append((cursor, i_start))
+        cursor = max(cursor, i_end)
+        if cursor >= end:
+            return missing
+    missing.append((cursor, end))
+    return missing
+
+
+def _union(intervals):
+    merged = list()
+    for i_start, i_end in sorted(intervals):
+        if merged and i_start <= merged[-1][1]:
+            merged[-1] = (merged[-1][0], max(merged[-1][1], i_end))
+        else:
+            merged.append((i_start, i_end))
+    return merged
@@ -0,0 +1,139 @@
+import json
+import hashlib
+import pandas as pd
+from pathlib import Path
+from typing import Union
+from seeq.addons.azureml.utils import FileLock, cache_path, read_json, write_json
+
+PUSHED_SIGNALS_FILE = 'pushed_signals.json'
+
+
+class MetadataFingerprintCache:
+    """
+    Persists, per result signal, a fingerprint of the metadata and worksheet
+    last pushed to Seeq together with the Seeq IDs of the pushed signals.
+    When the fingerprint of the next push is the same, e.g. for every run of
+    a scheduled job, only the samples are pushed to the known signal IDs and
+    the metadata and worksheet updates are skipped. The cache is a JSON file
+    protected by a file lock, so it can be shared by the jobs running in
+    different processes.
+
+    Attributes
+    ----------
+    path: Path
+        Path of the JSON file with the fingerprints
+
+    Methods
+    -------
+    fingerprint(metadata, workbook, worksheet, datasource)
+        Returns the fingerprint of a push
+    get(key)
+        Returns the fingerprint and the signal IDs of a result signal
+    put(key, fingerprint, ids, data_ids)
+        Stores the fingerprint and the signal IDs of a result signal
+    invalidate(key)
+        Removes the fingerprint of a result signal
+    """
+
+    def __init__(self, path: Union[str, Path, None] = None) -> None:
+        """
+        Parameters
+        ----------
+        path: str or Path, optional
+            Path of the JSON file with the fingerprints. By default,
+            ~/.seeq/azureml/pushed_signals.json
+        """
+        self.path = cache_path(PUSHED_SIGNALS_FILE) if path is None else Path(path)
+
+    @staticmethod
+    def fingerprint(metadata: pd.DataFrame, workbook: Union[str, None], worksheet: Union[str, None],
+                    datasource: Union[str, None]) -> str:
+        """
+        Returns the fingerprint of a push
+
+        Parameters
+        ----------
+        metadata: pd.DataFrame
+            The metadata of the pushed signals
+        workbook: str
+            The workbook the signals are scoped to
+        worksheet: str
+            The worksheet updated by the push
+        datasource: str
+            The datasource of the signals
+
+        Returns
+        -------
+        fingerprint: str
+            A fingerprint that changes with any metadata property, the
+            workbook, the worksheet or the datasource
+        """
+        records = metadata.astype(str).to_dict(orient='index')
+        s = json.dumps([records, workbook, worksheet, datasource], sort_keys=True, default=str)
+        return hashlib.sha1(s.encode()).hexdigest()
+
+    def get(self, key: str) -> Union[dict, None]:
+        """
+        Returns the fingerprint, the signal IDs and the data IDs of a result
+        signal
+
+        Parameters
+        ----------
+        key: str
+            The key of the result signal, see RunInvestigation.watermark_key
+
+        Returns
+        -------
+        entry: dict or None
+            A dict with the 'Fingerprint' of the last push, the Seeq 'IDs'
+            of the signals by data ID and the 'Data IDs' they were pushed
+            with, or None if the result signal has not been pushed with the
+            cache
+        """
+        return read_json(self.path, default=dict()).get(key)
+
+    def put(self, key: str, fingerprint: str, ids: dict, data_ids: Union[dict, None] = None):
+        """
+        Stores the fingerprint, the signal IDs and the data IDs of a result
+        signal
+
+        Parameters
+        ----------
+        key: str
+            The key of the result signal
+        fingerprint: str
+            The fingerprint of the push, see fingerprint
+        ids: dict
+            The Seeq IDs of the pushed signals, with their data IDs as keys
+        data_ids: dict, optional
+            The data IDs the signals were pushed with, when they differ from
+            their keys, e.g. for signals pushed by older versions of the
+            Add-on
+
+        Returns
+        -------
+        -: None
+        """
+        with FileLock(self.path):
+            entries = read_json(self.path, default=dict())
+            entries[key] = {'Fingerprint': fingerprint, 'IDs': dict(ids), 'Data IDs': dict(data_ids or dict())}
+            write_json(self.path, entries)
+
+    def invalidate(self, key: str):
+        """
+        Removes the fingerprint of a result signal, so that the next push
+        writes the metadata and the worksheet again
+
+        Parameters
+        ----------
+        key: str
+            The key of the result signal
+
+        Returns
+        -------
+        -: None
+        """
+        with FileLock(self.path):
+            entries = read_json(self.path, default=dict())
+            if entries.pop(key, None) is not None:
+                write_json(self.path, entries)
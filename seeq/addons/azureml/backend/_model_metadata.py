@@ -0,0 +1,128 @@
+import hashlib
+from pathlib import Path
+from typing import Union
+from seeq.addons.azureml.utils import cache_path, read_json, write_json
+from ._aml_response_models import AmlModel
+
+MODELS_FOLDER = 'models'
+
+
+class ModelMetadataCache:
+    """
+    A permanent local cache of the metadata of the Azure ML models. A model
+    registered at a given name and version never changes, so its metadata
+    is requested from the model management API once and then read from the
+    cache by every deployment that serves the same model version, in every
+    process of the host.
+
+    The cache keeps the responses of the model management API, one JSON
+    file per model version, and deserializes them into new AmlModel
+    objects.
+
+    Attributes
+    ----------
+    directory: Path
+        The folder of the cache files
+
+    Methods
+    -------
+    is_cacheable(model_id)
+        Checks whether a model ID refers to an immutable model version
+    get(model_id)
+        Returns the metadata of a model version
+    put(model_id, response)
+        Stores the metadata of a model version
+    clear()
+        Removes all the cached metadata
+    """
+
+    def __init__(self, directory: Union[str, Path, None] = None) -> None:
+        """
+        Parameters
+        ----------
+        directory: str or Path, optional
+            The folder of the cache files. By default, ~/.seeq/azureml/models
+        """
+        self.directory = cache_path(MODELS_FOLDER) if directory is None else Path(directory)
+        self._responses = dict()
+
+    @staticmethod
+    def is_cacheable(model_id: str) -> bool:
+        """
+        Checks whether a model ID refers to an immutable model version
+
+        Parameters
+        ----------
+        model_id: str
+            The asset ID of the model, e.g.
+            '/subscriptions/.../workspaces/<workspace>/models/<name>/versions/<version>'
+
+        Returns
+        -------
+        cacheable: bool
+            True if the model ID includes an explicit version
+        """
+        return model_id is not None and model_id.rstrip('/').rsplit('/', 2)[-2:-1] == ['versions']
+
+    def get(self, model_id: str) -> Union[AmlModel, None]:
+        """
+        Returns the metadata of a model version
+
+        Parameters
+        ----------
+        model_id: str
+            The asset ID of the model version
+
+        Returns
+        -------
+        model: seeq.addons.azureml.backend.AmlModel or None
+            A new AmlModel object, or None if the model version is not cached
+        """
+        key = _model_key(model_id)
+        response = self._responses.get(key)
+        if response is None:
+            response = read_json(self.directory.joinpath(f'{key}.json'))
+            if response is None:
+                return None
+            self._responses[key] = response
+        return AmlModel.deserialize_aml_model_response(response)
+
+    def put(self, model_id: str, response: dict):
+        """
+        Stores the metadata of a model version. Model IDs without an explicit
+        version are not stored.
+
+        Parameters
+        ----------
+        model_id: str
+            The asset ID of the model version
+        response: dict
+            The response of the model management API for the model version
+
+        Returns
+        -------
+        -: None
+        """
+        if not self.is_cacheable(model_id):
+            return
+        key = _model_key(model_id)
+        self._responses[key] = response
+        write_json(self.directory.joinpath(f'{key}.json'), response)
+
+    def clear(self):
+        """
+        Removes all the cached metadata from memory and disk
+
+        Returns
+        -------
+        -: None
+        """
+        self._responses.clear()
+        if self.directory.is_dir():
+            for file in self.directory.glob('*.json'):
+                file.unlink()
+
+
+def _model_key(model_id):
+    # Azure resource IDs are case-insensitive
+    return hashlib.sha1(model_id.rstrip('/').lower().encode()).hexdigest()
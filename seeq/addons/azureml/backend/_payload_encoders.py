@@ -0,0 +1,198 @@
+import io
+import abc
+import gzip
+import json
+import numpy as np
+import pandas as pd
+from typing import Tuple
+
+DEFAULT_PAYLOAD_FORMAT = 'iso'
+GZIP_SUFFIX = '+gzip'
+
+
+class PayloadEncoder(abc.ABC):
+    """
+    Serializes the input data of a scoring request. The encoder is selected
+    with the `PayloadFormat` tag of the Azure ML model, so the scoring script
+    of the model must be able to decode the chosen format.
+
+    Attributes
+    ----------
+    name: str
+        Name of the payload format, as used in the `PayloadFormat` tag
+    content_type: str
+        Value of the Content-Type header of the request
+
+    Methods
+    -------
+    encode(data)
+        Returns the body and the extra headers of the scoring request
+    """
+    name = None
+    content_type = 'application/json'
+
+    @abc.abstractmethod
+    def encode(self, data: pd.DataFrame) -> Tuple[bytes, dict]:
+        """
+        Parameters
+        ----------
+        data: pd.DataFrame
+            A DataFrame with timestamps as Index and input signals as columns
+
+        Returns
+        -------
+        body, headers: tuple (bytes, dict)
+            The request body and the headers, other than the Authorization,
+            that describe it
+        """
+
+
+class IsoJsonEncoder(PayloadEncoder):
+    """
+    Column-oriented JSON with ISO 8601 timestamps, e.g.
+    `{"Temperature": {"2021-12-06T20:14:00.000Z": 10.2, ...}, ...}`.
+    This is the format expected by the existing scoring scripts.
+    """
+    name = 'iso'
+
+    def encode(self, data):
+        return data.to_json(date_format='iso').encode(), {'Content-Type': self.content_type}
+
+
+class SplitJsonEncoder(PayloadEncoder):
+    """
+    Columnar JSON with epoch-millisecond timestamps, e.g.
+    `{"columns": [...], "index": [1638821640000, ...], "data": [[...], ...]}`.
+    The payload can be read with `pd.read_json(body, orient='split')`.
+    """
+    name = 'split'
+
+    def encode(self, data):
+        body = data.to_json(orient='split', date_format='epoch', date_unit='ms')
+        return body.encode(), {'Content-Type': self.content_type}
+
+
+class GridJsonEncoder(PayloadEncoder):
+    """
+    Columnar JSON with implicit timestamps on a regular grid, e.g.
+    `{"columns": [...], "start": 1638821640000, "period": 120000, "data": [[...], ...]}`.
+    The timestamp of row i is `start + i * period`, in epoch milliseconds.
+    If the rows are not evenly spaced, e.g. because samples with missing
+    values were dropped, the payload falls back to the 'split' format with
+    an explicit "index".
+    """
+    name = 'grid'
+
+    def encode(self, data):
+        stamps = _epoch_ms(data.index)
+        steps = np.diff(stamps)
+        if len(stamps) > 1 and (steps != steps[0]).any():
+            return SplitJsonEncoder().encode(data)
+        payload = {
+            'columns': [str(c) for c in data.columns],
+            'start': int(stamps[0]) if len(stamps) > 0 else None,
+            'period': int(steps[0]) if len(steps) > 0 else None,
+            'data': data.values.tolist()
+        }
+        return json.dumps(payload).encode(), {'Content-Type': self.content_type}
+
+
+class NpyEncoder(PayloadEncoder):
+    """
+    A NumPy `.npy` float64 array whose first column holds the epoch
+    millisecond timestamps and whose remaining columns hold the input
+    signals. The names of the input signals are sent as a JSON list in the
+    `X-Seeq-Columns` header. The payload can be read with
+    `np.load(io.BytesIO(body))`.
+    """
+    name = 'npy'
+    content_type = 'application/octet-stream'
+
+    def encode(self, data):
+        array = np.column_stack([_epoch_ms(data.index).astype('float64'), data.values.astype('float64')])
+        buffer = io.BytesIO()
+        np.save(buffer, array, allow_pickle=False)
+        return buffer.getvalue(), {'Content-Type': self.content_type,
+                                   'X-Seeq-Columns': json.dumps([str(c) for c in data.columns])}
+
+
+class ArrowEncoder(PayloadEncoder):
+    """
+    An Apache Arrow IPC stream with a 'timestamp' column in UTC followed by
+    the input signals. It requires the optional `pyarrow` package.
+    """
+    name = 'arrow'
+    content_type = 'application/vnd.apache.arrow.stream'
+
+    def encode(self, data):
+        try:
+            import pyarrow as pa
+        except ImportError:
+            raise ImportError("The 'arrow' payload format requires the pyarrow package. "
+                              "Install it with `pip install pyarrow`")
+        frame = data.copy()
+        frame.columns = [str(c) for c in frame.columns]
+        frame.index = pd.to_datetime(frame.index, utc=True)
+        frame.index.name = 'timestamp'
+        table = pa.Table.from_pandas(frame.reset_index(), preserve_index=False)
+        sink = pa.BufferOutputStream()
+        with pa.ipc.new_stream(sink, table.schema) as writer:
+            writer.write_table(table)
+        return sink.getvalue().to_pybytes(), {'Content-Type': self.content_type}
+
+
+class GzipEncoder(PayloadEncoder):
+    """
+    Compresses the body of another encoder and sets the `Content-Encoding`
+    header. It is selected by appending '+gzip' to the payload format, e.g.
+    'split+gzip'.
+    """
+
+    def __init__(self, encoder: PayloadEncoder) -> None:
+        self.encoder = encoder
+        self.name = f'{encoder.name}{GZIP_SUFFIX}'
+        self.content_type = encoder.content_type
+
+    def encode(self, data):
+        body, headers = self.encoder.encode(data)
+        headers['Content-Encoding'] = 'gzip'
+        return gzip.compress(body, compresslevel=5), headers
+
+
+PAYLOAD_ENCODERS = {x.name: x for x in [IsoJsonEncoder, SplitJsonEncoder, GridJsonEncoder, NpyEncoder, ArrowEncoder]}
+
+
+def get_payload_encoder(payload_format=None) -> PayloadEncoder:
+    """
+    Returns the encoder of a payload format
+
+    Parameters
+    ----------
+    payload_format: str, default 'iso'
+        One of 'iso', 'split', 'grid', 'npy' or 'arrow', optionally followed
+        by '+gzip' to compress the request body. If None, the default 'iso'
+        format is used.
+
+    Returns
+    -------
+    encoder: seeq.addons.azureml.backend.PayloadEncoder
+        The encoder of the payload format
+    """
+    if payload_format is None or payload_format == '':
+        payload_format = DEFAULT_PAYLOAD_FORMAT
+    name = payload_format.strip().lower()
+    compressed = name.endswith(GZIP_SUFFIX)
+    if compressed:
+        name = name[:-len(GZIP_SUFFIX)]
+    if name not in PAYLOAD_ENCODERS:
+        raise ValueError(f'Payload format "{payload_format}" is not supported. Valid formats are '
+                         f'{list(PAYLOAD_ENCODERS.keys())}, optionally followed by "{GZIP_SUFFIX}"')
+    encoder = PAYLOAD_ENCODERS[name]()
+    return GzipEncoder(encoder) if compressed else encoder
+
+
+def _epoch_ms(index: pd.DatetimeIndex) -> np.ndarray:
+    index = pd.DatetimeIndex(index)
+    if index.tz is None:
+        index = index.tz_localize('UTC')
+    return np.asarray((index - pd.Timestamp(0, tz='UTC')) // pd.Timedelta(milliseconds=1), dtype='int64')
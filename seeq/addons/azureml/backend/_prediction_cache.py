@@ -0,0 +1,168 @@
+import hashlib
+import pandas as pd
+from pathlib import Path
+from typing import Union
+from seeq.addons.azureml.utils import LruStore, cache_path
+from ._input_cache import _budget
+
+PREDICTIONS_FOLDER = 'predictions'
+DEFAULT_MEMORY_BUDGET = 64 * 1024 ** 2
+DEFAULT_DISK_BUDGET = 512 * 1024 ** 2
+
+
+class PredictionCache:
+    """
+    A local cache of the predictions returned by the Azure ML endpoints. The
+    predictions are keyed by the model name and version, a fingerprint of
+    the input data sent to the endpoint and the payload format, so scoring
+    the same model version on the same inputs again does not call the
+    endpoint.
+
+    The predictions are kept in memory and on disk, each with a budget in
+    bytes. When a budget is exceeded, the least recently used predictions
+    are evicted.
+
+    Attributes
+    ----------
+    directory: Path
+        The folder of the cache files on disk
+    memory_budget: int
+        Maximum number of bytes of the predictions kept in memory
+    disk_budget: int
+        Maximum number of bytes of the cache files on disk. If 0, the cache
+        only lives in memory.
+
+    Methods
+    -------
+    key(model_name, model_version, data, payload_format)
+        Returns the cache key of a scoring request
+    get(key)
+        Returns the cached predictions of a key
+    put(key, prediction, model_name, model_version)
+        Stores the predictions of a key
+    invalidate(model_name, model_version)
+        Removes the cached predictions of a model
+    clear()
+        Removes all the cached predictions
+    """
+
+    def __init__(self, directory: Union[str, Path, None] = None, memory_budget: Union[int, None] = None,
+                 disk_budget: Union[int, None] = None) -> None:
+        """
+        Parameters
+        ----------
+        directory: str or Path, optional
+            The folder of the cache files. By default,
+            ~/.seeq/azureml/predictions
+        memory_budget: int, optional
+            Maximum number of bytes of the predictions kept in memory. If
+            None, the PREDICTION_MEMORY_MB option of the [cache] section of
+            the configuration file, or 64 MB.
+        disk_budget: int, optional
+            Maximum number of bytes of the cache files on disk. If None, the
+            PREDICTION_DISK_MB option of the [cache] section of the
+            configuration file, or 512 MB. Use 0 to disable the disk cache.
+        """
+        self.directory = cache_path(PREDICTIONS_FOLDER) if directory is None else Path(directory)
+        self.memory_budget = _budget(memory_budget, 'PREDICTION_MEMORY_MB', DEFAULT_MEMORY_BUDGET)
+        self.disk_budget = _budget(disk_budget, 'PREDICTION_DISK_MB', DEFAULT_DISK_BUDGET)
+        self._store = LruStore(self.directory, self.memory_budget, self.disk_budget)
+
+    @staticmethod
+    def key(model_name: str, model_version: str, data: pd.DataFrame, payload_format: Union[str, None] = None) -> str:
+        """
+        Returns the cache key of a scoring request
+
+        Parameters
+        ----------
+        model_name: str
+            Name of the Azure ML model
+        model_version: str
+            Version of the Azure ML model
+        data: pd.DataFrame
+            The input data sent to the endpoint. Its fingerprint covers the
+            timestamps, the values and the column names.
+        payload_format: str, optional
+            The payload format of the request
+
+        Returns
+        -------
+        key: str
+            The cache key
+        """
+        h = hashlib.sha1()
+        h.update('|'.join([str(model_name), str(model_version), str(payload_format or '')]).encode())
+        h.update('|'.join(str(x) for x in data.columns).encode())
+        h.update(pd.util.hash_pandas_object(data, index=True).values.tobytes())
+        return h.hexdigest()
+
+    def get(self, key: str) -> Union[pd.DataFrame, None]:
+        """
+        Returns the cached predictions of a key
+
+        Parameters
+        ----------
+        key: str
+            The cache key, see PredictionCache.key
+
+        Returns
+        -------
+        prediction: pd.DataFrame or None
+            A copy of the cached predictions, or None on a cache miss
+        """
+        entry = self._store.get(key)
+        return None if entry is None else entry['prediction'].copy()
+
+    def put(self, key: str, prediction: pd.DataFrame, model_name: str, model_version: str):
+        """
+        Stores the predictions of a key
+
+        Parameters
+        ----------
+        key: str
+            The cache key, see PredictionCache.key
+        prediction: pd.DataFrame
+            The predictions returned by the endpoint
+        model_name: str
+            Name of the Azure ML model, used by invalidate
+        model_version: str
+            Version of the Azure ML model, used by invalidate
+
+        Returns
+        -------
+        -: None
+        """
+        entry = {'model_name': model_name, 'model_version': str(model_version), 'prediction': prediction.copy()}
+        self._store.put(key, entry, int(prediction.memory_usage(index=True).sum()))
+
+    def invalidate(self, model_name: str, model_version: Union[str, None] = None):
+        """
+        Removes the cached predictions of a model, e.g. after a model version
+        was re-registered with different weights
+
+        Parameters
+        ----------
+        model_name: str
+            Name of the Azure ML model
+        model_version: str, optional
+            Version of the Azure ML model. If None, the predictions of all
+            the versions are removed.
+
+        Returns
+        -------
+        -: None
+        """
+        for key, entry in self._store.items():
+            if entry['model_name'] == model_name and (model_version is None or
+                                                      entry['model_version'] == str(model_version)):
+                self._store.remove(key)
+
+    def clear(self):
+        """
+        Removes all the cached predictions from memory and disk
+
+        Returns
+        -------
+        -: None
+        """
+        self._store.clear()
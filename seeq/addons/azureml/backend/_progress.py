@@ -0,0 +1,130 @@
+import threading
+from typing import Union
+from seeq.addons.azureml.utils import InvestigationCanceled
+
+
+class ProgressEvent:
+    """
+    A progress event emitted by seeq.addons.azureml.backend.RunInvestigation.
+    Each stage emits a 'start' event when it begins and an 'end' event when it
+    is done. The 'run' stage spans a whole call to run(), the 'pull' and
+    'score' stages are emitted for each scoring window, and the 'push' stage
+    spans push_to_seeq().
+
+    Attributes
+    ----------
+    stage: {'run', 'pull', 'score', 'push'}
+        The stage of the investigation
+    kind: {'start', 'end'}
+        Whether the stage begins or is done
+    window: int
+        Index of the scoring window of a 'pull' or 'score' stage, None for
+        the other stages
+    windows: int
+        Number of scoring windows of the investigation
+    rows: int
+        Number of rows pulled, scored or pushed by the stage. 0 for the
+        'start' events.
+    bytes: int
+        Number of bytes pulled from Seeq, sent to the endpoint or pushed to
+        Seeq by the stage. 0 for the 'start' events and for windows whose
+        predictions were read from the prediction cache.
+    elapsed: float
+        Seconds since run() started
+    duration: float
+        Seconds since the 'start' event of the stage. 0 for the 'start'
+        events.
+    """
+
+    def __init__(self, stage: str, kind: str, window: Union[int, None] = None, windows: int = 0, rows: int = 0,
+                 nbytes: int = 0, elapsed: float = 0, duration: float = 0) -> None:
+        self.stage = stage
+        self.kind = kind
+        self.window = window
+        self.windows = windows
+        self.rows = rows
+        self.bytes = nbytes
+        self.elapsed = elapsed
+        self.duration = duration
+
+    def __repr__(self):
+        window = '' if self.window is None else f' window {self.window + 1}/{self.windows}'
+        return f'ProgressEvent({self.stage} {self.kind}{window}, {self.rows} rows, {self.bytes} bytes, ' \
+               f'{self.elapsed:.3f}s)'
+
+
+class CancellationToken:
+    """
+    A token used to stop a running investigation from another thread, e.g.
+    from the cancel button of the Add-on UI or from an orchestration job
+    with a deadline. The investigation checks the token between its stages
+    and its scoring windows: the work in progress is finished, the windows
+    that are not started yet are canceled, and an InvestigationCanceled
+    exception is raised.
+
+    A token can be shared by several investigations to stop all of them.
+
+    Methods
+    -------
+    cancel()
+        Requests the cancellation
+    is_set()
+        Checks whether the cancellation was requested
+    wait(timeout)
+        Waits until the cancellation is requested or the timeout expires
+    raise_if_canceled()
+        Raises InvestigationCanceled if the cancellation was requested
+    """
+
+    def __init__(self) -> None:
+        self._event = threading.Event()
+
+    def cancel(self):
+        """
+        Requests the cancellation of the investigations that use the token
+
+        Returns
+        -------
+        -: None
+        """
+        self._event.set()
+
+    def is_set(self) -> bool:
+        """
+        Checks whether the cancellation was requested
+
+        Returns
+        -------
+        canceled: bool
+            True once cancel() was called
+        """
+        return self._event.is_set()
+
+    def wait(self, timeout: Union[float, None] = None) -> bool:
+        """
+        Waits until the cancellation is requested or the timeout expires,
+        e.g. instead of sleeping before the retry of a throttled request
+
+        Parameters
+        ----------
+        timeout: float, optional
+            Maximum number of seconds to wait. If None, waits until cancel()
+            is called.
+
+        Returns
+        -------
+        canceled: bool
+            True if the cancellation was requested
+        """
+        return self._event.wait(timeout)
+
+    def raise_if_canceled(self):
+        """
+        Raises InvestigationCanceled if the cancellation was requested
+
+        Returns
+        -------
+        -: None
+        """
+        if self.is_set():
+            raise InvestigationCanceled()
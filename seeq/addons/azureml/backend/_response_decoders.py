@@ -0,0 +1,207 @@
+import json
+import numpy as np
+import pandas as pd
+from collections import deque
+from typing import Iterable, Union
+from seeq.addons.azureml.utils import AzureMLException
+
+NDJSON_CONTENT_TYPES = ['application/x-ndjson', 'application/ndjson', 'application/jsonl', 'application/x-jsonlines']
+INDEX_KEYS = ['index', 'timestamp', 'Timestamp']
+
+
+def decode_response(chunks: Iterable[bytes], content_type: Union[str, None] = None) -> pd.DataFrame:
+    """
+    Decodes the response of an Azure ML scoring endpoint into a DataFrame
+    with timestamps as Index and one column per result signal
+
+    The following response bodies are supported:
+
+    - a JSON string that holds the JSON of the result (the double-encoded
+      format of the existing scoring scripts, i.e.
+      `json.dumps(df.to_json(date_format='iso'))`)
+    - column-oriented JSON, `{"Prediction": {"2021-12-06T20:14:00.000Z": 10.2, ...}}`
+    - split JSON, `{"columns": [...], "index": [...], "data": [[...], ...]}`,
+      or grid JSON with "start" and "period" instead of "index"
+    - newline-delimited JSON (NDJSON), where each line is one of the
+      objects above holding a chunk of rows, or a single row record with an
+      "index" or "timestamp" key. The lines are decoded as the chunks arrive.
+
+    Timestamps may be ISO 8601 strings or epoch milliseconds.
+
+    Parameters
+    ----------
+    chunks: Iterable[bytes]
+        The body of the response, as an iterable of byte chunks
+    content_type: str, optional
+        The Content-Type header of the response. NDJSON is detected from
+        the content type or, if missing, from the first line of the body
+        holding a whole JSON object followed by another one.
+
+    Returns
+    -------
+    result: pd.DataFrame
+        The decoded result signal(s)
+    """
+    content_type = '' if content_type is None else content_type.split(';')[0].strip().lower()
+    chunks = iter(chunks)
+    if content_type in NDJSON_CONTENT_TYPES:
+        return _decode_lines(_iter_lines(chunks))
+
+    # the format is sniffed from the first bytes, so the body is never copied to find out
+    head, ndjson = _sniff_ndjson(chunks)
+    if ndjson:
+        return _decode_lines(_iter_lines(_replay(head, chunks)))
+    obj = json.loads(_read_text(_replay(head, chunks)), object_pairs_hook=_compact_object)
+    if isinstance(obj, str):
+        # the double-encoded format. The outer string is released once the inner JSON is parsed
+        obj = json.loads(obj, object_pairs_hook=_compact_object)
+    return _frame_from_json(obj)
+
+
+def _sniff_ndjson(chunks):
+    # reads the chunks up to the first byte of the second non-empty line. The body is NDJSON if its first line is
+    # a whole JSON object and the second line starts another one
+    head = deque()
+    first = last = None
+    line_done = False
+    for chunk in chunks:
+        head.append(chunk)
+        data = chunk
+        while data:
+            if first is None:
+                data = data.lstrip()
+                if not data:
+                    break
+                first = data[:1]
+                if first != b'{':
+                    return head, False
+            if not line_done:
+                newline = data.find(b'\n')
+                segment = (data if newline < 0 else data[:newline]).rstrip()
+                if segment:
+                    last = segment[-1:]
+                if newline < 0:
+                    break
+                if last != b'}':
+                    return head, False
+                line_done = True
+                data = data[newline + 1:]
+            data = data.lstrip()
+            if data:
+                return head, data[:1] == b'{'
+    return head, False
+
+
+def _replay(head, chunks):
+    # the sniffed chunks are released as they are consumed
+    while head:
+        yield head.popleft()
+    yield from chunks
+
+
+def _read_text(chunks):
+    # the bytes are released before the JSON is parsed
+    body = bytearray()
+    for chunk in chunks:
+        body += chunk
+    return body.decode('utf-8')
+
+
+def _iter_lines(chunks):
+    pending = b''
+    for chunk in chunks:
+        pending += chunk
+        lines = pending.split(b'\n')
+        pending = lines.pop()
+        yield from lines
+    yield pending
+
+
+def _decode_lines(lines):
+    frames = list()
+    records = {'index': list(), 'columns': dict()}
+    for line in lines:
+        line = line.strip()
+        if not line:
+            continue
+        obj = json.loads(line)
+        if isinstance(obj, str):
+            obj = json.loads(obj)
+        _check_object(obj)
+        index_key = next((k for k in INDEX_KEYS if k in obj and not isinstance(obj[k], (list, dict))), None)
+        if index_key is not None:
+            records['index'].append(obj.pop(index_key))
+            for name, value in obj.items():
+                records['columns'].setdefault(name, list()).append(value)
+            continue
+        frames.append(_frame_from_json(obj))
+    if len(records['index']) > 0:
+        frames.append(pd.DataFrame(records['columns'], index=_parse_index(records['index'])))
+    if len(frames) == 0:
+        return pd.DataFrame()
+    return frames[0] if len(frames) == 1 else pd.concat(frames)
+
+
+class _NumericObject:
+    # a JSON object whose values are all numbers, e.g. the timestamps and the values of a column. Its keys and values
+    # take several times less memory than a dict of Python floats
+    def __init__(self, pairs):
+        self.keys = [k for k, _ in pairs]
+        self.values = np.array([v for _, v in pairs])
+
+
+def _compact_object(pairs):
+    if len(pairs) > 0 and all(type(v) in (float, int) for _, v in pairs):
+        return _NumericObject(pairs)
+    return dict(pairs)
+
+
+def _frame_from_json(obj) -> pd.DataFrame:
+    if isinstance(obj, _NumericObject):
+        obj = dict(zip(obj.keys, obj.values.tolist()))
+    _check_object(obj)
+    if 'columns' in obj and 'data' in obj:
+        if 'index' in obj:
+            index = _parse_index(obj.pop('index'))
+        else:
+            index = _parse_index(obj['start'] + obj['period'] * np.arange(len(obj['data']), dtype='int64'))
+        return pd.DataFrame(obj.pop('data'), columns=obj['columns'], index=index)
+
+    if len(obj) == 0:
+        return pd.DataFrame()
+    # each column is converted and released in turn, so the parsed JSON and the frame are not both held whole
+    columns = {c: _keys_values(obj.pop(c)) for c in list(obj.keys())}
+    keys = next(iter(columns.values()))[0]
+    if all(x[0] == keys for x in columns.values()):
+        return pd.DataFrame({c: x[1] for c, x in columns.items()}, index=_parse_index(keys))
+    # the columns do not share the same timestamps. Let pandas align them
+    frame = pd.DataFrame({c: pd.Series(x[1], index=_parse_index(x[0])) for c, x in columns.items()})
+    return frame.sort_index()
+
+
+def _keys_values(column):
+    if isinstance(column, _NumericObject):
+        return column.keys, column.values
+    return list(column.keys()), list(column.values())
+
+
+def _check_object(obj):
+    if not isinstance(obj, dict):
+        raise AzureMLException(code=None, reason=None,
+                               message=f"The response of the Azure ML model must be a JSON object. "
+                                       f"Got a JSON {type(obj).__name__}")
+
+
+def _parse_index(values) -> pd.DatetimeIndex:
+    if isinstance(values, list) and len(values) > 0 and isinstance(values[0], str):
+        # epoch milliseconds serialized as JSON object keys arrive as strings
+        if values[0].lstrip('-').isdigit():
+            return pd.DatetimeIndex(pd.to_datetime(np.array(values, dtype='int64'), unit='ms', utc=True))
+        # the strings are parsed from the list, a fixed-width unicode array would take 4 bytes per character
+        return pd.DatetimeIndex(pd.to_datetime(values))
+    values = np.asarray(values)
+    if values.dtype.kind in 'iuf':
+        return pd.DatetimeIndex(pd.to_datetime(values, unit='ms', utc=True))
+    if len(values) > 0 and all(str(x).lstrip('-').isdigit() for x in values[:1]):
+        return pd.DatetimeIndex(pd.to_datetime(values.astype('int64'), unit='ms', utc=True))
+    return pd.DatetimeIndex(pd.to_datetime(values))
@@ -1,21 +1,40 @@
-import json
 import os
-import ssl
+import re
 import copy
+import math
+import time
+import threading
 import pandas as pd
-from typing import Union
+from typing import Callable, Union
 from datetime import datetime
-import urllib.request
+import requests
 import hashlib
-from urllib.error import HTTPError
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
 from seeq import spy
-from seeq.addons.azureml.utils import AzureMLException
+from seeq.sdk.rest import ApiException
+# noinspection PyProtectedMember
+from seeq.spy import _login
+from seeq.addons.azureml.utils import AzureMLException, InvestigationCanceled
+from ._scoring_windows import ScoringWindow, split_time_range, stitch_predictions, _align_timezone
+from ._concurrency import in_flight_limiter
+from ._payload_encoders import get_payload_encoder
+from ._response_decoders import decode_response
+from ._scoring_transport import scoring_session, retry_after_seconds, backoff_delay, SCORING_TIMEOUT, MAX_RETRIES, \
+    RETRY_STATUSES, THROTTLE_STATUSES
+from ._watermarks import WatermarkStore
+from ._input_cache import InputDataCache
+from ._prediction_cache import PredictionCache
+from ._metadata_fingerprints import MetadataFingerprintCache
+from ._progress import ProgressEvent, CancellationToken
 
 DEFAULT_DATASOURCE_NAME = 'Azure ML'
 DEFAULT_WORKBOOK_PATH = 'Data Lab >> Azure ML Integration'
 DEFAULT_WORKBOOK_NAME = DEFAULT_WORKBOOK_PATH.split('>>')[-1].strip()
 DEFAULT_WORKSHEET_NAME = 'From Azure ML Integration'
 DEFAULT_RESULT_SIGNAL_NAME = 'Prediction Azure ML'
+RESPONSE_CHUNK_SIZE = 1024 * 1024
+NO_DATA_MESSAGE = "There is no data available for these input signals during the selected time range"
+GUID_PATTERN = r'[0-9a-fA-F]{8}-[0-9a-fA-F]{4}-[0-9a-fA-F]{4}-[0-9a-fA-F]{4}-[0-9a-fA-F]{12}'
 
 
 class RunInvestigation:
@@ -24,7 +43,9 @@ class RunInvestigation:
     Integration UI), posts a request to the Azure ML model, gets a result
     signal back from Azure ML and pushes the result back to Seeq.
 
-    This class assumes that the Azure ML model returns only ONE signal.
+    A model may return several result columns. Each column is pushed to its
+    own Seeq signal, named after result_name and the column, in a single
+    spy.push.
 
     Attributes
     ----------
@@ -33,6 +54,9 @@ class RunInvestigation:
         values are the Seeq IDs of the input signals.
     result_name: str
         The name of the result signal that will be pushed to Seeq.
+    output_names: dict
+        The names of the Seeq signals of the result columns of a
+        multi-output model, with the result columns as keys.
     az_model_name: str
         Name of the Azure ML model used to compute the result signal.
     az_model_version: str
@@ -56,6 +80,62 @@ class RunInvestigation:
         signal.
     aml_primary_key: str
         The primary key of the Azure ML endpoint
+    window_rows: int
+        Maximum number of grid rows scored in a single request. If None, the
+        whole investigation range is scored in one request unless
+        window_bytes is given.
+    window_bytes: int
+        Maximum size in bytes of the request payload. Windows whose payload
+        exceeds this size are split further before being posted.
+    lookback: pd.Timedelta
+        Amount of history pulled before each window for models that need
+        warm-up data. Predictions for the lookback period are discarded.
+    max_concurrency: int
+        Maximum number of requests in flight against the scoring URI. If
+        greater than 1, the windows are scored concurrently.
+    max_retries: int
+        Maximum number of times a throttled or failed scoring request is
+        retried before raising.
+    errors: {'raise', 'catalog'}
+        If 'raise', the first window that fails raises its exception once
+        the windows in flight are done. If 'catalog', failures are only
+        recorded in window_status.
+    payload_format: str
+        The format used to serialize the input data in the scoring request.
+        See seeq.addons.azureml.backend.get_payload_encoder.
+    watermarks: seeq.addons.azureml.backend.WatermarkStore
+        The store with the last timestamp pushed for each result signal. If
+        given, the investigation is incremental: it scores from the
+        watermark of the result signal instead of start.
+    watermark: pd.Timestamp
+        The watermark of the result signal read from the store when the
+        scoring windows were computed, or None if there is no watermark.
+    watermark_key: str
+        Key of the result signal in the watermark store, derived from the
+        workbook, datasource, result name, model name and version, and the
+        input signals.
+    input_cache: seeq.addons.azureml.backend.InputDataCache
+        The local cache of the input data. If given, only the time intervals
+        that are not cached yet are pulled from Seeq.
+    metadata_cache: seeq.addons.azureml.backend.MetadataFingerprintCache
+        The cache of the metadata pushed for the result signals. If given,
+        the metadata and the worksheet are only pushed when they change.
+    data_only: bool
+        If True, only the samples are pushed to the result signals known by
+        metadata_cache, even if their metadata changed.
+    skip_unchanged_metadata: bool
+        If False, the metadata and the worksheet are pushed every time, and
+        metadata_cache only provides the data IDs of the result signals.
+    prediction_cache: seeq.addons.azureml.backend.PredictionCache
+        The local cache of the predictions. If given, the endpoint is only
+        called for input data that has not been scored by the same model
+        version before.
+    on_progress: callable
+        Called with a seeq.addons.azureml.backend.ProgressEvent at the start
+        and at the end of each stage of the investigation
+    cancellation: seeq.addons.azureml.backend.CancellationToken
+        The token checked between the stages and the windows of the
+        investigation
     quiet: bool
         If True, suppresses progress output. Note that when status is
         provided, the quiet setting of the Status object that is passed
@@ -63,13 +143,18 @@ class RunInvestigation:
     data: pd.DataFrame
         A DataFrame with timestamps as Index and input signals data as
         columns. This dataset is passed in the request to the endpoint_uri to
-        compute the resulting signal.
+        compute the resulting signal. When the investigation range is split
+        into several windows, the pulled data is not kept.
     result_signal: pd.DataFrame
-        A DataFrame with timestamps as Index and one column with the
-        data of the result signal
+        A DataFrame with timestamps as Index and one column per result
+        signal returned by the model
+    window_status: pd.DataFrame
+        A DataFrame with one row per scoring window with its 'Start', 'End',
+        number of 'Rows' scored and the 'Result' of the window: 'Success',
+        'No data', 'Canceled' or the error message.
     pushed_df: pd.DataFrame
-        A DataFrame with the metadata for the result signal pushed, along with
-        any errors and statistics about the operation.
+        A DataFrame with the metadata for the result signals pushed, along
+        with any errors and statistics about the operation.
     error_info: str
         Information on the most recent error that has occurred.
 
@@ -81,9 +166,15 @@ class RunInvestigation:
         Checks whether to allow self-signed https certificates
     get_seeq_data()
         Pulls the input signals required for the Azure ML model from Seeq
+    scoring_windows()
+        Splits the investigation range into the windows scored by run()
     run()
         Posts a request to the Azure ML endpoint_uri with the input data and,
         if successful, retrieves the serialized result signal
+    result_outputs()
+        Returns the data ID and the name of the signal of each result column
+    result_metadata()
+        Returns the metadata of the result signals
     push_to_seeq()
         Pushes the result signal from Azure ML model to Seeq.
 
@@ -103,7 +194,23 @@ class RunInvestigation:
                  endpoint_uri: Union[str, None] = None,
                  aml_primary_key: Union[str, None] = None,
                  self_signed_certificate=True,
-                 quiet=True):
+                 quiet=True,
+                 window_rows: Union[int, None] = None,
+                 window_bytes: Union[int, None] = None,
+                 lookback: Union[str, pd.Timedelta, None] = None,
+                 max_concurrency: int = 1,
+                 errors: str = 'raise',
+                 payload_format: Union[str, None] = None,
+                 max_retries: int = MAX_RETRIES,
+                 watermarks: Union[WatermarkStore, None] = None,
+                 input_cache: Union[InputDataCache, None] = None,
+                 prediction_cache: Union[PredictionCache, None] = None,
+                 on_progress: Union[Callable[[ProgressEvent], None], None] = None,
+                 cancellation: Union[CancellationToken, threading.Event, None] = None,
+                 output_names: Union[dict, None] = None,
+                 metadata_cache: Union[MetadataFingerprintCache, None] = None,
+                 data_only: bool = False,
+                 skip_unchanged_metadata: bool = True):
         """
 
         Parameters
@@ -142,6 +249,99 @@ class RunInvestigation:
             If True, suppresses progress output. Note that when status is
             provided, the quiet setting of the Status object that is passed
             in takes precedent.
+        window_rows: int, optional
+            Maximum number of grid rows scored in a single request. Long
+            investigation ranges are split into consecutive time windows of
+            this size, scored in order and stitched back together.
+        window_bytes: int, optional
+            Maximum size in bytes of the request payload. If window_rows is
+            None, it is also used to estimate the size of the time windows.
+        lookback: str or pd.Timedelta, optional
+            Amount of history pulled before each window, e.g. '1 hour', for
+            models that need warm-up data.
+        max_concurrency: int, default 1
+            Maximum number of requests of this investigation in flight
+            against the scoring URI. If greater than 1, the windows are
+            scored on a thread pool of that size. The investigations of the
+            process that score against the same URI share a limiter whose
+            limit is the largest max_concurrency requested for the URI.
+        errors: {'raise', 'catalog'}, default 'raise'
+            If 'raise', the first window that fails raises its exception
+            after the predictions of the successful windows are stitched into
+            result_signal. If 'catalog', the failures are only recorded in
+            window_status.
+        payload_format: str, optional
+            The format used to serialize the input data in the scoring
+            request, usually taken from the `PayloadFormat` tag of the Azure
+            ML model: 'iso', 'split', 'grid', 'npy' or 'arrow', optionally
+            followed by '+gzip'. If None, the column-oriented JSON with ISO
+            timestamps expected by the existing scoring scripts is used.
+        max_retries: int, default 5
+            Maximum number of times a scoring request that fails with a
+            429, 500, 502, 503 or 504 status is retried. The retries wait
+            for the Retry-After delay sent by the endpoint or back off
+            exponentially. Throttled requests (429, 503) also halve the
+            number of requests allowed in flight against the scoring URI,
+            which then ramps back up with every successful request.
+        watermarks: seeq.addons.azureml.backend.WatermarkStore, optional
+            The store with the last timestamp successfully pushed for each
+            result signal, used by scheduled jobs. If the result signal has
+            a watermark, the investigation scores from the watermark to end,
+            instead of from start, and only the predictions after the
+            watermark are kept. The watermark is moved forward by
+            push_to_seeq.
+        input_cache: seeq.addons.azureml.backend.InputDataCache, optional
+            A local cache of the input data shared by investigations, e.g.
+            by the runs of the Add-on UI. Re-running an investigation with
+            a new result name, or moving its end, only pulls the data that
+            is not cached yet.
+        prediction_cache: seeq.addons.azureml.backend.PredictionCache, optional
+            A local cache of the predictions keyed by the model name and
+            version, the input data and the payload format. On a cache hit,
+            the stored predictions are used and the endpoint is not called.
+        on_progress: callable, optional
+            Called with a seeq.addons.azureml.backend.ProgressEvent at the
+            start and at the end of each stage: 'run', 'pull' and 'score' for
+            each window, and 'push'. The events carry the window index and
+            count, the rows and bytes of the stage and the elapsed time.
+            With max_concurrency greater than 1, it is called from the
+            scoring threads. An exception raised by the callback fails the
+            window being processed.
+        cancellation: seeq.addons.azureml.backend.CancellationToken, optional
+            A token canceled from another thread, e.g. by the cancel button
+            of the Add-on UI, to stop the investigation. A threading.Event
+            is also accepted. The token is checked before each window, in
+            the waits before the retries of a throttled request, between the
+            pull and score stages of a window, and before the push: the
+            windows in flight are finished, the others are recorded as
+            'Canceled', and run() or push_to_seeq() raises
+            seeq.addons.azureml.utils.InvestigationCanceled. Nothing is
+            pushed once the token is canceled.
+        output_names: dict, optional
+            For a model that returns several result columns, the name of the
+            Seeq signal of each column, e.g. {'Flow': 'Predicted Flow'}. The
+            columns that are not in the dict are named
+            '<result_name> - <column>'. A model that returns a single column
+            is pushed as result_name.
+        metadata_cache: seeq.addons.azureml.backend.MetadataFingerprintCache, optional
+            A cache of the fingerprint of the metadata and worksheet last
+            pushed for the result signal and of the Seeq IDs of its signals.
+            If given, a push with the same fingerprint only writes the
+            samples, with no metadata nor worksheet update, and the data IDs
+            of the result signal are only searched in Seeq the first time it
+            is pushed.
+        data_only: bool, default False
+            For scheduled runs. If True and the result signals are in
+            metadata_cache, only the samples are pushed even if the
+            metadata changed, e.g. after the description format of a new
+            version of the Add-on. The first push of a result signal still
+            writes its metadata and the worksheet.
+        skip_unchanged_metadata: bool, default True
+            If False, e.g. for the interactive investigations of the Add-on
+            UI, every push writes the metadata and the worksheet, so the
+            worksheet shows the new investigation range and is created
+            again if it was deleted. metadata_cache is then only used for
+            the data IDs of the result signal.
         """
 
         self.input_signals = input_signals
@@ -157,14 +357,35 @@ class RunInvestigation:
         self.endpoint_uri = endpoint_uri
         self.aml_primary_key = aml_primary_key
         self.quiet = quiet
+        self.window_rows = window_rows
+        self.window_bytes = window_bytes
+        self.lookback = None if lookback is None else pd.Timedelta(lookback)
+        self.max_concurrency = max_concurrency
+        self.errors = errors
+        self.payload_format = payload_format
+        self.max_retries = max_retries
+        self.watermarks = watermarks
+        self.watermark = None
+        self.input_cache = input_cache
+        self.prediction_cache = prediction_cache
+        self.on_progress = on_progress
+        self.cancellation = cancellation
+        self.output_names = dict() if output_names is None else output_names
+        self.metadata_cache = metadata_cache
+        self.data_only = data_only
+        self.skip_unchanged_metadata = skip_unchanged_metadata
 
         self.validate_inputs()
-        self.allow_self_signed_https(self_signed_certificate)
+        self._verify = not self.allow_self_signed_https(self_signed_certificate)
+        self._encoder = get_payload_encoder(payload_format)
 
         self.data = pd.DataFrame()
         self.result_signal = pd.DataFrame()
+        self.window_status = pd.DataFrame()
         self.pushed_df = None
         self.error_info = None
+        self._started = time.monotonic()
+        self._windows = 0
 
     def validate_inputs(self):
         """
@@ -188,8 +409,8 @@ class RunInvestigation:
                             f"Got start: {type(self.end)}")
 
         for prop in ['result_name', 'az_model_name', 'az_model_version', 'workbook', 'worksheet', 'datasource',
-                     'endpoint_uri', 'aml_primary_key']:
-            if prop is None:
+                     'endpoint_uri', 'aml_primary_key', 'payload_format']:
+            if getattr(self, prop) is None and prop in ['workbook', 'worksheet', 'datasource', 'payload_format']:
                 continue
             if not isinstance(getattr(self, prop), str):
                 raise TypeError(f"The {prop} argument must be of type str. Got {type(getattr(self, prop))}")
@@ -202,10 +423,59 @@ class RunInvestigation:
         except ValueError as e:
             raise e
 
+        for prop in ['window_rows', 'window_bytes', 'max_concurrency']:
+            value = getattr(self, prop)
+            if value is None:
+                continue
+            if not isinstance(value, int) or isinstance(value, bool) or value < 1:
+                raise TypeError(f"The {prop} argument must be a positive integer. Got {value}")
+
+        if self.lookback is not None and self.lookback < pd.Timedelta(0):
+            raise ValueError(f"The lookback argument must be a positive time period. Got {self.lookback}")
+
+        if not isinstance(self.max_retries, int) or isinstance(self.max_retries, bool) or self.max_retries < 0:
+            raise TypeError(f"The max_retries argument must be a non-negative integer. Got {self.max_retries}")
+
+        if self.errors not in ['raise', 'catalog']:
+            raise ValueError(f"The errors argument must be either 'raise' or 'catalog'. Got {self.errors}")
+
+        if self.watermarks is not None and not isinstance(self.watermarks, WatermarkStore):
+            raise TypeError(f"The watermarks argument must be of type WatermarkStore. Got {type(self.watermarks)}")
+
+        if self.input_cache is not None and not isinstance(self.input_cache, InputDataCache):
+            raise TypeError(f"The input_cache argument must be of type InputDataCache. Got {type(self.input_cache)}")
+
+        if not isinstance(self.output_names, dict) or \
+                not all(isinstance(x, str) for x in list(self.output_names) + list(self.output_names.values())):
+            raise TypeError(f"The output_names argument must be a dict of str. Got {self.output_names}")
+
+        if self.metadata_cache is not None and not isinstance(self.metadata_cache, MetadataFingerprintCache):
+            raise TypeError(f"The metadata_cache argument must be of type MetadataFingerprintCache. "
+                            f"Got {type(self.metadata_cache)}")
+
+        if not isinstance(self.data_only, bool):
+            raise TypeError(f"The data_only argument must be a bool. Got {type(self.data_only)}")
+
+        if not isinstance(self.skip_unchanged_metadata, bool):
+            raise TypeError(f"The skip_unchanged_metadata argument must be a bool. "
+                            f"Got {type(self.skip_unchanged_metadata)}")
+
+        if self.prediction_cache is not None and not isinstance(self.prediction_cache, PredictionCache):
+            raise TypeError(f"The prediction_cache argument must be of type PredictionCache. "
+                            f"Got {type(self.prediction_cache)}")
+
+    @property
+    def watermark_key(self):
+        s = '|'.join([str(self.workbook), str(self.datasource), self.result_name, self.az_model_name,
+                      self.az_model_version] + sorted(self.input_signals.values()))
+        return hashlib.sha1(s.encode()).hexdigest()
+
     @staticmethod
     def allow_self_signed_https(allowed):
         """
-        Checks whether to allow self-signed https certificates
+        Checks whether to allow self-signed https certificates. The
+        certificate verification is only bypassed for the scoring requests
+        of this investigation, the process-wide SSL context is not modified.
 
         Parameters
         ----------
@@ -214,12 +484,12 @@ class RunInvestigation:
 
         Returns
         -------
-        -: None
+        bypass: bool
+            True if the server certificate verification is bypassed
 
         """
         # bypass the server certificate verification on client side
-        if allowed and not os.environ.get('PYTHONHTTPSVERIFY', '') and getattr(ssl, '_create_unverified_context', None):
-            ssl._create_default_https_context = ssl._create_unverified_context
+        return bool(allowed) and not os.environ.get('PYTHONHTTPSVERIFY', '')
 
     def get_seeq_data(self):
         """
@@ -230,84 +500,420 @@ class RunInvestigation:
         -: None
 
         """
+        data = self._pull_data(self.start, self.end)
+        if len(data) == 0:
+            raise ValueError(NO_DATA_MESSAGE)
+        self.data = data
+
+    def _pull_data(self, start, end):
+        if self.input_cache is None:
+            data = self._spy_pull(start, end)
+        else:
+            start, end = _login.validate_start_and_end(start, end)
+            data = self.input_cache.pull(list(self.input_signals.values()), start, end, self.grid, self._spy_pull)
+        cols = dict(zip(self.input_signals.values(), self.input_signals.keys()))
+        data.rename(columns=cols, inplace=True)
+        data.dropna(inplace=True)
+        return data
+
+    def _spy_pull(self, start, end):
         signals = copy.deepcopy(self.input_signals)  # spy.pull is modifying the input dict
-        data = spy.pull(pd.DataFrame([{"ID": x, 'Type': 'Signal'} for x in signals.values()]),
-                        start=self.start,
-                        end=self.end,
+        return spy.pull(pd.DataFrame([{"ID": x, 'Type': 'Signal'} for x in signals.values()]),
+                        start=start,
+                        end=end,
                         grid=self.grid,
                         header='ID',
                         quiet=self.quiet)
-        cols = dict(zip(self.input_signals.values(), self.input_signals.keys()))
-        data.rename(columns=cols, inplace=True)
-        data.dropna(inplace=True)
-        if len(data) == 0:
-            raise ValueError("There is no data available for these input signals during the selected time range")
-        self.data = data
 
-    def _prepare_request(self):
-        self.get_seeq_data()
-        body = self.data.to_json(date_format='iso').encode()
-        headers = {
-            'Content-Type': 'application/json',
-            'Authorization': f'Bearer {self.aml_primary_key}'
-        }
-        return urllib.request.Request(self.endpoint_uri, body, headers)
+    def _prepare_request(self, data):
+        body, headers = self._encoder.encode(data)
+        headers['Authorization'] = f'Bearer {self.aml_primary_key}'
+        return requests.Request('POST', self.endpoint_uri, data=body, headers=headers)
+
+    def scoring_windows(self):
+        """
+        Splits the investigation range into the time windows that are pulled
+        and scored one at a time by run(). If the result signal has a
+        watermark, the range starts at the watermark.
+
+        Returns
+        -------
+        windows: list
+            List of seeq.addons.azureml.backend.ScoringWindow in time order.
+            The list is empty if the watermark is already at the end of the
+            investigation range.
+
+        """
+        start, end = _login.validate_start_and_end(self.start, self.end)
+        self.watermark = None if self.watermarks is None else self.watermarks.get(self.watermark_key)
+        if self.watermark is not None:
+            # start at the last pushed sample, so the grid stays aligned. It is dropped from the result by run()
+            start = self.watermark.tz_convert(start.tz)
+            if start >= end:
+                return list()
+        return split_time_range(start, end, self.grid, window_rows=self.window_rows,
+                                window_bytes=self.window_bytes, columns=len(self.input_signals),
+                                lookback=self.lookback)
 
     def run(self):
         """
         Posts a request to the Azure ML endpoint_uri with the input data and,
-        if successful, retrieves the serialized result signal
+        if successful, retrieves the serialized result signal. If the
+        investigation range is split into several windows, the windows are
+        scored in order, or concurrently when max_concurrency is greater than
+        1, and the predictions are stitched into result_signal in time order.
+        For an incremental investigation, only the predictions after the
+        watermark are kept in result_signal, which may then be empty.
+
+        If the cancellation token is canceled, the windows that are not
+        started yet are recorded as 'Canceled' in window_status and
+        InvestigationCanceled is raised once the windows in flight are done.
 
         Returns
         -------
         -: None
 
         """
-        request = self._prepare_request()
-        # Hit the endpoint with the data, get the response, and push into Seeq
+        self._started = time.monotonic()
+        windows = self.scoring_windows()
+        self._windows = len(windows)
+        self._emit('run', 'start')
         try:
-            response = urllib.request.urlopen(request)
-            result = response.read()
-            self.result_signal = pd.read_json(json.loads(result))
-
-        except HTTPError as error:
-            self.error_info = error
-            raise AzureMLException(code=error.code, reason=error.reason, message="Azure request failed")
-
-    def push_to_seeq(self):
+            self._run(windows)
+        finally:
+            self._emit('run', 'end', rows=len(self.result_signal),
+                       nbytes=int(self.result_signal.memory_usage(index=True).sum()), started=self._started)
+
+    def _run(self, windows):
+        if len(windows) == 0:
+            self.window_status = pd.DataFrame()
+            self.result_signal = pd.DataFrame()
+            return
+        if self.max_concurrency > 1 and len(windows) > 1:
+            outcomes = self._score_windows_concurrently(windows)
+        else:
+            outcomes = self._score_windows_in_order(windows)
+
+        self.window_status = pd.DataFrame([{
+            'Start': w.start,
+            'End': w.end,
+            'Rows': outcomes[w.index]['Rows'],
+            'Result': outcomes[w.index]['Result']
+        } for w in windows])
+        self.result_signal = stitch_predictions(windows, [outcomes[w.index]['Prediction'] for w in windows])
+        if self.watermark is not None and not self.result_signal.empty:
+            index = self.result_signal.index
+            self.result_signal = self.result_signal[index > _align_timezone(self.watermark, index)]
+
+        if self._canceled():
+            raise InvestigationCanceled()
+        errors = [outcomes[w.index]['Error'] for w in windows if outcomes[w.index]['Error'] is not None]
+        if len(errors) > 0 and self.errors == 'raise':
+            raise errors[0]
+        if len(errors) == 0 and self.result_signal.empty and self.watermark is None:
+            raise ValueError(NO_DATA_MESSAGE)
+
+    def _score_windows_in_order(self, windows):
+        outcomes = dict()
+        for window in windows:
+            if self.errors == 'raise' and any(x['Error'] is not None for x in outcomes.values()):
+                outcomes[window.index] = _window_outcome(result='Canceled')
+                continue
+            outcomes[window.index] = self._score_window(window, keep_data=len(windows) == 1)
+        return outcomes
+
+    def _score_windows_concurrently(self, windows):
+        outcomes = dict()
+        with ThreadPoolExecutor(max_workers=self.max_concurrency) as executor:
+            futures = {executor.submit(self._score_window, w): w for w in windows}
+            pending = set(futures)
+            while pending:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    outcomes[futures[future].index] = _window_outcome(result='Canceled') if future.cancelled() \
+                        else future.result()
+                if self._canceled() or (self.errors == 'raise' and
+                                        any(x['Error'] is not None for x in outcomes.values())):
+                    for future in pending:
+                        future.cancel()
+        return outcomes
+
+    def _score_window(self, window: ScoringWindow, keep_data=False):
+        if self._canceled():
+            return _window_outcome(result='Canceled')
+        try:
+            started = self._emit('pull', 'start', window.index)
+            data = self._pull_data(window.pull_start, window.end)
+            if keep_data:
+                self.data = data
+            self._emit('pull', 'end', window.index, len(data), int(data.memory_usage(index=True).sum()), started)
+            if len(data) == 0:
+                return _window_outcome(result='No data')
+            if self._canceled():
+                return _window_outcome(result='Canceled')
+            started = self._emit('score', 'start', window.index)
+            sent = list()
+            prediction = self._predict(data, sent)
+            self._emit('score', 'end', window.index, len(data), sum(sent), started)
+            return _window_outcome(prediction=prediction, rows=len(data))
+        except InvestigationCanceled:
+            return _window_outcome(result='Canceled')
+        except Exception as e:
+            return _window_outcome(result=str(e), error=e)
+
+    def _canceled(self):
+        return self.cancellation is not None and self.cancellation.is_set()
+
+    def _wait(self, delay):
+        if self.cancellation is None:
+            time.sleep(delay)
+        # the wait ends as soon as the investigation is canceled, e.g. during a long Retry-After of the endpoint
+        elif self.cancellation.wait(delay):
+            raise InvestigationCanceled()
+
+    def _emit(self, stage, kind, window=None, rows=0, nbytes=0, started=None):
+        now = time.monotonic()
+        if self.on_progress is not None:
+            self.on_progress(ProgressEvent(stage, kind, window=window, windows=self._windows, rows=rows, nbytes=nbytes,
+                                           elapsed=now - self._started,
+                                           duration=0 if started is None else now - started))
+        return now
+
+    def _predict(self, data, sent=None):
+        if self.prediction_cache is None:
+            return self._score_data(data, sent)
+        key = self.prediction_cache.key(self.az_model_name, self.az_model_version, data, self._encoder.name)
+        prediction = self.prediction_cache.get(key)
+        if prediction is None:
+            prediction = self._score_data(data, sent)
+            self.prediction_cache.put(key, prediction, self.az_model_name, self.az_model_version)
+        return prediction
+
+    def _score_data(self, data, sent=None):
+        request = self._prepare_request(data)
+        if self.window_bytes is not None and len(request.data) > self.window_bytes and len(data) > 1:
+            # split the payload in halves. The second half repeats the lookback rows so the model keeps its history
+            middle = len(data) // 2
+            left = self._score_data(data.iloc[:middle], sent)
+            right = self._score_data(data.iloc[max(0, middle - self._lookback_rows()):], sent)
+            return pd.concat([left, right[~right.index.isin(left.index)]])
+        if sent is not None:
+            sent.append(len(request.data))
+        return self._post(request)
+
+    def _lookback_rows(self):
+        if self.lookback is None:
+            return 0
+        return math.ceil(self.lookback / pd.Timedelta(self.grid))
+
+    def _post(self, request):
+        # Hit the endpoint with the data, get the response, and push into Seeq
+        session = scoring_session(verify=self._verify)
+        limiter = in_flight_limiter(self.endpoint_uri, self.max_concurrency)
+        attempt = 0
+        while True:
+            with limiter:
+                response = session.post(request.url, data=request.data, headers=request.headers, stream=True,
+                                        timeout=SCORING_TIMEOUT)
+                try:
+                    if response.status_code == 200:
+                        result = decode_response(response.iter_content(RESPONSE_CHUNK_SIZE),
+                                                 response.headers.get('Content-Type'))
+                        limiter.on_success()
+                        return result
+                    retry_after = retry_after_seconds(response.headers)
+                    self.error_info = response.text
+                finally:
+                    response.close()
+
+            if response.status_code in THROTTLE_STATUSES:
+                limiter.on_throttle()
+            if response.status_code not in RETRY_STATUSES or attempt >= self.max_retries:
+                raise AzureMLException(code=response.status_code, reason=response.reason,
+                                       message="Azure request failed")
+            # wait without holding a request slot, so other windows can still use the endpoint
+            self._wait(backoff_delay(attempt, retry_after))
+            attempt += 1
+
+    def result_outputs(self):
         """
-        Pushes the result signal from Azure ML model to Seeq.
+        Returns the Seeq identity of each result column: the data ID
+        ('Original Name') and the 'Name' of the signal it is pushed to. The
+        data ID of a single-output model is a hash of the result name, the
+        model name and version, and the sorted IDs of the input signals, so
+        it is the same in every kernel, e.g. for the Add-on UI and for the
+        scheduled job. The data ID of each column of a multi-output model
+        also depends on the column.
 
         Returns
         -------
-        -: None
+        outputs: pd.DataFrame
+            A DataFrame with one row per column of result_signal, with the
+            'Output' column, its 'Original Name' and its 'Name'
+        """
+        columns = list(self.result_signal.columns)
+        s = '|'.join([self.result_name, self.az_model_name, self.az_model_version] +
+                     sorted(self.input_signals.values()))
+        if len(columns) == 1:
+            return pd.DataFrame([{'Output': columns[0], 'Original Name': hashlib.sha1(s.encode()).hexdigest(),
+                                  'Name': self.result_name}])
+        return pd.DataFrame([{
+            'Output': c,
+            'Original Name': hashlib.sha1(f'{s}|{c}'.encode()).hexdigest(),
+            'Name': self.output_names.get(str(c), f'{self.result_name} - {c}')
+        } for c in columns])
+
+    def result_metadata(self):
         """
-        if len(self.result_signal.columns) > 1:
-            raise AzureMLException(code=None, reason=None,
-                                   message='This implementation assumes a single signal resulting from the Azure ML '
-                                           'model')
-        s = self.result_name + self.az_model_name + self.az_model_version + str(set(self.input_signals.values()))
-        hash_object = hashlib.sha1(s.encode())
-        self.result_signal.columns = [hash_object.hexdigest()]  # Rename the name coming from Azure ML model
-
-        self.pushed_df = spy.push(
-            self.result_signal,
-            workbook=self.workbook,
-            datasource=self.datasource,
-            worksheet=self.worksheet,
-            status=spy.Status(quiet=self.quiet)
-        )
+        Returns the metadata of the result signals pushed to Seeq
 
+        Returns
+        -------
+        metadata: pd.DataFrame
+            A DataFrame with one row per result signal, indexed by the data
+            ID of the signal (see result_outputs)
+        """
+        outputs = self.result_outputs()
         separator = ",\n"
         description = f"Model Name: {self.az_model_name}\nModel Version: {self.az_model_version}\n" \
                       f"Inputs: \n[{separator.join(self.input_signals.values())}]"
 
-        metadata = self.pushed_df.copy()
-        metadata['Original Name'] = hash_object.hexdigest()
-        metadata["Name"] = self.result_name,
-        metadata["Description"] = description,
-        metadata['Model Name'] = self.az_model_name,
-        metadata["Model Version"] = self.az_model_version,
-        metadata["Input Signals"] = str(list(set(self.input_signals.values()))),
+        metadata = pd.DataFrame(index=list(outputs['Original Name']))
+        metadata['Data ID'] = list(outputs['Original Name'])
+        metadata['Original Name'] = list(outputs['Original Name'])
+        metadata["Name"] = list(outputs['Name'])
+        metadata["Description"] = description if len(outputs) == 1 else \
+            [f"{description}\nOutput: {x}" for x in outputs['Output']]
+        metadata['Model Name'] = self.az_model_name
+        metadata["Model Version"] = self.az_model_version
+        metadata["Input Signals"] = str(sorted(set(self.input_signals.values())))
+        if len(outputs) > 1:
+            metadata['Model Output'] = [str(x) for x in outputs['Output']]
         metadata["Type"] = "Signal"
-        spy.push(metadata=metadata, workbook=self.workbook, quiet=self.quiet)
+        return metadata
+
+    def push_to_seeq(self):
+        """
+        Pushes the result signals from Azure ML model to Seeq. The data and
+        the metadata of all the result columns of the model are written in a
+        single spy.push, each column to its own signal (see result_outputs).
+
+        If metadata_cache is given and the metadata, workbook, worksheet and
+        datasource are the same as for the last push of the result signal,
+        or if data_only is True, only the samples are pushed to the signals
+        already in Seeq, without updating their metadata nor the worksheet.
+        With skip_unchanged_metadata False and data_only False, the metadata
+        and the worksheet are always pushed.
+        If Seeq does not find the signals anymore (HTTP 404), everything is
+        pushed again. Any other failure of the push is raised.
+
+        Unless the data IDs of the result signal are in metadata_cache, the
+        workbook is searched for a signal pushed before with the same name,
+        model, model version and input signals, e.g. by an older version of
+        the Add-on with another data ID. The push then updates that signal
+        instead of creating a duplicate. With metadata_cache, the search
+        only happens the first time the result signal is pushed.
+
+        If watermarks is given and the push succeeds, the watermark of the
+        result signal moves to the last timestamp pushed. Nothing is pushed
+        if the result signal is empty, which happens when an incremental
+        investigation has no new data.
+
+        Returns
+        -------
+        -: None
+        """
+        if self.result_signal.empty:
+            return
+        if self._canceled():
+            raise InvestigationCanceled()
+        started = self._emit('push', 'start')
+        metadata = self.result_metadata()
+        # the signals are pushed with their data IDs, instead of the names coming from the Azure ML model
+        data = self.result_signal.copy()
+        data.columns = list(metadata.index)
+
+        fingerprint = None
+        self.pushed_df = None
+        cached = None if self.metadata_cache is None else self.metadata_cache.get(self.watermark_key)
+        data_ids = self._find_pushed_signals(metadata) if cached is None else cached.get('Data IDs', dict())
+        metadata['Data ID'] = [data_ids.get(x, x) for x in metadata.index]
+        if self.metadata_cache is not None:
+            fingerprint = self.metadata_cache.fingerprint(metadata, self.workbook, self.worksheet, self.datasource)
+            unchanged = self.skip_unchanged_metadata and cached is not None and cached['Fingerprint'] == fingerprint
+            if cached is not None and set(metadata.index) <= set(cached['IDs']) and (self.data_only or unchanged):
+                self.pushed_df = self._push_data_only(data, cached['IDs'])
+
+        if self.pushed_df is None:
+            self.pushed_df = spy.push(
+                data,
+                metadata=metadata,
+                workbook=self.workbook,
+                datasource=self.datasource,
+                worksheet=self.worksheet,
+                status=spy.Status(quiet=self.quiet)
+            )
+            if self.metadata_cache is not None and (self.pushed_df['Push Result'] == 'Success').all():
+                ids = dict(zip(metadata.index, self.pushed_df['ID']))
+                self.metadata_cache.put(self.watermark_key, fingerprint, ids,
+                                        data_ids=dict(zip(metadata.index, metadata['Data ID'])))
+        self._emit('push', 'end', rows=len(self.result_signal),
+                   nbytes=int(self.result_signal.memory_usage(index=True).sum()), started=started)
+
+        if self.watermarks is not None and (self.pushed_df['Push Result'] == 'Success').all():
+            self.watermarks.update(self.watermark_key, self.result_signal.index.max())
+
+    def _find_pushed_signals(self, metadata):
+        try:
+            found = spy.search(pd.DataFrame([{'Name': x, 'Type': 'Signal'} for x in metadata['Name']]),
+                               workbook=self.workbook, all_properties=True, quiet=True)
+        except Exception:
+            # the lookup only avoids duplicates of signals pushed with another data ID. The push goes on without it
+            return dict()
+        if not all(x in found.columns for x in ['Name', 'Data ID', 'Model Name', 'Model Version', 'Input Signals']):
+            return dict()
+        inputs = {x.upper() for x in self.input_signals.values()}
+        found = found[(found['Model Name'] == self.az_model_name) &
+                      (found['Model Version'].astype(str) == self.az_model_version) &
+                      (found['Input Signals'].apply(lambda x: set(_guids(x)) == inputs))]
+        if 'Datasource Name' in found.columns and self.datasource is not None:
+            found = found[found['Datasource Name'] == self.datasource]
+        data_ids = dict()
+        for data_id, row in metadata.iterrows():
+            matches = found[found['Name'] == row['Name']]
+            if 'Model Output' in row and 'Model Output' in matches.columns:
+                matches = matches[matches['Model Output'] == row['Model Output']]
+            if len(matches) > 0:
+                # duplicates pushed by older versions all qualify. The same one is picked by every run
+                data_ids[data_id] = sorted(matches['Data ID'])[0]
+        return data_ids
+
+    def _push_data_only(self, data, ids):
+        data = data.rename(columns=ids)
+        try:
+            return spy.push(data, workbook=self.workbook, datasource=self.datasource, worksheet=None,
+                            status=spy.Status(quiet=self.quiet))
+        except Exception as e:
+            # other failures, e.g. a timeout or an authentication error, are raised instead of pushing everything again
+            if not _is_not_found(e):
+                raise
+            # the signals were deleted in Seeq. They are pushed again with their metadata
+            self.metadata_cache.invalidate(self.watermark_key)
+            return None
+
+
+def _guids(s):
+    return [x.upper() for x in re.findall(GUID_PATTERN, str(s))]
+
+
+def _is_not_found(error):
+    # spy may wrap the ApiException of the Seeq API in its own exceptions
+    while error is not None:
+        if isinstance(error, ApiException) and error.status == 404:
+            return True
+        error = error.__cause__ or error.__context__
+    return False
+
+
+def _window_outcome(prediction=None, rows=0, result='Success', error=None):
+    return {'Prediction': prediction, 'Rows': rows, 'Result': result, 'Error': error}
@@ -0,0 +1,129 @@
+import random
+import warnings
+import threading
+import requests
+import urllib3
+from email.utils import parsedate_to_datetime
+from datetime import datetime, timezone
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from typing import Union
+
+POOL_CONNECTIONS = 16
+POOL_MAXSIZE = 32
+SCORING_TIMEOUT = (30, 900)
+MAX_RETRIES = 5
+BACKOFF_BASE = 1.0
+BACKOFF_MAX = 60.0
+RETRY_AFTER_MAX = 300.0
+# responses that tell the client to slow down. They also reduce the concurrency against the scoring URI
+THROTTLE_STATUSES = [429, 503]
+RETRY_STATUSES = THROTTLE_STATUSES + [500, 502, 504]
+
+_sessions = dict()
+_sessions_lock = threading.Lock()
+
+
+def scoring_session(verify: bool = True) -> requests.Session:
+    """
+    Returns the HTTP session used to post scoring requests. The session is
+    shared by all the investigations of the process so that the TCP and TLS
+    connections to the scoring URIs are pooled and kept alive across
+    windows, runs and endpoints.
+
+    Parameters
+    ----------
+    verify: bool, default True
+        If False, the session does not verify the server certificate, which
+        allows self-signed https certificates. The TLS policy is set on the
+        session only; the process-wide SSL context is left untouched. The
+        InsecureRequestWarning of urllib3 is then only shown once per host
+        instead of for every scoring request.
+
+    Returns
+    -------
+    session: requests.Session
+        A session with a connection pool for each scoring host
+    """
+    if not verify:
+        # set on every call, since warnings.catch_warnings, e.g. of a notebook cell or a test, restores the filters
+        warnings.filterwarnings('once', category=urllib3.exceptions.InsecureRequestWarning)
+    with _sessions_lock:
+        session = _sessions.get(verify)
+        if session is None:
+            # scoring POSTs are only retried when the connection could not be established
+            retry_strategy = Retry(
+                total=3,
+                connect=3,
+                read=0,
+                status=0,
+                backoff_factor=0.5,
+                allowed_methods=["POST"]
+            )
+            adapter = HTTPAdapter(pool_connections=POOL_CONNECTIONS, pool_maxsize=POOL_MAXSIZE,
+                                  max_retries=retry_strategy)
+            session = requests.Session()
+            session.verify = verify
+            session.mount("https://", adapter)
+            session.mount("http://", adapter)
+            _sessions[verify] = session
+        return session
+
+
+def retry_after_seconds(headers) -> Union[float, None]:
+    """
+    Reads the delay requested by the server before retrying a request
+
+    Parameters
+    ----------
+    headers: dict
+        Headers of the response. The `retry-after-ms` and
+        `x-ms-retry-after-ms` headers sent by Azure take precedence over
+        `Retry-After`, which may be a number of seconds or an HTTP date.
+
+    Returns
+    -------
+    delay: float or None
+        Seconds to wait before retrying, or None if the server did not ask
+        for a delay
+    """
+    headers = {k.lower(): v for k, v in headers.items()}
+    for header in ['retry-after-ms', 'x-ms-retry-after-ms']:
+        try:
+            return max(0.0, float(headers[header]) / 1000)
+        except (KeyError, TypeError, ValueError):
+            pass
+    value = headers.get('retry-after')
+    if value is None:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, (parsedate_to_datetime(value) - datetime.now(timezone.utc)).total_seconds())
+    except (TypeError, ValueError):
+        return None
+
+
+def backoff_delay(attempt: int, retry_after: Union[float, None] = None) -> float:
+    """
+    Returns the time to wait before retrying a failed scoring request
+
+    Parameters
+    ----------
+    attempt: int
+        Number of retries already made for the request
+    retry_after: float, optional
+        Delay requested by the server with the Retry-After header
+
+    Returns
+    -------
+    delay: float
+        Seconds to wait. The server's Retry-After is honored when given, up
+        to RETRY_AFTER_MAX; otherwise the delay grows exponentially with full
+        jitter, up to BACKOFF_MAX.
+    """
+    if retry_after is not None:
+        return min(retry_after, RETRY_AFTER_MAX)
+    return random.uniform(0, min(BACKOFF_MAX, BACKOFF_BASE * 2 ** attempt))
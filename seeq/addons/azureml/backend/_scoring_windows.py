@@ -0,0 +1,160 @@
+import math
+import pandas as pd
+from typing import List, Union
+# noinspection PyProtectedMember
+from seeq.spy import _login
+
+# Rough size of one value in the default ISO JSON payload ('"2021-12-06T20:14:00.000Z":10.2795732894,'). It is only
+# used to size the time windows when a byte budget is given; the real payload size is enforced after encoding.
+ESTIMATED_BYTES_PER_VALUE = 40
+
+
+class ScoringWindow:
+    """
+    A time window of an investigation range that is pulled from Seeq and
+    scored by the Azure ML endpoint in a single request
+
+    Attributes
+    ----------
+    index: int
+        Position of the window within the investigation range
+    start: pd.Timestamp
+        Start of the time range owned by this window. Predictions before this
+        timestamp are discarded when stitching the result.
+    end: pd.Timestamp
+        End of the time range owned by this window
+    pull_start: pd.Timestamp
+        Start of the data pulled from Seeq. It is earlier than `start` when a
+        lookback is requested so the model gets the history it needs.
+    last: bool
+        If True, this is the last window of the range and its end is inclusive.
+
+    Methods
+    -------
+    owned(index)
+        Returns a boolean mask of the timestamps owned by the window
+    """
+
+    def __init__(self, index: int, start: pd.Timestamp, end: pd.Timestamp, pull_start: pd.Timestamp,
+                 last: bool) -> None:
+        self.index = index
+        self.start = start
+        self.end = end
+        self.pull_start = pull_start
+        self.last = last
+
+    def __repr__(self):
+        return f'ScoringWindow({self.index}, {self.start}, {self.end})'
+
+    def owned(self, index: pd.DatetimeIndex):
+        """
+        Returns a boolean mask of the timestamps owned by the window
+
+        Parameters
+        ----------
+        index: pd.DatetimeIndex
+            Timestamps of the predictions returned for this window
+
+        Returns
+        -------
+        mask: np.ndarray
+            True for the timestamps that fall within [start, end). The end is
+            inclusive for the last window.
+        """
+        start = _align_timezone(self.start, index)
+        end = _align_timezone(self.end, index)
+        after_end = index > end if self.last else index >= end
+        return (index >= start) & ~after_end
+
+
+def split_time_range(start, end, grid: str, window_rows: Union[int, None] = None,
+                     window_bytes: Union[int, None] = None, columns: int = 1,
+                     lookback: Union[str, pd.Timedelta, None] = None) -> List[ScoringWindow]:
+    """
+    Splits an investigation range into consecutive scoring windows
+
+    Parameters
+    ----------
+    start: datetime
+        Start of the investigation range
+    end: datetime
+        End of the investigation range
+    grid: str
+        The sampling period of the pulled data, e.g. '5 min'
+    window_rows: int, optional
+        Maximum number of grid rows owned by each window. If None and
+        window_bytes is None, the whole range is one window.
+    window_bytes: int, optional
+        Approximate payload budget in bytes per window. It is converted to a
+        row count with ESTIMATED_BYTES_PER_VALUE when window_rows is None.
+    columns: int, default 1
+        Number of input signals, used to estimate the payload size of a row.
+    lookback: str or pd.Timedelta, optional
+        Amount of history pulled before each window for models that need
+        warm-up data. The predictions for the lookback period are discarded.
+
+    Returns
+    -------
+    windows: list
+        List of ScoringWindow objects covering [start, end] in time order
+    """
+    pd_start, pd_end = _login.validate_start_and_end(start, end)
+    lookback = pd.Timedelta(0) if lookback is None else pd.Timedelta(lookback)
+    if lookback < pd.Timedelta(0):
+        raise ValueError(f"The lookback must be a positive time period. Got {lookback}")
+
+    rows = window_rows
+    if rows is None and window_bytes is not None:
+        rows = max(1, int(window_bytes // (ESTIMATED_BYTES_PER_VALUE * (max(columns, 1) + 1))))
+    if rows is None:
+        return [ScoringWindow(0, pd_start, pd_end, pd_start - lookback, last=True)]
+    if rows < 1:
+        raise ValueError(f"The number of rows per window must be a positive integer. Got {rows}")
+
+    span = pd.Timedelta(grid) * rows
+    count = max(1, math.ceil((pd_end - pd_start) / span))
+    windows = list()
+    for i in range(count):
+        w_start = pd_start + span * i
+        w_end = min(w_start + span, pd_end)
+        windows.append(ScoringWindow(i, w_start, w_end, w_start - lookback, last=i == count - 1))
+    return windows
+
+
+def stitch_predictions(windows: List[ScoringWindow], predictions: List[pd.DataFrame]) -> pd.DataFrame:
+    """
+    Trims the predictions of each window to the time range it owns and
+    concatenates them into a single result frame
+
+    Parameters
+    ----------
+    windows: list
+        The ScoringWindow objects that were scored
+    predictions: list
+        The prediction DataFrames returned for each window. A None entry is
+        skipped, e.g. for windows without input data.
+
+    Returns
+    -------
+    result: pd.DataFrame
+        Predictions for the whole range, sorted by timestamp without duplicates
+    """
+    if len(windows) == 1 and windows[0].pull_start == windows[0].start:
+        # a single window without lookback is returned untouched, as the model sent it
+        return pd.DataFrame() if predictions[0] is None else predictions[0]
+    frames = [p[w.owned(p.index)] for w, p in zip(windows, predictions) if p is not None and not p.empty]
+    if len(frames) == 0:
+        return pd.DataFrame()
+    if len(frames) == 1:
+        return frames[0]
+    result = pd.concat(frames)
+    result = result[~result.index.duplicated(keep='first')]
+    return result.sort_index()
+
+
+def _align_timezone(timestamp: pd.Timestamp, index: pd.DatetimeIndex) -> pd.Timestamp:
+    # The models are expected to return UTC timestamps. A naive index is assumed to be UTC as well.
+    tz = getattr(index, 'tz', None)
+    if tz is None:
+        return timestamp.tz_convert('UTC').tz_localize(None)
+    return timestamp.tz_convert(tz)
@@ -1,7 +1,8 @@
 import pickle
-from seeq import spy
-from seeq.sdk import *
-from seeq.addons.azureml.backend import AmlOnlineEndpointService, OnlineEndpoint
+import pandas as pd
+from seeq.addons.azureml.backend import AmlOnlineEndpointService, OnlineEndpoint, EndpointCatalog
+from ._seeq_metadata import SeeqMetadataResolver
+from ._payload_encoders import get_payload_encoder
 from seeq.addons.azureml.utils import AzureMLException
 from seeq.addons.azureml import _config
 
@@ -16,6 +17,16 @@ class ModelInputsProvider:
     endpoint_svc: seeq.addons.azureml.backend.AmlOnlineEndpointService
         An instance of the AmlOnlineEndpointService to make the necessary calls
         to Azure ML services.
+    catalog: seeq.addons.azureml.backend.EndpointCatalog
+        The persistent catalog of the endpoints of the workspace. The
+        endpoints are read from the catalog, so the provider is available
+        without calling Azure ML if the workspace was discovered before.
+        The keys, deployments and models of an endpoint are only requested
+        when the endpoint is selected.
+    metadata: seeq.addons.azureml.backend.SeeqMetadataResolver
+        Resolves the Seeq asset trees and signal names of the model inputs.
+        The metadata is cached for the session and cleared when the
+        endpoints are refreshed.
     endpoints: dict
         Dictionary with endpoint names as keys and OnlineEndpoint(s) as values.
     deployment: seeq.addons.azureml.backend.OnlineDeployment
@@ -38,6 +49,12 @@ class ModelInputsProvider:
     model_endpoint_uri: str
         The endpoint identifier of the AzureML model used to compute the result
         signal.
+    model_payload_format: str
+        The format of the scoring request payload expected by the Azure ML
+        model. None for the default format.
+    model_lookback: str
+        Amount of history the Azure ML model needs before the first
+        timestamp scored. For example, '1 hour'.
     asset_path_from_signals: dict
         This attribute is determined when the Azure ML model specifies signal
         IDs as inputs rather than asset path IDs. If the input signals belong
@@ -46,7 +63,7 @@ class ModelInputsProvider:
         default to None.
 
     """
-    def __init__(self, config_file=None):
+    def __init__(self, config_file=None, on_endpoints_page=None):
         _config.validate_configuration_file(config_file)
         self.endpoint_svc = AmlOnlineEndpointService(tenant_id=_config.get('azure', 'TENANT_ID'),
                                                      app_id=_config.get('azure', 'APP_ID'),
@@ -54,8 +71,10 @@ class ModelInputsProvider:
                                                      subscription_id=_config.get('azure', 'SUBSCRIPTION_ID'),
                                                      resource_group=_config.get('azure', 'RESOURCE_GROUP'),
                                                      workspace_name=_config.get('azure', 'WORKSPACE_NAME'))
+        self.catalog = EndpointCatalog(self.endpoint_svc)
+        self.metadata = SeeqMetadataResolver()
 
-        self.endpoints = self.get_endpoints()
+        self.endpoints = self.get_endpoints(on_page=on_endpoints_page)
         self.deployment = None
         self.asset_paths = None
         self.model_name = None
@@ -63,15 +82,23 @@ class ModelInputsProvider:
         self.model_signal_inputs = None
         self.model_sample_rate = None
         self.model_endpoint_uri = None
+        self.model_payload_format = None
+        self.model_lookback = None
         self.asset_path_from_signals = None
         self._model_primary_key = None
 
-    def get_endpoints(self):
-        names = [x.name for x in self.endpoint_svc.list_online_endpoints()]
-        renames = _rename_duplicates(names)
-        return dict(zip(renames, self.endpoint_svc.list_online_endpoints()))
+    def get_endpoints(self, refresh=False, on_page=None):
+        if refresh:
+            self.metadata.clear()
+        oes = self.catalog.refresh(on_page=on_page) if refresh else self.catalog.endpoints(on_page=on_page)
+        return _endpoints_by_name(oes)
+
+    def update_endpoints(self, oes: list):
+        self.endpoints = _endpoints_by_name(oes)
 
     def update_deployment_from_endpoint(self, endpoint: OnlineEndpoint):
+        # the catalog only lists the endpoints. The details are requested for the selected endpoint only
+        self.catalog.resolve(endpoint)
         deployments = [x for x in endpoint.deployment]
         if len(deployments) > 1:
             raise AzureMLException(code=None, reason=None,
@@ -81,15 +108,18 @@ class ModelInputsProvider:
                                    message=f'There are no deployments associated with endpoint "{endpoint.name}"')
         self.deployment = deployments[0]
         if self.deployment.model is not None:
+            # invalid tags are reported when the endpoint is selected, instead of failing the investigation
+            _validate_model_tags(self.deployment.model)
             self.model_name = self.deployment.model.name
             self.model_version = self.deployment.model.version
             self.model_sample_rate = self.deployment.model.sample_rate
             self.model_endpoint_uri = endpoint.scoringUri
+            self.model_payload_format = self.deployment.model.payload_format
+            self.model_lookback = self.deployment.model.lookback
             self._model_primary_key = endpoint.primaryKey
 
     def update_assets_from_endpoint(self, endpoint: OnlineEndpoint):
         self.asset_paths = None
-        trees_api = TreesApi(spy.client)
         self.update_deployment_from_endpoint(endpoint)
         if self.deployment.model is None:
             return
@@ -99,16 +129,15 @@ class ModelInputsProvider:
                                        message=f"Path IDs were found in model {self.model_name}:{self.model_version}, "
                                                f"but the input signals for the model are not defined")
             asset_path_names = list()
+            trees = self.metadata.get_trees(self.deployment.model.asset_path_ids)
             for idd in self.deployment.model.asset_path_ids:
-                tree = trees_api.get_tree(id=idd)
+                tree = trees[idd]
                 asset_path_names.append(f"{' >> '.join([x.name for x in tree.item.ancestors if x.type == 'Asset'])} >> "
                                         f"{tree.item.name}")
             asset_path_names = _rename_duplicates(asset_path_names)
             self.asset_paths = dict(zip(asset_path_names, self.deployment.model.asset_path_ids))
 
     def update_signal_inputs_from_endpoint(self, endpoint, asset_path_id=None):
-        trees_api = TreesApi(spy.client)
-        signals_api = SignalsApi(spy.client)
         self.update_deployment_from_endpoint(endpoint)
         if self.deployment.model is None:
             return
@@ -119,14 +148,16 @@ class ModelInputsProvider:
             path_ids = list()
             signal_names = list()
             ordered_input_ids = _order_inputs(self.deployment.model.input_ids)
+            trees = self.metadata.get_trees(ordered_input_ids)
+            names = self.metadata.get_signal_names(ordered_input_ids)
 
             for idd in ordered_input_ids:
-                tree = trees_api.get_tree(id=idd)
+                tree = trees[idd]
                 if tree.item.ancestors:
                     path = " >> ".join([x.name for x in tree.item.ancestors if x.type == "Asset"])
                     path_ids.append(tree.item.ancestors[-1].id)
                     asset_paths.append(path)
-                signal_names.append(signals_api.get_signal(id=idd).name)
+                signal_names.append(names[idd])
             if len(list(set(asset_paths))) == 1:
                 self.asset_path_from_signals = {asset_paths[0]: path_ids[0]}
             else:
@@ -137,7 +168,7 @@ class ModelInputsProvider:
 
         elif asset_path_id is not None:
             ordered_input_names = _order_inputs(self.deployment.model.asset_input_names)
-            tree = trees_api.get_tree(id=asset_path_id)
+            tree = self.metadata.get_trees([asset_path_id])[asset_path_id]
             signal_names = []
             signal_ids = []
             for child in tree.children:
@@ -167,3 +198,26 @@ def _order_inputs(inputs: dict) -> list:
                   f'in sequential order but got inputs: {sorted(list(inputs.keys()))}'
         raise AzureMLException(code=None, reason=None, message=message)
     return [inputs[k] for k in input_numbers]
+
+
+def _validate_model_tags(model):
+    try:
+        get_payload_encoder(model.payload_format)
+    except ValueError as e:
+        raise AzureMLException(code=None, reason=None,
+                               message=f"Invalid PayloadFormat tag in model {model.name}:{model.version}. {e}")
+    if model.lookback is None:
+        return
+    try:
+        lookback = pd.Timedelta(model.lookback)
+    except ValueError:
+        lookback = pd.NaT
+    if pd.isna(lookback) or lookback < pd.Timedelta(0):
+        raise AzureMLException(code=None, reason=None,
+                               message=f'Invalid Lookback tag in model {model.name}:{model.version}. Expected a '
+                                       f'positive time period, e.g. "1 hour". Got "{model.lookback}"')
+
+
+def _endpoints_by_name(oes):
+    renames = _rename_duplicates([x.name for x in oes])
+    return dict(zip(renames, oes))
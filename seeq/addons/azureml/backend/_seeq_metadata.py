@@ -0,0 +1,136 @@
+import time
+import threading
+import pandas as pd
+from seeq import spy
+from seeq.sdk import TreesApi, SignalsApi
+from typing import Dict, List, Union
+from concurrent.futures import ThreadPoolExecutor
+from seeq.addons.azureml import _config
+
+MAX_WORKERS = 8
+DEFAULT_TTL = pd.Timedelta(minutes=15)
+
+
+class SeeqMetadataResolver:
+    """
+    Resolves the Seeq metadata needed to map the inputs of an Azure ML model
+    to Seeq items: the asset trees (name, ancestors and children) and the
+    signal names of a set of Seeq IDs. The requests for the IDs of a set are
+    sent concurrently, so resolving dozens of inputs or asset paths takes
+    about as long as resolving one.
+
+    The resolved metadata is kept in memory for the session, keyed by Seeq
+    ID, so selecting an endpoint or an asset again, or another model that
+    shares asset paths or signals, does not call the Seeq API. Entries older
+    than ttl are requested again, and clear drops all of them, e.g. when the
+    endpoints are refreshed.
+
+    Attributes
+    ----------
+    max_workers: int
+        Maximum number of requests sent to Seeq at the same time
+    ttl: pd.Timedelta
+        Age after which the metadata of an ID is requested again
+
+    Methods
+    -------
+    get_trees(ids)
+        Returns the asset trees of a set of Seeq IDs
+    get_signal_names(ids)
+        Returns the names of a set of Seeq signals
+    clear()
+        Removes all the cached metadata
+    """
+
+    def __init__(self, max_workers: int = MAX_WORKERS, ttl: Union[str, pd.Timedelta, None] = None) -> None:
+        """
+        Parameters
+        ----------
+        max_workers: int, default 8
+            Maximum number of requests sent to Seeq at the same time
+        ttl: str or pd.Timedelta, optional
+            Age after which the metadata of an ID is requested again. If
+            None, the METADATA_TTL_MINUTES option of the [cache] section of
+            the configuration file, or 15 minutes.
+        """
+        self.max_workers = max_workers
+        if ttl is None:
+            minutes = _config.get('cache', 'METADATA_TTL_MINUTES')
+            ttl = DEFAULT_TTL if minutes is None or str(minutes).strip() == '' else pd.Timedelta(minutes=float(minutes))
+        self.ttl = pd.Timedelta(ttl)
+        self._trees = dict()
+        self._names = dict()
+        self._lock = threading.Lock()
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        del state['_lock']
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._lock = threading.Lock()
+
+    def get_trees(self, ids: List[str]) -> Dict[str, object]:
+        """
+        Returns the asset trees of a set of Seeq IDs, with the ancestors and
+        the children of each item
+
+        Parameters
+        ----------
+        ids: list
+            The Seeq IDs of assets or signals
+
+        Returns
+        -------
+        trees: dict
+            The seeq.sdk.models.AssetTreeOutputV1 of each ID
+        """
+        trees_api = TreesApi(spy.client)
+        return self._fetch(lambda idd: trees_api.get_tree(id=idd), ids, self._trees)
+
+    def get_signal_names(self, ids: List[str]) -> Dict[str, str]:
+        """
+        Returns the names of a set of Seeq signals
+
+        Parameters
+        ----------
+        ids: list
+            The Seeq IDs of the signals
+
+        Returns
+        -------
+        names: dict
+            The name of each signal ID
+        """
+        signals_api = SignalsApi(spy.client)
+        return self._fetch(lambda idd: signals_api.get_signal(id=idd).name, ids, self._names)
+
+    def clear(self):
+        """
+        Removes all the cached metadata, so it is requested again from Seeq
+
+        Returns
+        -------
+        -: None
+        """
+        with self._lock:
+            self._trees.clear()
+            self._names.clear()
+
+    def _fetch(self, request, ids, cache):
+        ids = list(dict.fromkeys(ids))
+        now = time.monotonic()
+        ttl = self.ttl.total_seconds()
+        with self._lock:
+            cached = {idd: cache[idd][0] for idd in ids if idd in cache and now - cache[idd][1] <= ttl}
+        missing = [idd for idd in ids if idd not in cached]
+        if len(missing) <= 1:
+            fetched = {idd: request(idd) for idd in missing}
+        else:
+            with ThreadPoolExecutor(max_workers=min(self.max_workers, len(missing))) as executor:
+                fetched = dict(zip(missing, executor.map(request, missing)))
+        with self._lock:
+            cache.update({idd: (value, now) for idd, value in fetched.items()})
+        cached.update(fetched)
+        return {idd: cached[idd] for idd in ids}
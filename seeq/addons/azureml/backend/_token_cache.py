@@ -0,0 +1,109 @@
+import time
+import hashlib
+from pathlib import Path
+from typing import Tuple, Union
+from seeq.addons.azureml.utils import FileLock, cache_path, read_json, write_json
+
+TOKENS_FILE = 'tokens.json'
+
+
+class TokenCache:
+    """
+    A cache of the OAuth access tokens of the Azure service principals,
+    shared by all the processes of the host, e.g. the scheduled jobs and
+    the notebook kernels. The tokens are kept in a JSON file protected by a
+    file lock and only readable by the current user, with the time at which
+    each token expires.
+
+    Attributes
+    ----------
+    path: Path
+        Path of the JSON file with the tokens. The file lock of this path
+        also serializes the logins of the processes.
+
+    Methods
+    -------
+    key(tenant_id, app_id, resource)
+        Returns the cache key of a service principal and a resource
+    get(key, margin)
+        Returns a token that is still valid after margin seconds
+    put(key, token, expires_on)
+        Stores a token
+    """
+
+    def __init__(self, path: Union[str, Path, None] = None) -> None:
+        """
+        Parameters
+        ----------
+        path: str or Path, optional
+            Path of the JSON file with the tokens. By default,
+            ~/.seeq/azureml/tokens.json
+        """
+        self.path = cache_path(TOKENS_FILE) if path is None else Path(path)
+
+    @staticmethod
+    def key(tenant_id: str, app_id: str, resource: str) -> str:
+        """
+        Returns the cache key of a service principal and a resource
+
+        Parameters
+        ----------
+        tenant_id: str
+            The Azure tenant ID
+        app_id: str
+            The application (client) ID of the service principal
+        resource: str
+            The resource the token grants access to
+
+        Returns
+        -------
+        key: str
+            The cache key
+        """
+        return hashlib.sha1('|'.join([str(tenant_id), str(app_id), str(resource)]).encode()).hexdigest()
+
+    def get(self, key: str, margin: float = 0) -> Union[Tuple[str, float], None]:
+        """
+        Returns the cached token of a key if it is still valid after margin
+        seconds
+
+        Parameters
+        ----------
+        key: str
+            The cache key, see TokenCache.key
+        margin: float, default 0
+            Number of seconds the token must still be valid for
+
+        Returns
+        -------
+        token: tuple or None
+            The access token and the time it expires at, in seconds since
+            the epoch, or None if there is no valid token
+        """
+        entry = read_json(self.path, default=dict()).get(key)
+        if entry is None or entry['expires_on'] - time.time() <= margin:
+            return None
+        return entry['access_token'], entry['expires_on']
+
+    def put(self, key: str, token: str, expires_on: float):
+        """
+        Stores the token of a key and removes the expired tokens
+
+        Parameters
+        ----------
+        key: str
+            The cache key, see TokenCache.key
+        token: str
+            The access token
+        expires_on: float
+            Time at which the token expires, in seconds since the epoch
+
+        Returns
+        -------
+        -: None
+        """
+        with FileLock(self.path):
+            now = time.time()
+            tokens = {k: v for k, v in read_json(self.path, default=dict()).items() if v['expires_on'] > now}
+            tokens[key] = {'access_token': token, 'expires_on': float(expires_on)}
+            write_json(self.path, tokens)
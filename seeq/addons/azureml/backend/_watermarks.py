@@ -0,0 +1,109 @@
+import pandas as pd
+from pathlib import Path
+from typing import Union
+from seeq.addons.azureml.utils import FileLock, cache_path, read_json, write_json
+
+WATERMARKS_FILE = 'watermarks.json'
+
+
+class WatermarkStore:
+    """
+    Persists, per result signal, the last timestamp that was successfully
+    pushed to Seeq. Scheduled jobs use the watermark as the start of the
+    next run, so late or early executor starts neither leave gaps nor score
+    the same data twice. The store is a JSON file protected by a file lock,
+    so it can be shared by the jobs running in different processes.
+
+    Attributes
+    ----------
+    path: Path
+        Path of the JSON file with the watermarks
+
+    Methods
+    -------
+    get(key)
+        Returns the watermark of a result signal
+    update(key, timestamp)
+        Moves the watermark of a result signal forward
+    reset(key)
+        Removes the watermark of a result signal
+    """
+
+    def __init__(self, path: Union[str, Path, None] = None) -> None:
+        """
+        Parameters
+        ----------
+        path: str or Path, optional
+            Path of the JSON file with the watermarks. By default,
+            ~/.seeq/azureml/watermarks.json
+        """
+        self.path = cache_path(WATERMARKS_FILE) if path is None else Path(path)
+
+    def get(self, key: str) -> Union[pd.Timestamp, None]:
+        """
+        Returns the watermark of a result signal
+
+        Parameters
+        ----------
+        key: str
+            The watermark key of the result signal, see
+            RunInvestigation.watermark_key
+
+        Returns
+        -------
+        watermark: pd.Timestamp or None
+            The last timestamp pushed, or None if the result signal has
+            never been pushed
+        """
+        value = read_json(self.path, default=dict()).get(key)
+        return None if value is None else pd.Timestamp(value)
+
+    def update(self, key: str, timestamp) -> pd.Timestamp:
+        """
+        Moves the watermark of a result signal forward. A timestamp earlier
+        than the current watermark, e.g. from a manual backfill, leaves the
+        watermark unchanged.
+
+        Parameters
+        ----------
+        key: str
+            The watermark key of the result signal
+        timestamp: datetime
+            The last timestamp pushed. A timestamp without a timezone is
+            assumed to be UTC.
+
+        Returns
+        -------
+        watermark: pd.Timestamp
+            The watermark after the update
+        """
+        timestamp = pd.Timestamp(timestamp)
+        if timestamp.tz is None:
+            timestamp = timestamp.tz_localize('UTC')
+        with FileLock(self.path):
+            watermarks = read_json(self.path, default=dict())
+            current = watermarks.get(key)
+            if current is not None and pd.Timestamp(current) >= timestamp:
+                return pd.Timestamp(current)
+            watermarks[key] = timestamp.isoformat()
+            write_json(self.path, watermarks)
+        return timestamp
+
+    def reset(self, key: str):
+        """
+        Removes the watermark of a result signal, so that the next run
+        scores its full default range
+
+        Parameters
+        ----------
+        key: str
+            The watermark key of the result signal
+
+        Returns
+        -------
+        -: None
+        """
+        with FileLock(self.path):
+            watermarks = read_json(self.path, default=dict())
+            if watermarks.pop(key, None) is not None:
+                write_json(self.path, watermarks)
@@ -1,4 +1,5 @@
 import ipyvuetify as v
+from typing import Callable
 from pathlib import Path
 
 CURRENT_DIR = Path(__file__).parent.resolve()
@@ -13,10 +14,17 @@ class HamburgerMenu(v.VuetifyTemplate):
     template_file: str
         Modifies the VueTemplate.template_file attribute with the
         seeq.addons.azureml.ui_components.templates._hamburger_menu.vue template
+    refresh_on_click: Callable
+        Called when the "Refresh Endpoints" item is clicked
 
     """
 
     template_file = str(CURRENT_DIR.joinpath('templates',  '_hamburger_menu.vue'))
 
-    def __init__(self, *args, **kwargs):
+    def __init__(self, *args, refresh_on_click: Callable[[str], None] = None, **kwargs):
         super().__init__(*args, **kwargs)
+        self.refresh_on_click = refresh_on_click
+
+    def vue_refresh_on_click(self, data=None):
+        if self.refresh_on_click is not None:
+            self.refresh_on_click(data)
@@ -50,6 +50,16 @@ class ModelSummary(v.VuetifyTemplate):
     button_loading: bool, default False
         If True, the submit button shows a loading spinner. Otherwise, it
         shows the name of the button.
+    progress_visible: bool, default False
+        If True, the progress of the running investigation and the cancel
+        button are visible.
+    progress_message: str
+        The stage, window and throughput of the running investigation
+    progress_value: float, default 0
+        Percentage of the windows of the running investigation that are
+        done
+    cancel_disabled: bool, default False
+        If True, the cancel button is disabled, e.g. once it was clicked.
     error_title: str
         Title of the error_message displayed to the left of error_message.
     error_message: str
@@ -72,11 +82,16 @@ class ModelSummary(v.VuetifyTemplate):
     frequency_info = traitlets.Unicode(allow_none=True).tag(sync=True)
     button_disabled = traitlets.Bool(allow_none=True).tag(sync=True)
     button_loading = traitlets.Bool(default_value=False).tag(sync=True)
+    progress_visible = traitlets.Bool(default_value=False).tag(sync=True)
+    progress_message = traitlets.Unicode(default_value='', allow_none=True).tag(sync=True)
+    progress_value = traitlets.Float(default_value=0).tag(sync=True)
+    cancel_disabled = traitlets.Bool(default_value=False).tag(sync=True)
     error_title = traitlets.Unicode(allow_none=True).tag(sync=True)
     error_message = traitlets.Unicode(allow_none=True).tag(sync=True)
     message_type = traitlets.Unicode(allow_none=True).tag(sync=True)
 
-    def __init__(self, *args, button_on_click: Callable[[str], None] = None, **kwargs):
+    def __init__(self, *args, button_on_click: Callable[[str], None] = None,
+                 cancel_on_click: Callable[[str], None] = None, **kwargs):
         super().__init__(*args, **kwargs)
         self.endpoint_info = kwargs.get('endpoint_info')
         self.asset_info = kwargs.get('asset_info')
@@ -93,7 +108,12 @@ class ModelSummary(v.VuetifyTemplate):
         self.time_range_warning = kwargs.get('time_range_warning')
 
         self.button_on_click = button_on_click
+        self.cancel_on_click = cancel_on_click
 
     def vue_button_on_click(self, data=None):
         if self.button_on_click:
             self.button_on_click(data)
+
+    def vue_cancel_on_click(self, data=None):
+        if self.cancel_on_click:
+            self.cancel_on_click(data)
@@ -1,5 +1,8 @@
-from ._exceptions import AzureMLException
+from ._exceptions import AzureMLException, InvestigationCanceled
 from ._sdl import get_workbook_worksheet_workstep_ids
+from ._persistence import FileLock, cache_path, atomic_write, read_json, write_json
+from ._lru_store import LruStore
 
 
-__all__ = ['get_workbook_worksheet_workstep_ids', 'AzureMLException']
+__all__ = ['get_workbook_worksheet_workstep_ids', 'AzureMLException', 'InvestigationCanceled', 'FileLock', 'cache_path',
+           'atomic_write', 'read_json', 'write_json', 'LruStore']
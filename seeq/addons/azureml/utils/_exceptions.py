@@ -19,3 +19,17 @@ class AzureMLException(Exception):
 
     def __str__(self):
         return f'{str(self.code)}\n{self.reason}\n{self.message}'
+
+
+class InvestigationCanceled(AzureMLException):
+    """Exception raised when an investigation is stopped with its
+    cancellation token.
+
+    Attributes
+    ----------
+        message: str
+            explanation of the cancellation
+    """
+
+    def __init__(self, message="The investigation was canceled"):
+        super().__init__(code=None, reason=None, message=message)
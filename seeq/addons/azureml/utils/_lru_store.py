@@ -0,0 +1,230 @@
+import os
+import pickle
+import threading
+from pathlib import Path
+from typing import Union
+from collections import OrderedDict
+from ._persistence import atomic_write
+
+
+class LruStore:
+    """
+    A key-value store kept in memory and in a folder on disk, with a budget
+    in bytes for each. When a budget is exceeded, the least recently used
+    values are evicted. The values are pickled on disk, so the folder must
+    only be writable by the current user.
+
+    Attributes
+    ----------
+    directory: Path
+        The folder of the files on disk
+    memory_budget: int
+        Maximum number of bytes of the values kept in memory
+    disk_budget: int
+        Maximum number of bytes of the files on disk. If 0, the values only
+        live in memory.
+
+    Methods
+    -------
+    get(key)
+        Returns the value of a key
+    put(key, value, size)
+        Stores the value of a key
+    remove(key)
+        Removes the value of a key
+    keys()
+        Returns the keys in memory and on disk
+    items()
+        Returns the keys and values in memory and on disk
+    clear()
+        Removes all the values
+    """
+
+    def __init__(self, directory: Union[str, Path], memory_budget: int, disk_budget: int) -> None:
+        """
+        Parameters
+        ----------
+        directory: str or Path
+            The folder of the files on disk
+        memory_budget: int
+            Maximum number of bytes of the values kept in memory
+        disk_budget: int
+            Maximum number of bytes of the files on disk. Use 0 to keep the
+            values in memory only.
+        """
+        if memory_budget < 0 or disk_budget < 0:
+            raise ValueError(f"The budgets must be non-negative numbers of bytes. "
+                             f"Got {memory_budget} and {disk_budget}")
+        self.directory = Path(directory)
+        self.memory_budget = memory_budget
+        self.disk_budget = disk_budget
+        self._entries = OrderedDict()
+        self._lock = threading.RLock()
+
+    def get(self, key: str):
+        """
+        Returns the value of a key and marks it as the most recently used
+
+        Parameters
+        ----------
+        key: str
+            The key, which is also the name of the file on disk
+
+        Returns
+        -------
+        value: object
+            The value, or None if the key is not stored
+        """
+        with self._lock:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                return self._entries[key][0]
+        if self.disk_budget <= 0:
+            return None
+        # the file is read without the lock, so large values do not block the other keys
+        file = self._file(key)
+        value = _read(file)
+        if value is not None:
+            try:
+                os.utime(file)
+                # the pickled size is a good enough estimate of the size in memory
+                size = file.stat().st_size
+            except OSError:
+                return value
+            with self._lock:
+                self._keep_in_memory(key, value, size)
+        return value
+
+    def put(self, key: str, value, size: int):
+        """
+        Stores the value of a key in memory and on disk, evicting the least
+        recently used values if a budget is exceeded
+
+        Parameters
+        ----------
+        key: str
+            The key, which is also the name of the file on disk
+        value: object
+            A picklable value
+        size: int
+            Number of bytes of the value in memory
+
+        Returns
+        -------
+        -: None
+        """
+        with self._lock:
+            self._keep_in_memory(key, value, size)
+        if self.disk_budget <= 0:
+            return
+        # the value is pickled and written without the lock. The write is atomic, so readers never see a partial file
+        data = pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL)
+        if len(data) > self.disk_budget:
+            _remove(self._file(key))
+            return
+        atomic_write(self._file(key), data)
+        with self._lock:
+            self._evict_files()
+
+    def remove(self, key: str):
+        """
+        Removes the value of a key from memory and disk
+
+        Parameters
+        ----------
+        key: str
+            The key
+
+        Returns
+        -------
+        -: None
+        """
+        with self._lock:
+            self._entries.pop(key, None)
+            _remove(self._file(key))
+
+    def keys(self):
+        """
+        Returns the keys in memory and on disk, without reading the values
+
+        Returns
+        -------
+        keys: list
+            List of keys
+        """
+        with self._lock:
+            keys = list(self._entries.keys())
+            return keys + [x.stem for x in self._files() if x.stem not in self._entries]
+
+    def items(self):
+        """
+        Returns the keys and values in memory and on disk, e.g. to find the
+        values to invalidate. The values on disk are read, so this may be
+        slow for a large store.
+
+        Returns
+        -------
+        items: list
+            List of (key, value) tuples
+        """
+        with self._lock:
+            items = {k: v[0] for k, v in self._entries.items()}
+            for file in self._files():
+                if file.stem not in items:
+                    value = _read(file)
+                    if value is not None:
+                        items[file.stem] = value
+            return list(items.items())
+
+    def clear(self):
+        """
+        Removes all the values from memory and disk
+
+        Returns
+        -------
+        -: None
+        """
+        with self._lock:
+            self._entries.clear()
+            for file in self._files():
+                _remove(file)
+
+    def _file(self, key):
+        return self.directory.joinpath(f'{key}.pkl')
+
+    def _keep_in_memory(self, key, value, size):
+        self._entries.pop(key, None)
+        if size > self.memory_budget:
+            return
+        self._entries[key] = (value, size)
+        while sum(x[1] for x in self._entries.values()) > self.memory_budget:
+            self._entries.popitem(last=False)
+
+    def _evict_files(self):
+        files = sorted(self._files(), key=lambda x: x.stat().st_mtime)
+        total = sum(x.stat().st_size for x in files)
+        for file in files[:-1]:
+            if total <= self.disk_budget:
+                break
+            total -= file.stat().st_size
+            _remove(file)
+
+    def _files(self):
+        if not self.directory.is_dir():
+            return list()
+        return list(self.directory.glob('*.pkl'))
+
+
+def _read(file):
+    try:
+        with open(file, 'rb') as f:
+            return pickle.load(f)
+    except (OSError, EOFError, pickle.UnpicklingError, AttributeError, ImportError):
+        return None
+
+
+def _remove(file):
+    try:
+        os.remove(file)
+    except OSError:
+        pass
@@ -0,0 +1,184 @@
+import os
+import json
+import time
+import tempfile
+import threading
+from pathlib import Path
+from typing import Union
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
+
+CACHE_DIR = Path.home().joinpath('.seeq', 'azureml')
+
+
+def cache_path(*parts) -> Path:
+    """
+    Returns a path within the local cache folder of the Azure ML
+    Integration, ~/.seeq/azureml, and creates its parent folders
+
+    Parameters
+    ----------
+    parts: str
+        Components of the path relative to the cache folder
+
+    Returns
+    -------
+    path: Path
+        The full path
+    """
+    path = CACHE_DIR.joinpath(*parts)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    return path
+
+
+class FileLock:
+    """
+    An exclusive lock shared by threads and processes, backed by a lock file
+    next to the file it protects. It is used as a context manager and is
+    reentrant within a thread.
+
+    Attributes
+    ----------
+    path: Path
+        Path of the lock file
+    """
+
+    _states = dict()
+    _states_guard = threading.Lock()
+
+    def __init__(self, path: Union[str, Path]) -> None:
+        """
+        Parameters
+        ----------
+        path: str or Path
+            Path of the protected file. The lock file is the same path with
+            a '.lock' suffix.
+        """
+        self.path = Path(f'{path}.lock')
+        with FileLock._states_guard:
+            # the state is shared by all the FileLock objects of the same path in the process
+            self._state = FileLock._states.setdefault(str(self.path),
+                                                      {'lock': threading.RLock(), 'depth': 0, 'file': None})
+
+    def __enter__(self):
+        self._state['lock'].acquire()
+        self._state['depth'] += 1
+        if self._state['depth'] > 1:
+            return self
+        try:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            self._state['file'] = open(self.path, 'a+')
+            _lock_file(self._state['file'])
+        except BaseException:
+            self._state['depth'] -= 1
+            self._state['lock'].release()
+            raise
+        return self
+
+    def __exit__(self, *_):
+        try:
+            self._state['depth'] -= 1
+            if self._state['depth'] == 0:
+                _unlock_file(self._state['file'])
+                self._state['file'].close()
+                self._state['file'] = None
+        finally:
+            self._state['lock'].release()
+
+
+def atomic_write(path: Union[str, Path], data: bytes):
+    """
+    Writes a file atomically, so that concurrent readers see either the old
+    or the new content. The file is only readable by the current user since
+    it may contain keys or tokens.
+
+    Parameters
+    ----------
+    path: str or Path
+        Path of the file
+    data: bytes
+        New content of the file
+
+    Returns
+    -------
+    -: None
+    """
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    fd, tmp = tempfile.mkstemp(dir=str(path.parent), prefix=f'.{path.name}.')
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            f.write(data)
+        os.chmod(tmp, 0o600)
+        os.replace(tmp, str(path))
+    except BaseException:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+        raise
+
+
+def read_json(path: Union[str, Path], default=None):
+    """
+    Reads a JSON file, returning a default value if the file does not exist
+    or is corrupted
+
+    Parameters
+    ----------
+    path: str or Path
+        Path of the file
+    default: object
+        Value returned if the file cannot be read
+
+    Returns
+    -------
+    value: object
+        The deserialized content of the file
+    """
+    try:
+        with open(path, 'r') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return default
+
+
+def write_json(path: Union[str, Path], value):
+    """
+    Writes a JSON file atomically
+
+    Parameters
+    ----------
+    path: str or Path
+        Path of the file
+    value: object
+        A JSON serializable value
+
+    Returns
+    -------
+    -: None
+    """
+    atomic_write(path, json.dumps(value, indent=1, default=str).encode())
+
+
+def _lock_file(file):
+    if fcntl is not None:
+        fcntl.flock(file.fileno(), fcntl.LOCK_EX)
+        return
+    while True:
+        try:
+            file.seek(0)
+            msvcrt.locking(file.fileno(), msvcrt.LK_LOCK, 1)
+            return
+        except OSError:
+            time.sleep(0.05)
+
+
+def _unlock_file(file):
+    if fcntl is not None:
+        fcntl.flock(file.fileno(), fcntl.LOCK_UN)
+        return
+    file.seek(0)
+    msvcrt.locking(file.fileno(), msvcrt.LK_UNLCK, 1)
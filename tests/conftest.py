@@ -1,11 +1,14 @@
 import pytest
 from seeq.addons.azureml import _config
+from seeq.addons.azureml.utils import _persistence
 from . import test_common
 
 
 @pytest.fixture()
-def unit_test_config():
+def unit_test_config(tmp_path, monkeypatch):
     _config.configuration_parser = None
+    # keeps the unit tests away from the caches of the user
+    monkeypatch.setattr(_persistence, 'CACHE_DIR', tmp_path.joinpath('cache'))
 
 
 @pytest.fixture()
@@ -1,10 +1,21 @@
+import io
+import time
+import urllib3
+import warnings
+import threading
+import gzip
+import hashlib
 import pytest
 import mock
 import json
+import numpy as np
 import pandas as pd
 from seeq import spy
+from seeq.sdk.rest import ApiException
 from seeq.addons.azureml import backend
 from seeq.addons.azureml import _config
+from seeq.addons.azureml import utils
+from seeq.addons.azureml.utils import AzureMLException, FileLock, read_json
 from . import test_common
 
 
@@ -28,6 +39,8 @@ def test_amlmodel_asset_paths(unit_test_config):
         '1': 'Relative Humidity'
         }
     assert model.sample_rate == '2min'
+    assert model.payload_format is None
+    assert model.lookback is None
 
 
 @pytest.mark.unit
@@ -49,6 +62,7 @@ def test_amlmodel_signal_ids(unit_test_config):
     assert model.asset_path_ids == []
     assert model.asset_input_names == {}
     assert model.sample_rate == '2min'
+    assert model.payload_format == 'split+gzip'
 
 
 @pytest.mark.unit
@@ -119,6 +133,191 @@ def test_list_online_endpoints(unit_test_config):
             assert len(endpoint.deployment) == 1
 
 
+@pytest.mark.unit
+def test_list_online_endpoints_fan_out(unit_test_config):
+    instance_ = backend.AmlOnlineEndpointService("tenant_id", "app_id", "app_secret", "fan_out_subscription",
+                                                 "resource_group", "workspace_name", max_workers=3)
+    lock = threading.Lock()
+    in_flight = {'now': 0, 'max': 0}
+    throttled = list()
+
+    def slow_response(url, **kwargs):
+        with lock:
+            in_flight['now'] += 1
+            in_flight['max'] = max(in_flight['max'], in_flight['now'])
+        try:
+            time.sleep(0.02)
+            if url.endswith('/regressor:6') and not throttled:
+                throttled.append(url)
+                return test_common.MockResponse({}, 429, headers={'Retry-After': '0'})
+            return test_common.mocked_aml_response(url, **kwargs)
+        finally:
+            with lock:
+                in_flight['now'] -= 1
+
+    with mock.patch.object(backend.AmlOnlineEndpointService, '_authorize', return_value="token"), \
+            mock.patch.object(instance_._http, 'get', side_effect=slow_response), \
+            mock.patch.object(instance_._http, 'post', side_effect=slow_response):
+        oes = instance_.list_online_endpoints()
+
+        # the unmanaged endpoints come first, each listing in the order returned by Azure ML
+        listed = instance_._get_unmanaged_online_endpoints() + instance_._get_managed_online_endpoints()
+
+    assert 1 < in_flight['max'] <= 3
+    assert len(throttled) == 1
+    assert [x.name for x in oes] == [x.name for x in listed]
+    for endpoint in oes:
+        assert endpoint.primaryKey == 'p-key'
+        for deployment in endpoint.deployment:
+            assert isinstance(deployment.model, backend.AmlModel)
+
+    with mock.patch.object(backend.AmlOnlineEndpointService, '_authorize', return_value="token"), \
+            mock.patch.object(instance_._http, 'get', side_effect=test_common.mocked_aml_response), \
+            mock.patch.object(instance_._http, 'post',
+                              return_value=test_common.MockResponse({}, 403)):
+        with pytest.raises(AzureMLException, match='Error listing keys'):
+            instance_.list_online_endpoints()
+
+
+@pytest.mark.unit
+def test_paged_listings(unit_test_config):
+    with open(test_common.DATA_DIR.joinpath("onlineEndpoints_response.json")) as f:
+        endpoints = json.load(f)
+    next_page = 'https://management.azure.com/next-page-of-endpoints'
+    next_deployments = 'https://management.azure.com/next-page-of-deployments'
+
+    def paged_response(url, **kwargs):
+        if url.endswith("onlineEndpoints?api-version=2021-03-01-preview"):
+            return test_common.MockResponse({'value': endpoints['value'][:2], 'nextLink': next_page}, 200)
+        if url == next_page:
+            return test_common.MockResponse({'value': endpoints['value'][2:]}, 200)
+        if url == next_deployments:
+            return test_common.MockResponse({'value': []}, 200)
+        response = test_common.mocked_aml_response(url, **kwargs)
+        if '/deployments?' in url:
+            response.json_data = dict(response.json_data, nextLink=next_deployments)
+        return response
+
+    instance_ = backend.AmlOnlineEndpointService("tenant_id", "app_id", "app_secret", "subscription_id",
+                                                 "resource_group", "workspace_name")
+    pages = list()
+    with mock.patch.object(backend.AmlOnlineEndpointService, '_authorize', return_value="token"), \
+            mock.patch.object(instance_._http, 'get', side_effect=paged_response) as get, \
+            mock.patch.object(instance_._http, 'post', side_effect=test_common.mocked_aml_response):
+        oes = instance_.list_online_endpoints(on_page=pages.append)
+        assert len(oes) == 5
+        assert sorted(len(x) for x in pages) == [1, 2, 2]
+        assert sum(1 for x in get.call_args_list if x[0][0] == next_deployments) == 4
+        assert all(len(x.deployment) == 1 for x in oes if x.name != 'jrd-test')
+
+        # the iterator only requests the next page when the iteration gets to it
+        get.reset_mock()
+        iterator = instance_.iter_online_endpoints()
+        assert next(iterator).name == 'regressor-v6-svc'
+        assert not any('onlineEndpoints' in x[0][0] for x in get.call_args_list)
+        assert [x.name for x in iterator] == [x.name for x in oes[1:]]
+        assert sum(1 for x in get.call_args_list if x[0][0] == next_page) == 1
+
+
+@pytest.mark.unit
+def test_workspace_discovery(unit_test_config):
+    def discovery_calls(instance_):
+        with mock.patch.object(backend.AmlOnlineEndpointService, '_authorize', return_value="token"), \
+                mock.patch.object(instance_._http, 'get', side_effect=test_common.mocked_aml_response) as get, \
+                mock.patch.object(instance_._http, 'post', side_effect=test_common.mocked_aml_response):
+            instance_.list_online_endpoints()
+        return [x[0][0] for x in get.call_args_list if x[0][0].endswith('/?api-version=2021-03-01-preview') or
+                x[0][0].endswith('/discovery')]
+
+    def service():
+        return backend.AmlOnlineEndpointService("tenant_id", "app_id", "app_secret", "subscription_id",
+                                                "resource_group", "workspace_name")
+
+    # the ACI listing and the keys of the ACI endpoint share a single discovery
+    assert len(discovery_calls(service())) == 2
+    assert discovery_calls(service()) == []
+
+    # an expired discovery is requested again
+    path = utils.cache_path(backend._aml_online_endpoint_service.WORKSPACES_FILE)
+    utils.write_json(path, {k: dict(v, expires_on=0) for k, v in read_json(path).items()})
+    assert len(discovery_calls(service())) == 2
+
+
+@pytest.mark.unit
+def test_model_metadata_cache(unit_test_config):
+    def list_endpoints(instance_):
+        with mock.patch.object(backend.AmlOnlineEndpointService, '_authorize', return_value="token"), \
+                mock.patch.object(instance_._http, 'get', side_effect=test_common.mocked_aml_response) as get, \
+                mock.patch.object(instance_._http, 'post', side_effect=test_common.mocked_aml_response):
+            oes = instance_.list_online_endpoints()
+        return oes, [x[0][0] for x in get.call_args_list if x[0][0].startswith('https://ml.azure.com/api/')]
+
+    oes, model_calls = list_endpoints(backend.AmlOnlineEndpointService(
+        "tenant_id", "app_id", "app_secret", "subscription_id", "resource_group", "workspace_name"))
+    assert len(model_calls) == 4
+
+    # a new instance, e.g. in another process, reads the model versions from the disk cache
+    cached_oes, model_calls = list_endpoints(backend.AmlOnlineEndpointService(
+        "tenant_id", "app_id", "app_secret", "subscription_id", "resource_group", "workspace_name"))
+    assert model_calls == []
+    for oe, cached_oe in zip(oes, cached_oes):
+        for d, cached_d in zip(oe.deployment, cached_oe.deployment):
+            assert cached_d.model is not d.model
+            assert vars(cached_d.model) == vars(d.model)
+
+    cache = backend.ModelMetadataCache()
+    assert cache.is_cacheable('/subscriptions/s/resourceGroups/r/providers/Microsoft.MachineLearningServices/'
+                              'workspaces/w/models/regressor/versions/6')
+    assert not cache.is_cacheable('/subscriptions/s/resourceGroups/r/providers/Microsoft.MachineLearningServices/'
+                                  'workspaces/w/models/regressor')
+    cache.put('/models/regressor', {'name': 'regressor'})
+    assert cache.get('/models/regressor') is None
+    cache.clear()
+    _, model_calls = list_endpoints(backend.AmlOnlineEndpointService(
+        "tenant_id", "app_id", "app_secret", "subscription_id", "resource_group", "workspace_name",
+        model_cache=cache))
+    assert len(model_calls) == 4
+
+
+@pytest.mark.unit
+def test_token_cache(unit_test_config):
+    def service(app_id="app_id"):
+        return backend.AmlOnlineEndpointService("tenant_id", app_id, "app_secret", "subscription_id",
+                                                "resource_group", "workspace_name")
+
+    logins = list()
+
+    def login(url, **kwargs):
+        logins.append(url)
+        return test_common.MockResponse({'access_token': f'token-{len(logins)}', 'expires_in': '3599'}, 200)
+
+    with mock.patch.object(backend._aml_online_endpoint_service.requests.Session, 'post', side_effect=login):
+        assert service()._authorize() == 'token-1'
+        # another instance, e.g. a scheduled job in another process, reuses the cached token
+        svc = service()
+        assert svc._authorize() == 'token-1'
+        assert len(logins) == 1
+        assert svc.token_cache.path.stat().st_mode & 0o777 == 0o600
+        assert svc.token_cache.get(svc._token_key)[1] == pytest.approx(time.time() + 3599, abs=5)
+        # the tokens are keyed by service principal
+        assert service(app_id="other_app")._authorize() == 'token-2'
+
+        # a token close to its expiry is returned and refreshed in the background
+        svc.token_cache.put(svc._token_key, 'token-old', time.time() + 120)
+        svc = service()
+        assert svc._authorize() == 'token-old'
+        for _ in range(100):
+            if svc.token_cache.get(svc._token_key)[0] != 'token-old':
+                break
+            time.sleep(0.01)
+        assert svc.token_cache.get(svc._token_key)[0] == 'token-3'
+        assert service()._authorize() == 'token-3'
+
+        # an expired token is never used
+        svc.token_cache.put(svc._token_key, 'token-expired', time.time() + 30)
+        assert service()._authorize() == 'token-4'
+
+
 @pytest.mark.unit
 def test_model_inputs_provider_asset_path_ids(unit_test_config):
     selected_endpoint = 'seeq-simple-demo-3'
@@ -127,7 +326,7 @@ def test_model_inputs_provider_asset_path_ids(unit_test_config):
                               side_effect=test_common.mocked_aml_response), \
             mock.patch.object(backend._aml_online_endpoint_service.requests.Session, 'post',
                               side_effect=test_common.mocked_aml_response), \
-            mock.patch.object(backend._seeq_inputs_provider.TreesApi, 'get_tree',
+            mock.patch.object(backend._seeq_metadata.TreesApi, 'get_tree',
                               side_effect=test_common.mocked_get_tree_api_response), \
             mock.patch.object(_config, 'validate_configuration_file', return_value=None):
         assert _config.get('azure', 'TENANT_ID') is None
@@ -159,9 +358,9 @@ def test_model_inputs_provider_signal_ids(unit_test_config):
                               side_effect=test_common.mocked_aml_response), \
             mock.patch.object(backend._aml_online_endpoint_service.requests.Session, 'post',
                               side_effect=test_common.mocked_aml_response), \
-            mock.patch.object(backend._seeq_inputs_provider.TreesApi, 'get_tree',
+            mock.patch.object(backend._seeq_metadata.TreesApi, 'get_tree',
                               side_effect=test_common.mocked_get_tree_api_response), \
-            mock.patch.object(backend._seeq_inputs_provider.SignalsApi, 'get_signal',
+            mock.patch.object(backend._seeq_metadata.SignalsApi, 'get_signal',
                               side_effect=test_common.mocked_get_signal_api_response), \
             mock.patch.object(_config, 'validate_configuration_file', return_value=None):
         assert _config.get('azure', 'TENANT_ID') is None
@@ -181,6 +380,862 @@ def test_model_inputs_provider_signal_ids(unit_test_config):
             'Temperature': 'F8E053D1-A4D5-4671-9969-1D5D7D4F27DD'
             }
 
+        # invalid tags of the model are reported when the endpoint is selected
+        model = inputs_provider.deployment.model
+        model.payload_format = 'xml'
+        with pytest.raises(AzureMLException, match='PayloadFormat'):
+            inputs_provider.update_signal_inputs_from_endpoint(inputs_provider.endpoints[selected_endpoint])
+        model.payload_format = 'split+gzip'
+        for lookback in ['soon', '', '-1h']:
+            model.lookback = lookback
+            with pytest.raises(AzureMLException, match='Lookback'):
+                inputs_provider.update_signal_inputs_from_endpoint(inputs_provider.endpoints[selected_endpoint])
+        model.lookback = '1 hour'
+        inputs_provider.update_signal_inputs_from_endpoint(inputs_provider.endpoints[selected_endpoint])
+        assert inputs_provider.model_lookback == '1 hour'
+
+
+@pytest.mark.unit
+def test_seeq_metadata_resolver(unit_test_config):
+    ids = ['4E9416E8-9C75-426A-8E0A-4D07432CAC5D', '62E6F850-E523-408D-AD10-0C87E65F996B',
+           'CD732D0B-C3BA-496F-B69E-55543944B5F1', 'F8E053D1-A4D5-4671-9969-1D5D7D4F27DD']
+    in_flight = list()
+    peak = list()
+    lock = threading.Lock()
+
+    def slow_get_tree(id):
+        with lock:
+            in_flight.append(id)
+            peak.append(len(in_flight))
+        time.sleep(0.05)
+        with lock:
+            in_flight.remove(id)
+        return test_common.mocked_get_tree_api_response(id)
+
+    resolver = backend.SeeqMetadataResolver(max_workers=4)
+    with mock.patch.object(backend._seeq_metadata.TreesApi, 'get_tree', side_effect=slow_get_tree) as get_tree, \
+            mock.patch.object(backend._seeq_metadata.SignalsApi, 'get_signal',
+                              side_effect=test_common.mocked_get_signal_api_response):
+        trees = resolver.get_trees(ids + ids[:1])
+        names = resolver.get_signal_names(ids)
+
+    # duplicated IDs are requested once and the requests overlap
+    assert get_tree.call_count == 4
+    assert max(peak) > 1
+    assert list(trees) == ids
+    assert all(trees[idd].item.id == idd for idd in ids)
+    assert list(names.values()) == ['Relative Humidity', 'Optimizer', 'Wet Bulb', 'Temperature']
+
+
+@pytest.mark.unit
+def test_seeq_metadata_cache(unit_test_config):
+    selected_endpoint = 'seeq-simple-demo'
+    with mock.patch.object(backend.AmlOnlineEndpointService, '_authorize', return_value="token"), \
+            mock.patch.object(backend._aml_online_endpoint_service.requests.Session, 'get',
+                              side_effect=test_common.mocked_aml_response), \
+            mock.patch.object(backend._aml_online_endpoint_service.requests.Session, 'post',
+                              side_effect=test_common.mocked_aml_response), \
+            mock.patch.object(backend._seeq_metadata.TreesApi, 'get_tree',
+                              side_effect=test_common.mocked_get_tree_api_response) as get_tree, \
+            mock.patch.object(backend._seeq_metadata.SignalsApi, 'get_signal',
+                              side_effect=test_common.mocked_get_signal_api_response) as get_signal, \
+            mock.patch.object(_config, 'validate_configuration_file', return_value=None):
+        inputs_provider = backend.ModelInputsProvider()
+        assert inputs_provider.metadata.ttl == pd.Timedelta(minutes=15)
+        endpoint = inputs_provider.endpoints[selected_endpoint]
+        inputs_provider.update_signal_inputs_from_endpoint(endpoint)
+        assert (get_tree.call_count, get_signal.call_count) == (4, 4)
+        model_signal_inputs = inputs_provider.model_signal_inputs
+
+        # selecting the endpoint again does not call the Seeq API
+        inputs_provider.update_signal_inputs_from_endpoint(endpoint)
+        assert (get_tree.call_count, get_signal.call_count) == (4, 4)
+        assert inputs_provider.model_signal_inputs == model_signal_inputs
+
+        # a refresh of the endpoints invalidates the metadata
+        inputs_provider.get_endpoints(refresh=True)
+        inputs_provider.update_signal_inputs_from_endpoint(endpoint)
+        assert (get_tree.call_count, get_signal.call_count) == (8, 8)
+
+        # expired entries are requested again
+        inputs_provider.metadata.ttl = pd.Timedelta(0)
+        time.sleep(0.01)
+        inputs_provider.update_signal_inputs_from_endpoint(endpoint)
+        assert (get_tree.call_count, get_signal.call_count) == (12, 12)
+
+
+INVESTIGATION_SIGNALS = {
+    'Relative Humidity': '4E9416E8-9C75-426A-8E0A-4D07432CAC5D',
+    'Optimizer': '62E6F850-E523-408D-AD10-0C87E65F996B'
+}
+
+
+@pytest.mark.unit
+def test_endpoint_catalog(unit_test_config, tmp_path):
+    svc = backend.AmlOnlineEndpointService("tenant_id", "app_id", "app_secret", "subscription_id", "resource_group",
+                                           "workspace_name")
+    catalog = backend.EndpointCatalog(svc, ttl='1 hour')
+    assert catalog.path.parent.name == 'catalog'
+    assert catalog.load() is None
+    assert catalog.is_stale()
+
+    with mock.patch.object(backend.AmlOnlineEndpointService, '_authorize', return_value="token"), \
+            mock.patch.object(svc._http, 'get', side_effect=test_common.mocked_aml_response) as get, \
+            mock.patch.object(svc._http, 'post', side_effect=test_common.mocked_aml_response):
+        oes = catalog.endpoints()
+        # the workspace discovery of the first listing is memoized, so a refresh only lists the endpoints
+        assert get.call_count == 4
+        listing_calls = 2
+        assert len(oes) == 5
+        assert not catalog.is_stale()
+        assert catalog.path.stat().st_mode & 0o777 == 0o600
+
+        # only the endpoints are listed. The details are resolved once for the selected endpoint
+        assert all(x.primaryKey is None for x in oes)
+        selected = [x for x in oes if x.name == 'seeq-simple-demo-3'][0]
+        assert catalog.resolve(selected) is selected
+        assert selected.primaryKey == 'p-key'
+        assert selected.deployment[0].model.version == 6
+        calls = get.call_count
+        catalog.resolve(selected)
+        assert get.call_count == calls
+
+        # a new session renders from the catalog without calling Azure ML, with the resolved details
+        other = backend.EndpointCatalog(svc, ttl='1 hour')
+        cached = other.endpoints()
+        assert [x.name for x in cached] == [x.name for x in oes]
+        cached_selected = [x for x in cached if x.name == 'seeq-simple-demo-3'][0]
+        assert other.resolve(cached_selected).deployment[0].model.version == 6
+        assert len(cached_selected.deployment) == 1
+        assert get.call_count == calls
+
+        other.updated_at -= pd.Timedelta(hours=2)
+        assert other.is_stale()
+        refreshed = list()
+        other.refresh_in_background(lambda x, e: refreshed.append((x, e))).join()
+        # the unchanged resolved endpoint keeps its details. Only its deployments are listed again
+        assert get.call_count == calls + listing_calls + 1
+        assert len(refreshed[0][0]) == 5 and refreshed[0][1] is None
+        assert not other.is_stale()
+        kept = [x for x in refreshed[0][0] if x.name == 'seeq-simple-demo-3'][0]
+        assert kept.primaryKey == 'p-key' and kept.deployment[0].model.version == 6
+        calls = get.call_count
+        other.resolve(kept)
+        assert get.call_count == calls
+
+        # a changed endpoint is resolved again, and a full refresh drops every detail
+        kept.lastModifiedAt = '2000-01-01T00:00:00Z'
+        oes = other.refresh()
+        assert [x for x in oes if x.name == 'seeq-simple-demo-3'][0].primaryKey is None
+        assert get.call_count == calls + listing_calls
+        other.resolve([x for x in oes if x.name == 'seeq-simple-demo-3'][0])
+        oes = other.refresh(incremental=False)
+        assert all(x.primaryKey is None for x in oes)
+        assert backend.EndpointCatalog(svc).load()[0].primaryKey is None
+
+        # removed endpoints are dropped
+        with mock.patch.object(backend.OnlineEndpoint, 'deserialize_managed_endpoint_response', return_value=[]):
+            assert [x.name for x in other.refresh()] == ['regressor-v6-svc']
+
+    # every workspace has its own catalog
+    svc2 = backend.AmlOnlineEndpointService("tenant_id", "app_id", "app_secret", "subscription_id", "resource_group",
+                                            "workspace_name_2")
+    assert backend.EndpointCatalog(svc2).path != catalog.path
+    assert backend.EndpointCatalog(svc2).ttl == backend._endpoint_catalog.DEFAULT_TTL
+
+    denied = AzureMLException(code=401, reason='Unauthorized', message='Denied')
+    with mock.patch.object(backend.AmlOnlineEndpointService, '_authorize', return_value="token"), \
+            mock.patch.object(svc._http, 'get', side_effect=denied):
+        errors = list()
+        catalog.refresh_in_background(lambda x, e: errors.append((x, e))).join()
+    assert errors[0][0] is None and isinstance(errors[0][1], AzureMLException)
+    assert len(catalog.load()) == 1
+
+
+def _unit_investigation(**kwargs):
+    args = dict(input_signals=INVESTIGATION_SIGNALS,
+                result_name='result_signal',
+                az_model_name='regressor',
+                az_model_version='6',
+                start=pd.Timestamp('2021-12-06 14:00:00', tz='UTC'),
+                end=pd.Timestamp('2021-12-06 16:00:00', tz='UTC'),
+                grid='2min',
+                endpoint_uri='https://<MODEL_NAME>.canadacentral.inference.ml.azure.com/score',
+                aml_primary_key='<PRIMARY_KEY>',
+                quiet=True)
+    args.update(kwargs)
+    return backend.RunInvestigation(**args)
+
+
+@pytest.mark.unit
+def test_scoring_windows(unit_test_config):
+    investigation = _unit_investigation(window_rows=25, lookback='10min')
+    windows = investigation.scoring_windows()
+    assert len(windows) == 3
+    assert windows[0].start == pd.Timestamp('2021-12-06 14:00:00', tz='UTC')
+    assert windows[0].pull_start == pd.Timestamp('2021-12-06 13:50:00', tz='UTC')
+    assert windows[1].start == windows[0].end
+    assert windows[-1].end == pd.Timestamp('2021-12-06 16:00:00', tz='UTC')
+    assert [w.last for w in windows] == [False, False, True]
+
+    assert len(_unit_investigation().scoring_windows()) == 1
+    assert len(_unit_investigation(window_bytes=2000).scoring_windows()) == 4
+
+
+@pytest.mark.unit
+@pytest.mark.parametrize("kwargs", [dict(), dict(window_rows=7), dict(window_rows=10, lookback='6min'),
+                                    dict(window_bytes=1000, lookback='4min'),
+                                    dict(window_rows=5, lookback='4min', max_concurrency=4)])
+def test_run_investigation_windows(unit_test_config, kwargs):
+    with mock.patch.object(backend._run_investigation.spy, 'pull', side_effect=test_common.mocked_spy_pull), \
+            mock.patch.object(backend._scoring_transport.requests.Session, 'post',
+                              side_effect=test_common.mocked_scoring_post) as post:
+        investigation = _unit_investigation(**kwargs)
+        investigation.run()
+
+    expected = test_common.mocked_spy_pull(pd.DataFrame({'ID': list(INVESTIGATION_SIGNALS.values())}),
+                                           start=investigation.start, end=investigation.end, grid='2min').sum(axis=1)
+    assert list(investigation.result_signal.columns) == ['Prediction']
+    assert investigation.result_signal.index.is_monotonic_increasing
+    assert len(investigation.result_signal) == 61
+    assert (investigation.result_signal['Prediction'].values == expected.values).all()
+    if kwargs:
+        assert post.call_count > 1
+
+
+@pytest.mark.unit
+def test_in_flight_limiter_shared_limit(unit_test_config):
+    uri = 'https://shared.canadacentral.inference.ml.azure.com/score'
+    limiter = backend._concurrency.in_flight_limiter(uri, 4)
+    assert limiter.limit == 4
+
+    # a sequential investigation on the same URI does not lower the limit of the concurrent ones
+    with mock.patch.object(backend._run_investigation.spy, 'pull', side_effect=test_common.mocked_spy_pull), \
+            mock.patch.object(backend._scoring_transport.requests.Session, 'post',
+                              side_effect=test_common.mocked_scoring_post):
+        _unit_investigation(endpoint_uri=uri, window_rows=20).run()
+    assert backend._concurrency.in_flight_limiter(uri, 1) is limiter
+    assert limiter.limit == 4
+    assert limiter.concurrency == 4
+    assert backend._concurrency.in_flight_limiter(uri, 6).limit == 6
+
+
+@pytest.mark.unit
+@pytest.mark.parametrize("max_concurrency", [1, 3])
+def test_run_investigation_window_failures(unit_test_config, max_concurrency):
+    def flaky_post(url, data=None, **kwargs):
+        if pd.read_json(io.StringIO(data.decode())).index[0] == pd.Timestamp('2021-12-06 14:20:00', tz='UTC'):
+            return test_common.MockScoringResponse(b'upstream request timeout', 503, 'Service Unavailable')
+        return test_common.mocked_scoring_post(url, data=data, **kwargs)
+
+    with mock.patch.object(backend._run_investigation.spy, 'pull', side_effect=test_common.mocked_spy_pull), \
+            mock.patch.object(backend._scoring_transport.requests.Session, 'post', side_effect=flaky_post), \
+            mock.patch.object(backend._run_investigation.time, 'sleep') as sleep:
+        investigation = _unit_investigation(window_rows=10, max_concurrency=max_concurrency, errors='catalog')
+        investigation.run()
+        assert len(investigation.window_status) == 6
+        assert list(investigation.window_status['Result'] == 'Success') == [True, False, True, True, True, True]
+        assert len(investigation.result_signal) == 51
+
+        investigation = _unit_investigation(window_rows=10, max_concurrency=max_concurrency)
+        with pytest.raises(AzureMLException):
+            investigation.run()
+        assert investigation.window_status['Result'][1] != 'Success'
+        assert investigation.window_status['Result'][0] == 'Success'
+        assert len(investigation.result_signal) >= 10
+        assert sleep.call_count == 2 * backend._scoring_transport.MAX_RETRIES
+
+
+@pytest.mark.unit
+def test_run_investigation_progress_and_cancel(unit_test_config):
+    events = list()
+    cancellation = backend.CancellationToken()
+
+    def on_progress(event):
+        events.append(event)
+        if event.stage == 'score' and event.kind == 'end' and event.window == 1:
+            cancellation.cancel()
+
+    with mock.patch.object(backend._run_investigation.spy, 'pull', side_effect=test_common.mocked_spy_pull), \
+            mock.patch.object(backend._scoring_transport.requests.Session, 'post',
+                              side_effect=test_common.mocked_scoring_post) as post, \
+            mock.patch.object(backend._run_investigation.spy, 'push', side_effect=test_common.mocked_spy_push) as push:
+        investigation = _unit_investigation(window_rows=10, on_progress=events.append)
+        investigation.run()
+        investigation.push_to_seeq()
+        assert [(x.stage, x.kind, x.window) for x in events[:5]] == [
+            ('run', 'start', None), ('pull', 'start', 0), ('pull', 'end', 0), ('score', 'start', 0),
+            ('score', 'end', 0)]
+        assert [(x.stage, x.kind) for x in events[-3:]] == [('run', 'end'), ('push', 'start'), ('push', 'end')]
+        assert all(x.windows == 6 for x in events)
+        assert [x.elapsed for x in events] == sorted(x.elapsed for x in events)
+        ends = [x for x in events if x.kind == 'end']
+        assert all(x.rows > 0 and x.bytes > 0 and x.duration >= 0 for x in ends)
+        assert sum(x.rows for x in ends if x.stage == 'score') == sum(investigation.window_status['Rows'])
+        assert ends[-1].rows == len(investigation.result_signal)
+
+        push.reset_mock()
+        events.clear()
+        investigation = _unit_investigation(window_rows=10, on_progress=on_progress, cancellation=cancellation)
+        with pytest.raises(utils.InvestigationCanceled):
+            investigation.run()
+        # the windows after the cancellation are neither pulled nor scored
+        assert post.call_count == 6 + 2
+        assert list(investigation.window_status['Result']) == ['Success'] * 2 + ['Canceled'] * 4
+        assert [x.stage for x in events if x.kind == 'end'] == ['pull', 'score'] * 2 + ['run']
+        with pytest.raises(utils.InvestigationCanceled):
+            investigation.push_to_seeq()
+        # nothing is pushed once the token is canceled
+        assert push.call_count == 0
+        assert events[-1].stage == 'run'
+
+
+@pytest.mark.unit
+def test_push_multiple_outputs(unit_test_config):
+    index = pd.date_range('2021-12-06 14:00:00', periods=5, freq='2min', tz='UTC')
+    with mock.patch.object(backend._run_investigation.spy, 'push', side_effect=test_common.mocked_spy_push) as push:
+        investigation = _unit_investigation()
+        investigation.result_signal = pd.DataFrame({'Prediction': range(5)}, index=index)
+        investigation.push_to_seeq()
+        s = '|'.join(['result_signal', 'regressor', '6'] + sorted(INVESTIGATION_SIGNALS.values()))
+        metadata = push.call_args_list[0][1]['metadata']
+        assert list(metadata['Original Name']) == [hashlib.sha1(s.encode()).hexdigest()]
+        assert list(metadata['Name']) == ['result_signal']
+        assert 'Model Output' not in metadata
+
+        push.reset_mock()
+        investigation = _unit_investigation(output_names={'Flow': 'Predicted Flow'})
+        investigation.result_signal = pd.DataFrame({'Flow': range(5), 'Pressure': range(5), 'Level': range(5)},
+                                                   index=index)
+        investigation.push_to_seeq()
+        # one scoring result, one push of the data and metadata of all the outputs
+        assert push.call_count == 1
+        data = push.call_args_list[0][0][0]
+        metadata = push.call_args_list[0][1]['metadata']
+        assert list(data.columns) == list(metadata['Original Name'])
+        assert len(set(data.columns)) == 3
+        assert list(metadata['Name']) == ['Predicted Flow', 'result_signal - Pressure', 'result_signal - Level']
+        assert list(metadata['Model Output']) == ['Flow', 'Pressure', 'Level']
+        assert list(investigation.result_signal.columns) == ['Flow', 'Pressure', 'Level']
+        assert list(investigation.result_outputs()['Original Name']) == list(data.columns)
+
+    with pytest.raises(TypeError):
+        _unit_investigation(output_names=['Flow'])
+
+
+@pytest.mark.unit
+def test_push_metadata_fingerprints(unit_test_config, tmp_path):
+    cache = backend.MetadataFingerprintCache(tmp_path.joinpath('pushed_signals.json'))
+    index = pd.date_range('2021-12-06 14:00:00', periods=5, freq='2min', tz='UTC')
+
+    def push(push_side_effect=test_common.mocked_spy_push, **kwargs):
+        investigation = _unit_investigation(metadata_cache=cache, **kwargs)
+        investigation.result_signal = pd.DataFrame({'Flow': range(5), 'Level': range(5)}, index=index)
+        with mock.patch.object(backend._run_investigation.spy, 'push', side_effect=push_side_effect) as spy_push, \
+                mock.patch.object(backend._run_investigation.spy, 'search', return_value=pd.DataFrame()):
+            investigation.push_to_seeq()
+        return investigation, spy_push
+
+    # the first push writes the data, the metadata and the worksheet at once
+    investigation, spy_push = push()
+    assert spy_push.call_count == 1
+    assert spy_push.call_args[1]['worksheet'] == backend._run_investigation.DEFAULT_WORKSHEET_NAME
+    ids = cache.get(investigation.watermark_key)['IDs']
+    assert list(ids) == list(spy_push.call_args[1]['metadata'].index)
+
+    # unchanged metadata: only the samples are pushed to the known signals
+    investigation, spy_push = push()
+    assert spy_push.call_count == 1
+    assert 'metadata' not in spy_push.call_args[1] and spy_push.call_args[1]['worksheet'] is None
+    assert list(spy_push.call_args[0][0].columns) == list(ids.values())
+    assert (investigation.pushed_df['Push Result'] == 'Success').all()
+
+    # interactive investigations always push the metadata and the worksheet, to the same signals
+    investigation, spy_push = push(skip_unchanged_metadata=False)
+    assert spy_push.call_args[1]['worksheet'] == backend._run_investigation.DEFAULT_WORKSHEET_NAME
+    assert list(spy_push.call_args[1]['metadata']['Data ID']) == list(ids)
+    assert cache.get(investigation.watermark_key)['IDs'] == ids
+
+    # changed metadata is pushed again, unless the run is data-only
+    investigation, spy_push = push(data_only=True, output_names={'Flow': 'Predicted Flow'})
+    assert 'metadata' not in spy_push.call_args[1]
+    investigation, spy_push = push(output_names={'Flow': 'Predicted Flow'})
+    assert list(spy_push.call_args[1]['metadata']['Name']) == ['Predicted Flow', 'result_signal - Level']
+    investigation, spy_push = push(output_names={'Flow': 'Predicted Flow'})
+    assert 'metadata' not in spy_push.call_args[1]
+
+    # a failure of Seeq is raised, and the metadata is not pushed again
+    def failed_push(data=None, metadata=None, **kwargs):
+        if metadata is None:
+            raise ApiException(status=503, reason='Service Unavailable')
+        return test_common.mocked_spy_push(data, metadata=metadata, **kwargs)
+
+    with pytest.raises(ApiException):
+        push(push_side_effect=failed_push, output_names={'Flow': 'Predicted Flow'})
+    assert cache.get(investigation.watermark_key)['IDs'] == ids
+
+    # the signals were deleted in Seeq: everything is pushed again
+    def deleted_signals(data=None, metadata=None, **kwargs):
+        if metadata is None:
+            try:
+                raise ApiException(status=404, reason='Not Found')
+            except ApiException as e:
+                raise RuntimeError('Item not found') from e
+        return test_common.mocked_spy_push(data, metadata=metadata, **kwargs)
+
+    investigation, spy_push = push(push_side_effect=deleted_signals, output_names={'Flow': 'Predicted Flow'})
+    assert spy_push.call_count == 2
+    assert 'metadata' in spy_push.call_args[1]
+    assert cache.get(investigation.watermark_key) is not None
+
+    cache.invalidate(investigation.watermark_key)
+    assert cache.get(investigation.watermark_key) is None
+    with pytest.raises(TypeError):
+        _unit_investigation(metadata_cache=str(cache.path))
+    with pytest.raises(TypeError):
+        _unit_investigation(skip_unchanged_metadata='no')
+
+
+@pytest.mark.unit
+def test_result_signal_identity(unit_test_config, tmp_path):
+    reversed_inputs = dict(reversed(list(INVESTIGATION_SIGNALS.items())))
+    index = pd.date_range('2021-12-06 14:00:00', periods=5, freq='2min', tz='UTC')
+
+    def investigation_of(**kwargs):
+        investigation = _unit_investigation(**kwargs)
+        investigation.result_signal = pd.DataFrame({'Prediction': range(5)}, index=index)
+        return investigation
+
+    # the identity does not depend on the order of the inputs, nor on the hash seed of the kernel
+    identity = investigation_of().result_outputs()['Original Name'][0]
+    assert investigation_of(input_signals=reversed_inputs).result_outputs()['Original Name'][0] == identity
+    assert identity == hashlib.sha1('|'.join(['result_signal', 'regressor', '6'] +
+                                             sorted(INVESTIGATION_SIGNALS.values())).encode()).hexdigest()
+    assert investigation_of(az_model_version='7').result_outputs()['Original Name'][0] != identity
+
+    # a signal pushed by an older version, with another data ID, is updated instead of duplicated
+    legacy_inputs = str(list(reversed_inputs.values()))
+    found = pd.DataFrame([
+        {'ID': 'A', 'Name': 'result_signal', 'Data ID': '[wb] {Signal} legacy-b', 'Model Name': 'regressor',
+         'Model Version': '6', 'Input Signals': legacy_inputs, 'Datasource Name': 'Azure ML'},
+        {'ID': 'B', 'Name': 'result_signal', 'Data ID': '[wb] {Signal} legacy-a', 'Model Name': 'regressor',
+         'Model Version': '6', 'Input Signals': legacy_inputs, 'Datasource Name': 'Azure ML'},
+        {'ID': 'C', 'Name': 'result_signal', 'Data ID': '[wb] {Signal} other', 'Model Name': 'regressor',
+         'Model Version': '5', 'Input Signals': legacy_inputs, 'Datasource Name': 'Azure ML'}])
+    cache = backend.MetadataFingerprintCache(tmp_path.joinpath('pushed_signals.json'))
+    with mock.patch.object(backend._run_investigation.spy, 'push', side_effect=test_common.mocked_spy_push) as push, \
+            mock.patch.object(backend._run_investigation.spy, 'search', return_value=found) as search:
+        investigation = investigation_of(metadata_cache=cache)
+        investigation.push_to_seeq()
+        assert list(push.call_args[1]['metadata']['Data ID']) == ['[wb] {Signal} legacy-a']
+        assert cache.get(investigation.watermark_key)['Data IDs'] == {identity: '[wb] {Signal} legacy-a'}
+
+        # later pushes use the data ID of the cache, from any kernel and input order
+        investigation = investigation_of(metadata_cache=cache, input_signals=reversed_inputs, worksheet='Other')
+        investigation.push_to_seeq()
+        assert list(push.call_args[1]['metadata']['Data ID']) == ['[wb] {Signal} legacy-a']
+        assert search.call_count == 1
+
+        # without a cache, every push looks the signal up
+        investigation_of().push_to_seeq()
+        assert list(push.call_args[1]['metadata']['Data ID']) == ['[wb] {Signal} legacy-a']
+        assert search.call_count == 2
+
+    # without a previous signal, the identity is the data ID
+    cache = backend.MetadataFingerprintCache(tmp_path.joinpath('other.json'))
+    with mock.patch.object(backend._run_investigation.spy, 'push', side_effect=test_common.mocked_spy_push) as push, \
+            mock.patch.object(backend._run_investigation.spy, 'search', side_effect=RuntimeError('Unavailable')):
+        investigation_of(metadata_cache=cache).push_to_seeq()
+        assert list(push.call_args[1]['metadata']['Data ID']) == [identity]
+
+
+@pytest.mark.unit
+def test_payload_encoders(unit_test_config):
+    data = test_common.mocked_spy_pull(pd.DataFrame({'ID': list(INVESTIGATION_SIGNALS.values())}),
+                                       start=pd.Timestamp('2021-12-06 14:00:00', tz='UTC'),
+                                       end=pd.Timestamp('2021-12-06 14:10:00', tz='UTC'), grid='2min')
+    stamps = [int(x.timestamp() * 1000) for x in data.index]
+
+    body, headers = backend.get_payload_encoder().encode(data)
+    assert headers['Content-Type'] == 'application/json'
+    assert body == data.to_json(date_format='iso').encode()
+
+    body, headers = backend.get_payload_encoder('split').encode(data)
+    payload = json.loads(body)
+    assert payload['index'] == stamps
+    assert payload['data'] == data.values.tolist()
+
+    body, headers = backend.get_payload_encoder('grid+gzip').encode(data)
+    assert headers['Content-Encoding'] == 'gzip'
+    payload = json.loads(gzip.decompress(body))
+    assert payload['start'] == stamps[0]
+    assert payload['period'] == 120000
+    assert payload['data'] == data.values.tolist()
+    assert 'index' in json.loads(backend.get_payload_encoder('grid').encode(data.drop(data.index[2]))[0])
+
+    body, headers = backend.get_payload_encoder('npy').encode(data)
+    array = np.load(io.BytesIO(body))
+    assert json.loads(headers['X-Seeq-Columns']) == list(INVESTIGATION_SIGNALS.values())
+    assert array[:, 0].tolist() == stamps
+    assert (array[:, 1:] == data.values).all()
+
+    with pytest.raises(ValueError):
+        backend.get_payload_encoder('xml')
+    with pytest.raises(TypeError):
+        backend.PayloadEncoder()
+
+    # only the optional string arguments accept None
+    assert _unit_investigation(payload_format=None, worksheet=None)._encoder.name == 'iso'
+    for prop in ['result_name', 'az_model_name', 'az_model_version', 'endpoint_uri', 'aml_primary_key']:
+        with pytest.raises(TypeError):
+            _unit_investigation(**{prop: None})
+
+
+@pytest.mark.unit
+def test_payload_encoder_arrow(unit_test_config):
+    pa = pytest.importorskip('pyarrow')
+    data = pd.DataFrame({'x': [1.0, 2.0]}, index=pd.date_range('2021-12-06', periods=2, freq='2min', tz='UTC'))
+    body, headers = backend.get_payload_encoder('arrow').encode(data)
+    table = pa.ipc.open_stream(body).read_all()
+    assert table.column_names == ['timestamp', 'x']
+
+
+@pytest.mark.unit
+def test_decode_response(unit_test_config):
+    index = pd.date_range('2021-12-06 20:14', periods=3, freq='2min', tz='UTC')
+    expected = pd.DataFrame({'Prediction': [10.5, 9.25, 10.75]}, index=index)
+    stamps = [int(x.timestamp() * 1000) for x in index]
+    iso = expected.to_json(date_format='iso')
+
+    def chunked(body, size=7):
+        return (body[i:i + size] for i in range(0, len(body), size))
+
+    bodies = [
+        (json.dumps(iso).encode(), None),
+        (iso.encode(), 'application/json'),
+        (expected.to_json(orient='split', date_format='epoch', date_unit='ms').encode(), None),
+        (json.dumps({'columns': ['Prediction'], 'start': stamps[0], 'period': 120000,
+                     'data': [[10.5], [9.25], [10.75]]}).encode(), None),
+        ('\n'.join(json.dumps({'index': t, 'Prediction': v}) for t, v in zip(stamps, [10.5, 9.25, 10.75])).encode(),
+         'application/x-ndjson'),
+        ('\n'.join(x.to_json(date_format='iso') for _, x in expected.groupby(level=0)).encode(), None),
+        (b'\n  ' + json.dumps(json.loads(iso), indent=2).encode() + b'\n', None)
+    ]
+    for body, content_type in bodies:
+        for size in [1, 7, len(body)]:
+            result = backend.decode_response(chunked(body, size), content_type)
+            pd.testing.assert_frame_equal(result, expected, check_freq=False, check_index_type=False)
+
+    result = backend.decode_response([json.dumps({'Class': dict(zip(stamps, [1, 2, 1]))}).encode()])
+    assert result['Class'].dtype == np.int64
+    for body, content_type in [(b'[{"Prediction": 10.5}]', None), (b'10.5', None),
+                               (b'{"index": 1638821640000, "Prediction": 1}\n[1]', 'application/x-ndjson')]:
+        with pytest.raises(AzureMLException, match='must be a JSON object'):
+            backend.decode_response(chunked(body), content_type)
+
+
+@pytest.mark.unit
+def test_scoring_session(unit_test_config):
+    session = backend._scoring_transport.scoring_session(verify=True)
+    assert session is backend._scoring_transport.scoring_session(verify=True)
+    assert session.verify is True
+    unverified = backend._scoring_transport.scoring_session(verify=False)
+    assert unverified is not session
+    assert unverified.verify is False
+    assert session.get_adapter('https://x.inference.ml.azure.com/score')._pool_maxsize == \
+           backend._scoring_transport.POOL_MAXSIZE
+
+    investigation = _unit_investigation(self_signed_certificate=True)
+    with mock.patch.object(backend._run_investigation.spy, 'pull', side_effect=test_common.mocked_spy_pull), \
+            mock.patch.object(backend._scoring_transport.requests.Session, 'post',
+                              side_effect=test_common.mocked_scoring_post) as post:
+        investigation.run()
+    assert post.call_args[1]['stream'] is True
+    assert investigation._verify is False
+    assert _unit_investigation(self_signed_certificate=False)._verify is True
+
+    # the InsecureRequestWarning of the unverified session is shown once, instead of for every request
+    with warnings.catch_warnings(record=True) as caught:
+        warnings.simplefilter('always')
+        backend._scoring_transport.scoring_session(verify=False)
+        for _ in range(3):
+            warnings.warn("Unverified HTTPS request is being made to host 'once.inference.ml.azure.com'",
+                          urllib3.exceptions.InsecureRequestWarning)
+    assert len(caught) == 1
+
+
+@pytest.mark.unit
+def test_scoring_retries(unit_test_config):
+    assert backend._scoring_transport.retry_after_seconds({'Retry-After': '7'}) == 7
+    assert backend._scoring_transport.retry_after_seconds({'retry-after-ms': '1500', 'Retry-After': '7'}) == 1.5
+    assert backend._scoring_transport.retry_after_seconds({'Retry-After': 'Wed, 21 Oct 2015 07:28:00 GMT'}) == 0
+    assert backend._scoring_transport.retry_after_seconds({}) is None
+    assert 0 <= backend._scoring_transport.backoff_delay(3) <= 8
+
+    responses = [test_common.MockScoringResponse(b'Too many requests', 429, 'Too Many Requests'),
+                 test_common.MockScoringResponse(b'Service Unavailable', 503, 'Service Unavailable')]
+    for response in responses:
+        response.headers['Retry-After'] = '2'
+
+    def throttled_post(url, data=None, **kwargs):
+        if responses:
+            return responses.pop(0)
+        return test_common.mocked_scoring_post(url, data=data, **kwargs)
+
+    investigation = _unit_investigation(endpoint_uri='https://throttled.canadacentral.inference.ml.azure.com/score',
+                                        max_concurrency=8)
+    limiter = backend._concurrency.in_flight_limiter(investigation.endpoint_uri, 8)
+    with mock.patch.object(backend._run_investigation.spy, 'pull', side_effect=test_common.mocked_spy_pull), \
+            mock.patch.object(backend._scoring_transport.requests.Session, 'post', side_effect=throttled_post), \
+            mock.patch.object(backend._run_investigation.time, 'sleep') as sleep:
+        investigation.run()
+    assert len(investigation.result_signal) == 61
+    assert [x[0][0] for x in sleep.call_args_list] == [2, 2]
+    assert limiter.concurrency < 8
+
+    for _ in range(100):
+        limiter.on_success()
+    assert limiter.concurrency == 8
+
+    investigation = _unit_investigation(max_retries=1)
+    with mock.patch.object(backend._run_investigation.spy, 'pull', side_effect=test_common.mocked_spy_pull), \
+            mock.patch.object(backend._scoring_transport.requests.Session, 'post',
+                              return_value=test_common.MockScoringResponse(b'Bad request', 400, 'Bad Request')) as post:
+        with pytest.raises(AzureMLException):
+            investigation.run()
+    assert post.call_count == 1
+
+    # the wait before a retry ends as soon as the investigation is canceled
+    throttled = test_common.MockScoringResponse(b'Too many requests', 429, 'Too Many Requests')
+    throttled.headers['Retry-After'] = '300'
+    cancellation = backend.CancellationToken()
+    investigation = _unit_investigation(endpoint_uri='https://canceled.canadacentral.inference.ml.azure.com/score',
+                                        cancellation=cancellation)
+    threading.Timer(0.2, cancellation.cancel).start()
+    started = time.monotonic()
+    with mock.patch.object(backend._run_investigation.spy, 'pull', side_effect=test_common.mocked_spy_pull), \
+            mock.patch.object(backend._scoring_transport.requests.Session, 'post', return_value=throttled):
+        with pytest.raises(utils.InvestigationCanceled):
+            investigation.run()
+    assert time.monotonic() - started < 30
+    assert list(investigation.window_status['Result']) == ['Canceled']
+    assert not backend.CancellationToken().wait(0.01)
+
+
+@pytest.mark.unit
+def test_watermark_store(unit_test_config, tmp_path):
+    store = backend.WatermarkStore(tmp_path.joinpath('watermarks.json'))
+    assert store.get('key') is None
+    assert store.update('key', pd.Timestamp('2021-12-06 16:00:00')) == pd.Timestamp('2021-12-06 16:00:00', tz='UTC')
+    later = store.update('key', pd.Timestamp('2021-12-06 15:00:00', tz='UTC'))
+    assert later == pd.Timestamp('2021-12-06 16:00', tz='UTC')
+    assert backend.WatermarkStore(store.path).get('key') == pd.Timestamp('2021-12-06 16:00:00', tz='UTC')
+    with FileLock(store.path), FileLock(store.path):
+        store.reset('key')
+    assert store.get('key') is None
+    assert read_json(tmp_path.joinpath('missing.json'), default={}) == {}
+
+
+@pytest.mark.unit
+def test_run_investigation_incremental(unit_test_config, tmp_path):
+    store = backend.WatermarkStore(tmp_path.joinpath('watermarks.json'))
+
+    def run_and_push(**kwargs):
+        investigation = _unit_investigation(watermarks=store, **kwargs)
+        with mock.patch.object(backend._run_investigation.spy, 'pull', side_effect=test_common.mocked_spy_pull), \
+                mock.patch.object(backend._scoring_transport.requests.Session, 'post',
+                                  side_effect=test_common.mocked_scoring_post), \
+                mock.patch.object(backend._run_investigation.spy, 'push',
+                                  side_effect=test_common.mocked_spy_push) as push:
+            investigation.run()
+            investigation.push_to_seeq()
+        return investigation, push
+
+    investigation, push = run_and_push()
+    assert investigation.watermark is None
+    assert len(investigation.result_signal) == 61
+    assert store.get(investigation.watermark_key) == pd.Timestamp('2021-12-06 16:00:00', tz='UTC')
+    assert push.call_count == 1
+
+    # a late run scores from the watermark, without a gap or an overlap
+    investigation, push = run_and_push(start=pd.Timestamp('2021-12-06 16:20:00', tz='UTC'),
+                                       end=pd.Timestamp('2021-12-06 16:30:00', tz='UTC'), lookback='10min')
+    assert investigation.window_status['Start'][0] == pd.Timestamp('2021-12-06 16:00:00', tz='UTC')
+    assert investigation.result_signal.index[0] == pd.Timestamp('2021-12-06 16:02:00', tz='UTC')
+    assert len(investigation.result_signal) == 15
+    assert store.get(investigation.watermark_key) == pd.Timestamp('2021-12-06 16:30:00', tz='UTC')
+
+    # nothing new to score
+    investigation, push = run_and_push(end=pd.Timestamp('2021-12-06 16:30:00', tz='UTC'))
+    assert investigation.result_signal.empty
+    assert push.call_count == 0
+
+    assert _unit_investigation(az_model_version='7').watermark_key != investigation.watermark_key
+    with pytest.raises(TypeError):
+        _unit_investigation(watermarks=str(store.path))
+
+
+@pytest.mark.unit
+def test_input_data_cache(unit_test_config, tmp_path):
+    cache = backend.InputDataCache(tmp_path)
+    t = pd.Timestamp('2021-12-06 14:00:00', tz='UTC')
+
+    def run(**kwargs):
+        investigation = _unit_investigation(input_cache=cache, **kwargs)
+        with mock.patch.object(backend._scoring_transport.requests.Session, 'post',
+                               side_effect=test_common.mocked_scoring_post), \
+                mock.patch.object(backend._run_investigation.spy, 'pull',
+                                  side_effect=test_common.mocked_spy_pull) as pull:
+            investigation.run()
+        return investigation, [(x[1]['start'], x[1]['end']) for x in pull.call_args_list]
+
+    investigation, pulls = run()
+    assert pulls == [(t, t + pd.Timedelta('2h'))]
+    assert len(investigation.result_signal) == 61
+    assert list(investigation.data.columns) == list(INVESTIGATION_SIGNALS.keys())
+
+    # only the new end of the range is pulled
+    investigation, pulls = run(result_name='another', end=t + pd.Timedelta('2h30min'), window_rows=20)
+    assert pulls == [(t + pd.Timedelta('2h'), t + pd.Timedelta('2h30min'))]
+    assert len(investigation.result_signal) == 76
+    assert cache.intervals(INVESTIGATION_SIGNALS.values(), '2min') == [(t, t + pd.Timedelta('2h30min'))]
+
+    # each pulled interval is a chunk of its own, and the chunks are never written again
+    key = backend._input_cache._entry_key(INVESTIGATION_SIGNALS.values(), '2min')
+    chunks = {x: x.stat().st_ino for x in tmp_path.glob(f'{key}{backend._input_cache.CHUNK_SEPARATOR}*.pkl')}
+    assert len(chunks) == 2
+
+    # the disk cache is shared by new instances. A different grid is a different entry
+    cache = backend.InputDataCache(tmp_path)
+    investigation, pulls = run(start=t + pd.Timedelta('30min'))
+    assert pulls == []
+    assert len(investigation.result_signal) == 46
+    assert {x: x.stat().st_ino for x in chunks} == chunks
+
+    # a window only reads the chunks it overlaps, and an evicted chunk is pulled again
+    cache = backend.InputDataCache(tmp_path)
+    with mock.patch.object(cache._store, 'get', wraps=cache._store.get) as get:
+        data = cache.pull(list(INVESTIGATION_SIGNALS.values()), t + pd.Timedelta('2h10min'),
+                          t + pd.Timedelta('2h20min'), '2min', lambda *x: pytest.fail('Pulled a cached interval'))
+    assert len(data) == 6
+    assert [x[0][0] for x in get.call_args_list] == [key, backend._input_cache._chunk_key(
+        key, t + pd.Timedelta('2h'), t + pd.Timedelta('2h30min'))]
+    tmp_path.joinpath(f"{backend._input_cache._chunk_key(key, t, t + pd.Timedelta('2h'))}.pkl").unlink()
+    investigation, pulls = run(end=t + pd.Timedelta('2h30min'))
+    assert pulls == [(t, t + pd.Timedelta('2h'))]
+    assert cache.intervals(INVESTIGATION_SIGNALS.values(), '2min') == [(t, t + pd.Timedelta('2h30min'))]
+    investigation, pulls = run(grid='4min')
+    assert len(pulls) == 1
+
+    cache.invalidate([list(INVESTIGATION_SIGNALS.values())[0]])
+    assert cache.intervals(INVESTIGATION_SIGNALS.values(), '2min') == []
+    assert list(tmp_path.glob('*.pkl')) == []
+
+    # recent data is pulled again, and the budgets evict the frames
+    cache = backend.InputDataCache(tmp_path, memory_budget=0, disk_budget=0)
+    now = pd.Timestamp.now(tz='UTC')
+    frame = cache.pull(['a'], now - pd.Timedelta('1h'), now, '1min',
+                       lambda s, e: pd.DataFrame({'a': 1.0}, index=pd.date_range(s.ceil('1min'), e, freq='1min')))
+    assert len(frame) == 60
+    assert cache.intervals(['a'], '1min') == []
+    missing = backend._input_cache._subtract([(t, t + pd.Timedelta('1h'))], t - pd.Timedelta('1h'),
+                                             t + pd.Timedelta('2h'))
+    assert missing == [(t - pd.Timedelta('1h'), t), (t + pd.Timedelta('1h'), t + pd.Timedelta('2h'))]
+
+
+@pytest.mark.unit
+def test_prediction_cache(unit_test_config, tmp_path):
+    cache = backend.PredictionCache(tmp_path)
+
+    def run(**kwargs):
+        investigation = _unit_investigation(prediction_cache=cache, **kwargs)
+        with mock.patch.object(backend._run_investigation.spy, 'pull', side_effect=test_common.mocked_spy_pull), \
+                mock.patch.object(backend._scoring_transport.requests.Session, 'post',
+                                  side_effect=test_common.mocked_scoring_post) as post:
+            investigation.run()
+        return investigation, post.call_count
+
+    investigation, posts = run(window_rows=20)
+    assert posts == 3
+    expected = investigation.result_signal
+
+    # re-pushing under another name scores nothing, and the cached predictions are not modified by the caller
+    investigation, posts = run(window_rows=20, result_name='another')
+    assert posts == 0
+    investigation.result_signal.columns = ['renamed']
+    investigation, posts = run(window_rows=20)
+    assert posts == 0
+    pd.testing.assert_frame_equal(investigation.result_signal, expected)
+
+    # the model version, the payload format and the input data are part of the key
+    assert run(window_rows=20, az_model_version='7')[1] == 3
+    assert run(window_rows=20, payload_format='iso')[1] == 0
+    data = pd.DataFrame({'Optimizer': [1.0, 2.0]}, index=pd.date_range('2021-12-06', periods=2, freq='2min'))
+    key = backend.PredictionCache.key('regressor', '6', data)
+    assert key != backend.PredictionCache.key('regressor', '6', data * 2)
+    assert key != backend.PredictionCache.key('regressor', '6', data, 'split')
+    assert run(window_rows=20, end=pd.Timestamp('2021-12-06 16:10:00', tz='UTC'))[1] == 1
+
+    # a new instance reads the cache from disk
+    cache = backend.PredictionCache(tmp_path)
+    assert run(window_rows=20)[1] == 0
+    cache.invalidate('regressor', '6')
+    assert run(window_rows=20)[1] == 3
+    assert run(window_rows=20, az_model_version='7')[1] == 0
+    cache.invalidate('regressor')
+    assert run(window_rows=20, az_model_version='7')[1] == 3
+
+    # a budget of 0 keeps nothing
+    cache = backend.PredictionCache(tmp_path.joinpath('empty'), memory_budget=0, disk_budget=0)
+    assert run()[1] == 1
+    assert run()[1] == 1
+    cache.clear()
+
+
+@pytest.mark.unit
+def test_backfill(unit_test_config, tmp_path):
+    job_parameters = {'Schedule': 'every 15 minutes', 'Input Signals': INVESTIGATION_SIGNALS,
+                      'Result Name': 'result_signal', 'AZ model name': 'regressor', 'AZ model version': 6,
+                      'Grid': '2min', 'Endpoint': 'https://<MODEL_NAME>.canadacentral.inference.ml.azure.com/score',
+                      'aml_primary_key': '<PRIMARY_KEY>', 'Payload Format': None}
+    kwargs = backend.investigation_kwargs_from_job_parameters(job_parameters)
+    assert kwargs['az_model_version'] == '6'
+    assert 'payload_format' not in kwargs and 'Schedule' not in kwargs
+
+    backfill = backend.Backfill(kwargs, start=pd.Timestamp('2021-12-06 14:00:00', tz='UTC'),
+                                end=pd.Timestamp('2021-12-06 16:00:00', tz='UTC'), partition='30min', max_workers=1,
+                                ledger=tmp_path.joinpath('ledger.json'))
+    assert len(backfill.partitions()) == 4
+    assert isinstance(backfill.investigation_kwargs['metadata_cache'], backend.MetadataFingerprintCache)
+
+    calls = list()
+
+    def failing_post(url, data=None, **kw):
+        calls.append(url)
+        if len(calls) == 3:
+            return test_common.MockScoringResponse(b'Bad request', 400, 'Bad Request')
+        return test_common.mocked_scoring_post(url, data=data, **kw)
+
+    with mock.patch.object(backend._run_investigation.spy, 'pull', side_effect=test_common.mocked_spy_pull), \
+            mock.patch.object(backend._scoring_transport.requests.Session, 'post', side_effect=failing_post), \
+            mock.patch.object(backend._run_investigation.spy, 'push', side_effect=test_common.mocked_spy_push) as push:
+        status = backfill.run()
+        assert list(status['Result'][[0, 1, 3]]) == ['Success'] * 3
+        assert 'Azure request failed' in status['Result'][2]
+        assert push.call_count == 3
+        assert len(backfill.completed()) == 3
+
+        # the interrupted backfill resumes with the failed partition only
+        backfill = backend.Backfill(kwargs, start='2021-12-06 14:00:00Z', end='2021-12-06 16:00:00Z',
+                                    partition='30min', max_workers=3, ledger=backfill.ledger)
+        status = backfill.run()
+    assert list(status['Result']) == ['Completed', 'Completed', 'Success', 'Completed']
+    assert len(calls) == 5
+    assert status['Rows'].sum() == 61
+
+    with pytest.raises(ValueError):
+        backend.Backfill(dict(kwargs, start='2021-12-06'), start='2021-12-06', end='2021-12-07')
+
 
 @pytest.mark.system
 def test_run_investigation(system_test_config, system_test_setup):
@@ -206,39 +1261,37 @@ def test_run_investigation(system_test_config, system_test_setup):
             "Path": "Example >> Cooling Tower 1 >> Area A"
             })['ID'][0]
 
-    backend._run_investigation.urllib.request.urlopen = mock.Mock(
-        spec=backend._run_investigation.urllib.request.urlopen)
-    response = backend._run_investigation.urllib.request.urlopen()
-    response.read.return_value = b'"{\\"Predicted_Compressor_Power\\":{\\"2021-12-06T20:14:00.000Z\\":10.2795732894,' \
-                                 b'\\"2021-12-06T20:16:00.000Z\\":9.9859015583,' \
-                                 b'\\"2021-12-06T20:18:00.000Z\\":10.6125521012,' \
-                                 b'\\"2021-12-06T20:20:00.000Z\\":10.054556658,' \
-                                 b'\\"2021-12-06T20:22:00.000Z\\":11.406334309,' \
-                                 b'\\"2021-12-06T20:24:00.000Z\\":11.4476420238,' \
-                                 b'\\"2021-12-06T20:26:00.000Z\\":10.8616664569,' \
-                                 b'\\"2021-12-06T20:28:00.000Z\\":10.5899078439,' \
-                                 b'\\"2021-12-06T20:30:00.000Z\\":11.0406563365,' \
-                                 b'\\"2021-12-06T20:32:00.000Z\\":9.5797677494,' \
-                                 b'\\"2021-12-06T20:34:00.000Z\\":8.5796331215,' \
-                                 b'\\"2021-12-06T20:36:00.000Z\\":10.8224287375,' \
-                                 b'\\"2021-12-06T20:38:00.000Z\\":12.7681512296,' \
-                                 b'\\"2021-12-06T20:40:00.000Z\\":11.7027756377,' \
-                                 b'\\"2021-12-06T20:42:00.000Z\\":10.8839378666,' \
-                                 b'\\"2021-12-06T20:44:00.000Z\\":11.8359484297,' \
-                                 b'\\"2021-12-06T20:46:00.000Z\\":14.8992703312,' \
-                                 b'\\"2021-12-06T20:48:00.000Z\\":13.4492002505,' \
-                                 b'\\"2021-12-06T20:50:00.000Z\\":14.5131224303,' \
-                                 b'\\"2021-12-06T20:52:00.000Z\\":10.6856899759,' \
-                                 b'\\"2021-12-06T20:54:00.000Z\\":10.0665961322,' \
-                                 b'\\"2021-12-06T20:56:00.000Z\\":8.2384170083,' \
-                                 b'\\"2021-12-06T20:58:00.000Z\\":9.6797227084,' \
-                                 b'\\"2021-12-06T21:00:00.000Z\\":11.8286076236,' \
-                                 b'\\"2021-12-06T21:02:00.000Z\\":11.3403269874,' \
-                                 b'\\"2021-12-06T21:04:00.000Z\\":12.0153475087,' \
-                                 b'\\"2021-12-06T21:06:00.000Z\\":12.519534538,' \
-                                 b'\\"2021-12-06T21:08:00.000Z\\":12.3288283771,' \
-                                 b'\\"2021-12-06T21:10:00.000Z\\":12.7558601744,' \
-                                 b'\\"2021-12-06T21:12:00.000Z\\":11.8204852874}}"'
+    response = test_common.MockScoringResponse(b'"{\\"Predicted_Compressor_Power\\":{'
+                                               b'\\"2021-12-06T20:14:00.000Z\\":10.2795732894,'
+                                               b'\\"2021-12-06T20:16:00.000Z\\":9.9859015583,'
+                                               b'\\"2021-12-06T20:18:00.000Z\\":10.6125521012,'
+                                               b'\\"2021-12-06T20:20:00.000Z\\":10.054556658,'
+                                               b'\\"2021-12-06T20:22:00.000Z\\":11.406334309,'
+                                               b'\\"2021-12-06T20:24:00.000Z\\":11.4476420238,'
+                                               b'\\"2021-12-06T20:26:00.000Z\\":10.8616664569,'
+                                               b'\\"2021-12-06T20:28:00.000Z\\":10.5899078439,'
+                                               b'\\"2021-12-06T20:30:00.000Z\\":11.0406563365,'
+                                               b'\\"2021-12-06T20:32:00.000Z\\":9.5797677494,'
+                                               b'\\"2021-12-06T20:34:00.000Z\\":8.5796331215,'
+                                               b'\\"2021-12-06T20:36:00.000Z\\":10.8224287375,'
+                                               b'\\"2021-12-06T20:38:00.000Z\\":12.7681512296,'
+                                               b'\\"2021-12-06T20:40:00.000Z\\":11.7027756377,'
+                                               b'\\"2021-12-06T20:42:00.000Z\\":10.8839378666,'
+                                               b'\\"2021-12-06T20:44:00.000Z\\":11.8359484297,'
+                                               b'\\"2021-12-06T20:46:00.000Z\\":14.8992703312,'
+                                               b'\\"2021-12-06T20:48:00.000Z\\":13.4492002505,'
+                                               b'\\"2021-12-06T20:50:00.000Z\\":14.5131224303,'
+                                               b'\\"2021-12-06T20:52:00.000Z\\":10.6856899759,'
+                                               b'\\"2021-12-06T20:54:00.000Z\\":10.0665961322,'
+                                               b'\\"2021-12-06T20:56:00.000Z\\":8.2384170083,'
+                                               b'\\"2021-12-06T20:58:00.000Z\\":9.6797227084,'
+                                               b'\\"2021-12-06T21:00:00.000Z\\":11.8286076236,'
+                                               b'\\"2021-12-06T21:02:00.000Z\\":11.3403269874,'
+                                               b'\\"2021-12-06T21:04:00.000Z\\":12.0153475087,'
+                                               b'\\"2021-12-06T21:06:00.000Z\\":12.519534538,'
+                                               b'\\"2021-12-06T21:08:00.000Z\\":12.3288283771,'
+                                               b'\\"2021-12-06T21:10:00.000Z\\":12.7558601744,'
+                                               b'\\"2021-12-06T21:12:00.000Z\\":11.8204852874}}"')
     investigation = backend.RunInvestigation(input_signals={
         'Relative Humidity': relative_humidity_id,
         'Optimizer': optimizer_id,
@@ -256,7 +1309,8 @@ def test_run_investigation(system_test_config, system_test_setup):
         endpoint_uri='https://<MODEL_NAME>.canadacentral.inference.ml.azure.com/score',
         aml_primary_key='<PRIMARY_KEY>',
         quiet=True)
-    investigation.run()
+    with mock.patch.object(backend._scoring_transport.requests.Session, 'post', return_value=response):
+        investigation.run()
     assert isinstance(investigation.result_signal, pd.DataFrame)
     investigation.push_to_seeq()
     assert isinstance(investigation.pushed_df, pd.DataFrame)
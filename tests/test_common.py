@@ -1,4 +1,7 @@
+import io
 import json
+import uuid
+import pandas as pd
 from pathlib import Path
 from functools import partial
 
@@ -46,14 +49,28 @@ def create_worksheet_for_tests():
 
 
 class MockResponse:
-    def __init__(self, json_data, status_code):
+    def __init__(self, json_data, status_code, headers=None):
         self.json_data = json_data
         self.status_code = status_code
+        self.reason = None
+        self.headers = dict() if headers is None else headers
 
     def json(self):
         return self.json_data
 
 
+class MockScoringResponse(io.BytesIO):
+    def __init__(self, body: bytes, status_code=200, reason='OK', content_type='application/json'):
+        super().__init__(body)
+        self.status_code = status_code
+        self.reason = reason
+        self.text = body.decode()
+        self.headers = {'Content-Type': content_type}
+
+    def iter_content(self, chunk_size=1):
+        return iter(lambda: self.read(chunk_size), b'')
+
+
 def mock_200_response_from_file(data_dir: Path, file: str):
     with open(data_dir.joinpath(file)) as f:
         return MockResponse(json.load(f), 200)
@@ -124,3 +141,41 @@ def mocked_get_signal_api_response(id):
     for signal in signals['signals']:
         if signal['id'] == id:
             return seeq.sdk.models.signal_output_v1.SignalOutputV1(**signal)
+
+
+def mocked_spy_pull(items, start=None, end=None, grid=None, header=None, **kwargs):
+    """
+    This is a function to mock spy.pull. It returns a ramp for each requested
+    signal ID on the requested grid.
+    """
+    index = pd.date_range(pd.Timestamp(start).tz_convert('UTC').ceil(grid), pd.Timestamp(end).tz_convert('UTC'),
+                          freq=grid)
+    ramp = (index.asi8 // 10 ** 9 % 10 ** 6).astype(float)
+    return pd.DataFrame({idd: ramp + i for i, idd in enumerate(items['ID'])}, index=index)
+
+
+def mocked_scoring_post(url, data=None, headers=None, **kwargs):
+    """
+    This is a function to mock the Azure ML scoring endpoint. The prediction is
+    the sum of the input signals, returned with the double-encoded JSON format
+    of the Azure ML scoring scripts.
+    """
+    data = pd.read_json(io.StringIO(data.decode()))
+    prediction = pd.DataFrame({'Prediction': data.sum(axis=1)})
+    return MockScoringResponse(json.dumps(prediction.to_json(date_format='iso')).encode())
+
+
+def mocked_spy_push(data=None, metadata=None, **kwargs):
+    """
+    This is a function to mock spy.push. It returns the metadata of the pushed
+    signals with a successful 'Push Result' and an 'ID' derived from the
+    data ID of each signal. Data columns without metadata are pushed to the
+    signals with these IDs.
+    """
+    if metadata is None:
+        return pd.DataFrame([{'ID': c, 'Type': 'Signal', 'Push Result': 'Success'} for c in data.columns],
+                            index=data.columns)
+    result = metadata.copy()
+    result['ID'] = [str(uuid.uuid5(uuid.NAMESPACE_OID, str(x))).upper() for x in metadata['Data ID']]
+    result['Push Result'] = 'Success'
+    return result